@@ -9,13 +9,41 @@ It supports different programming languages and formats the review results.
 """
 
 import os
+import re
+import time
 import logging
 import requests
 import json
-from typing import Dict, Any, Optional
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Any, List, Optional
+
+from rate_limiter import RateLimiter, RETRYABLE_STATUS_CODES, backoff_delay
+from review_cache import ReviewCache, make_cache_key
+from code_chunker import CodeChunk, estimate_tokens, split_code
+from review_journal import ReviewJournal
 
 logger = logging.getLogger(__name__)
 
+# Maximum tokens the model may generate for one review
+MAX_TOKENS = 2000
+
+# Generation parameters sent with every review request
+MODEL_PARAMS = {
+    'max_tokens': MAX_TOKENS,
+    'temperature': 0.3,
+    'format': 'json'  # Request JSON response if supported
+}
+
+# Maximum number of files packed into one batched request
+BATCH_MAX_FILES = 8
+
+# Issues reported for a chunk start with "L<line>:", relative to the chunk
+CHUNK_LINE_PATTERN = re.compile(r'^L(\d+)(?:-(\d+))?\s*[:：]\s*')
+
+
 class AIReviewer:
     """Class to review code using an AI model API."""
     
@@ -27,23 +55,230 @@ class AIReviewer:
         # Add more languages as needed
     }
     
-    def __init__(self, api_url: str, api_key: str):
+    # Language names used in batched prompts
+    LANGUAGE_NAMES = {
+        'java': 'Java',
+        'c_cpp': 'C/C++',
+        'go': 'Go',
+    }
+    
+    def __init__(self, api_url: str, api_key: str, requests_per_minute: Optional[int] = None,
+                 tokens_per_minute: Optional[int] = None, cache: Optional[ReviewCache] = None,
+                 max_chunk_tokens: int = 6000, chunk_workers: int = 4, pool_size: int = 16,
+                 max_retries: int = 4, timeout: float = 60, stream: bool = False,
+                 batch_file_tokens: int = 0, batch_max_tokens: int = 4000,
+                 max_in_flight: Optional[int] = None):
         """
         Initialize the AI reviewer.
         
         Args:
             api_url: URL of the AI model API
             api_key: API key for authentication
+            requests_per_minute: Request quota of the model endpoint, None for unlimited
+            tokens_per_minute: Token quota (prompt + completion) of the model endpoint, None for unlimited
+            cache: Persistent cache of review results, None to always call the API
+            max_chunk_tokens: Files larger than this are split into chunks at function/class boundaries
+            chunk_workers: Maximum number of chunks of one file reviewed concurrently
+            pool_size: Maximum number of keep-alive connections to the API host
+            max_retries: Retries on timeouts, connection errors, 429 and 5xx responses
+            timeout: Timeout of one API request in seconds (between received bytes when streaming)
+            stream: Request a streamed (SSE) response and assemble it while it arrives
+            batch_file_tokens: Files up to this size are packed with other files of the same
+                language into one request, 0 to review every file separately
+            batch_max_tokens: Token budget of the code in one batched request
+            max_in_flight: Maximum API requests in flight across all review threads and chunks,
+                defaults to pool_size
         """
         self.api_url = api_url
         self.api_key = api_key
+        # Token buckets refilled continuously, allowing at most one minute of quota as a burst
+        self.request_limiter = RateLimiter(requests_per_minute and requests_per_minute / 60, requests_per_minute)
+        self.token_limiter = RateLimiter(tokens_per_minute and tokens_per_minute / 60, tokens_per_minute)
+        self.cache = cache
+        self.max_chunk_tokens = max_chunk_tokens
+        self.chunk_workers = max(1, chunk_workers)
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.stream = stream
+        self.batch_file_tokens = batch_file_tokens
+        self.batch_max_tokens = batch_max_tokens
+        # One pooled keep-alive session shared by all review threads
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        # Request slots shared by every caller, so chunk reviews cannot exceed the overall concurrency cap
+        self._request_slots = threading.BoundedSemaphore(max_in_flight or pool_size)
+        # Per-attempt timings: {'seconds': elapsed, 'status': HTTP status or error name}
+        self.request_metrics = []
+        self.retry_count = 0
+        self.cache_stats = {'hits': 0, 'misses': 0}
+        # Tokens sent and generated, from the API's usage report or estimated when it is missing
+        self.token_stats = {'prompt': 0, 'completion': 0}
+        self._stats_lock = threading.Lock()
+    
+    def review_files(self, file_paths: List[str], max_workers: int = 4,
+                     diffs: Optional[Dict[str, str]] = None, journal: Optional[ReviewJournal] = None,
+                     on_result: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Review several files concurrently.
+        
+        At most max_workers requests are in flight; the rate limiters keep them within the endpoint quota.
+        
+        Args:
+            file_paths: Paths to the code files
+            max_workers: Maximum number of concurrent review requests
+            diffs: Optional mapping of file path to its diff, see review_file
+            journal: Journal recording each result as soon as it completes; files already
+                reviewed successfully in the journal are not sent again
+            on_result: Callback invoked with (file_path, result) as each review completes
+            
+        Returns:
+            Dictionary mapping each file path to its review result, in the order of file_paths
+        """
+        diffs = diffs or {}
+        results = {}
+
+        if journal:
+            recorded = journal.load()
+            for file_path in file_paths:
+                if recorded.get(file_path, {}).get('status') == 'success':
+                    results[file_path] = recorded[file_path]
+                    if on_result:
+                        on_result(file_path, results[file_path])
+            if results:
+                logger.info(f"Resumed {len(results)} reviewed files from journal {journal.path}")
+
+        batcher = SmallFileBatcher(self, diffs)
+        tasks = [task for file_path in file_paths if file_path not in results for task in batcher.add(file_path)]
+        tasks += batcher.flush()
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            futures = [executor.submit(self.review_task, task, diffs) for task in tasks]
+            for future in as_completed(futures):
+                for file_path, result in future.result().items():
+                    results[file_path] = result
+                    if journal:
+                        journal.append(result)
+                    if on_result:
+                        on_result(file_path, result)
+
+        return {file_path: results[file_path] for file_path in file_paths}
     
-    def review_file(self, file_path: str) -> Dict[str, Any]:
+    def review_task(self, file_paths: List[str], diffs: Optional[Dict[str, str]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Review one task produced by SmallFileBatcher: a single file or a batch of small files.
+        
+        Args:
+            file_paths: Paths to the code files of the task
+            diffs: Optional mapping of file path to its diff, see review_file
+            
+        Returns:
+            Dictionary mapping each file path to its review result
+        """
+        if len(file_paths) > 1:
+            return self.review_batch(file_paths)
+        file_path = file_paths[0]
+        logger.info(f"Reviewing file: {file_path}")
+        return {file_path: self.review_file(file_path, diff=(diffs or {}).get(file_path))}
+    
+    def review_batch(self, file_paths: List[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Review several small files of the same language in one request.
+        
+        The model answers with one entry per file; files missing from the answer, or all files
+        if the batched request fails, are reviewed one by one instead.
+        
+        Args:
+            file_paths: Paths to the code files, all of the same language
+            
+        Returns:
+            Dictionary mapping each file path to its review result
+        """
+        language = self._get_file_language(file_paths[0])
+        results = {}
+        pending = []  # (file path, code, cache key)
+
+        for file_path in file_paths:
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    code = f.read()
+            except Exception:
+                continue  # review_file below reports the error
+            cache_key, cached_result = self._lookup_cache(file_path, code, self._build_prompt(language))
+            if cached_result:
+                results[file_path] = cached_result
+            else:
+                pending.append((file_path, code, cache_key))
+
+        if len(pending) > 1:
+            logger.info(f"Reviewing {len(pending)} small {language} files in one request")
+            language_name = self.LANGUAGE_NAMES.get(language, language)
+            prompt = (f"请对以下{len(pending)}个{language_name}文件分别进行代码审查，找出潜在的问题，并提供改进建议和改进后的代码示例。"
+                      f"文件之间以 '// ===== 文件 <编号>: <文件名> =====' 分隔。"
+                      f"请只返回JSON，格式为 {{\"files\": [{{\"file_id\": <编号>, \"issues\": [...], "
+                      f"\"suggestions\": [...], \"improved_code\": \"...\"}}]}}，每个文件一项。")
+            code = '\n'.join(
+                f"// ===== 文件 {index}: {os.path.basename(file_path)} =====\n{file_code}"
+                for index, (file_path, file_code, _) in enumerate(pending, 1)
+            )
+            try:
+                raw_result = self._call_ai_api(prompt, code, language,
+                                               max_tokens=min(MAX_TOKENS * len(pending), 4 * MAX_TOKENS))
+                entries = self._parse_batch_result(raw_result)
+            except Exception as e:
+                logger.warning(f"Batched review failed, reviewing files one by one: {str(e)}")
+                entries = {}
+
+            for index, (file_path, _, cache_key) in enumerate(pending, 1):
+                entry = entries.get(index)
+                if entry is None:
+                    continue
+                results[file_path] = {
+                    'file_path': file_path,
+                    'status': 'success',
+                    'language': language,
+                    'issues': entry.get('issues', []),
+                    'suggestions': entry.get('suggestions', []),
+                    'improved_code': entry.get('improved_code', '')
+                }
+                # Cached under the single-file key, so later runs reuse it in either mode
+                if cache_key:
+                    self.cache.put(cache_key, results[file_path])
+
+        for file_path in file_paths:
+            if file_path not in results:
+                results[file_path] = self.review_file(file_path)
+
+        return results
+    
+    @staticmethod
+    def _parse_batch_result(raw_result: Dict[str, Any]) -> Dict[int, Dict[str, Any]]:
+        """
+        Split a batched review response into per-file entries.
+        
+        Args:
+            raw_result: Raw API response
+            
+        Returns:
+            Dictionary mapping 1-based file numbers to their review entries
+        """
+        content = raw_result.get('choices', [{}])[0].get('message', {}).get('content', '')
+        # Tolerate text or code fences around the JSON object
+        start, end = content.find('{'), content.rfind('}')
+        parsed = json.loads(content[start:end + 1])
+        return {
+            int(entry['file_id']): entry
+            for entry in parsed.get('files', [])
+            if isinstance(entry, dict) and str(entry.get('file_id', '')).isdigit()
+        }
+    
+    def review_file(self, file_path: str, diff: Optional[str] = None) -> Dict[str, Any]:
         """
         Review a code file using the AI model.
         
         Args:
             file_path: Path to the code file
+            diff: Unified diff of the file's changes; when given, the review focuses on the changed hunks
             
         Returns:
             Dictionary containing review results
@@ -67,13 +302,24 @@ class AIReviewer:
                 code_content = f.read()
             
             # Get language-specific prompt
-            prompt = self.LANGUAGE_PROMPTS.get(file_language, "请对以下代码进行代码审查，找出潜在的问题，并提供改进建议和改进后的代码示例：")
+            prompt = self._build_prompt(file_language, diff)
             
-            # Send code to AI model for review
-            review_result = self._call_ai_api(prompt, code_content, file_language)
+            # Reuse the stored review when the same content was reviewed with the same prompt and model
+            cache_key, cached_result = self._lookup_cache(file_path, code_content, prompt)
+            if cached_result:
+                return cached_result
             
-            # Process and structure the review results
-            processed_result = self._process_review_result(file_path, review_result, file_language)
+            if estimate_tokens(code_content) > self.max_chunk_tokens:
+                processed_result = self._review_chunks(file_path, prompt, code_content, file_language)
+            else:
+                # Send code to AI model for review
+                review_result = self._call_ai_api(prompt, code_content, file_language)
+                
+                # Process and structure the review results
+                processed_result = self._process_review_result(file_path, review_result, file_language)
+            
+            if cache_key and processed_result['status'] == 'success':
+                self.cache.put(cache_key, processed_result)
             
             return processed_result
             
@@ -88,7 +334,119 @@ class AIReviewer:
                 'improved_code': ''
             }
     
-    def _call_ai_api(self, prompt: str, code: str, language: str) -> Dict[str, Any]:
+    def _build_prompt(self, language: str, diff: Optional[str] = None) -> str:
+        """
+        Build the review prompt of a single file.
+        
+        Args:
+            language: Programming language of the code
+            diff: Unified diff of the file's changes, if the review is diff-scoped
+            
+        Returns:
+            Instruction prompt for the AI model
+        """
+        prompt = self.LANGUAGE_PROMPTS.get(language, "请对以下代码进行代码审查，找出潜在的问题，并提供改进建议和改进后的代码示例：")
+        if diff:
+            prompt = f"{prompt}\n\n本次只需审查以下diff中的变更部分，完整文件仅作为上下文参考：\n```diff\n{diff}\n```"
+        return prompt
+    
+    def _lookup_cache(self, file_path: str, code: str, prompt: str):
+        """
+        Look up the cached review of a file.
+        
+        Args:
+            file_path: Path to the code file
+            code: Code content of the file
+            prompt: Single-file review prompt
+            
+        Returns:
+            Tuple (cache key, cached result or None); the key is None when caching is disabled
+        """
+        if not self.cache:
+            return None, None
+        cache_key = make_cache_key(code, prompt, {'api_url': self.api_url, **MODEL_PARAMS})
+        cached_result = self.cache.get(cache_key)
+        self._count_cache('hits' if cached_result else 'misses')
+        if not cached_result:
+            return cache_key, None
+        logger.info(f"Using cached review for {file_path}")
+        return cache_key, {**cached_result, 'file_path': file_path}
+    
+    def _review_chunks(self, file_path: str, prompt: str, code: str, language: str) -> Dict[str, Any]:
+        """
+        Review a large file chunk by chunk and merge the results.
+        
+        Args:
+            file_path: Path to the code file
+            prompt: Instruction prompt for the whole file
+            code: Code content to review
+            language: Programming language of the code
+            
+        Returns:
+            Merged review results, with issue line numbers relative to the whole file
+        """
+        chunks = split_code(code, language, self.max_chunk_tokens)
+        logger.info(f"Reviewing {file_path} in {len(chunks)} chunks")
+
+        def review_chunk(chunk: CodeChunk) -> Dict[str, Any]:
+            chunk_prompt = (f"{prompt}\n\n以下代码是文件 {os.path.basename(file_path)} "
+                            f"第{chunk.start_line}-{chunk.end_line}行的片段。"
+                            f"每个问题请以 'L<行号>: ' 开头，行号从片段第一行计为1。")
+            raw_result = self._call_ai_api(chunk_prompt, chunk.text, language)
+            return self._process_review_result(file_path, raw_result, language)
+
+        with ThreadPoolExecutor(max_workers=self.chunk_workers) as executor:
+            chunk_results = list(executor.map(review_chunk, chunks))
+
+        failed = [chunk for chunk, result in zip(chunks, chunk_results) if result['status'] != 'success']
+        if failed:
+            raise RuntimeError(f"Review failed for {len(failed)} of {len(chunks)} chunks, "
+                               f"first at lines {failed[0].start_line}-{failed[0].end_line}")
+
+        issues, suggestions, improved_code = [], [], []
+        for chunk, result in zip(chunks, chunk_results):
+            issues.extend(self._offset_issue(issue, chunk) for issue in result['issues'])
+            suggestions.extend(result['suggestions'])
+            if result['improved_code']:
+                improved_code.append(f"// L{chunk.start_line}-{chunk.end_line}\n{result['improved_code']}")
+
+        return {
+            'file_path': file_path,
+            'status': 'success',
+            'language': language,
+            'issues': issues,
+            'suggestions': suggestions,
+            'improved_code': '\n\n'.join(improved_code)
+        }
+    
+    @staticmethod
+    def _offset_issue(issue: Any, chunk: CodeChunk) -> Any:
+        """
+        Map the line numbers of a chunk issue to line numbers of the whole file.
+        
+        Args:
+            issue: Issue as returned for the chunk, a string or a dict with a 'line' key
+            chunk: Chunk the issue belongs to
+            
+        Returns:
+            Issue referring to file line numbers
+        """
+        offset = chunk.start_line - 1
+        if isinstance(issue, dict):
+            if isinstance(issue.get('line'), int):
+                return {**issue, 'line': issue['line'] + offset}
+            return issue
+
+        issue = str(issue)
+        match = CHUNK_LINE_PATTERN.match(issue)
+        if not match:
+            return f"L{chunk.start_line}-{chunk.end_line}: {issue}"
+        lines = f"L{int(match.group(1)) + offset}"
+        if match.group(2):
+            lines += f"-{int(match.group(2)) + offset}"
+        return f"{lines}: {issue[match.end():]}"
+    
+    def _call_ai_api(self, prompt: str, code: str, language: str, max_tokens: int = MAX_TOKENS) -> Dict[str, Any]:
         """
         Call the AI model API to review code.
         
@@ -96,6 +454,7 @@ class AIReviewer:
             prompt: Instruction prompt for the AI model
             code: Code content to review
             language: Programming language of the code
+            max_tokens: Maximum tokens the model may generate
             
         Returns:
             Raw API response
@@ -110,26 +469,134 @@ class AIReviewer:
             # This is a generic example and should be adapted to your specific API
             payload = {
                 'prompt': f"{prompt}\n\n```{language}\n{code}\n```",
-                'max_tokens': 2000,
-                'temperature': 0.3,
-                'format': 'json'  # Request JSON response if supported
+                **MODEL_PARAMS,
+                'max_tokens': max_tokens
             }
+            if self.stream:
+                payload['stream'] = True
             
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json=payload,
-                timeout=60  # Adjust timeout as needed
-            )
-            
-            response.raise_for_status()  # Raise exception for HTTP errors
-            
-            return response.json()
+            for attempt in range(self.max_retries + 1):
+                with self._request_slots:
+                    # Wait for quota, counting the completion budget against the tokens-per-minute limit
+                    self.request_limiter.acquire()
+                    self.token_limiter.acquire(estimate_tokens(payload['prompt']) + max_tokens)
+                
+                    start = time.perf_counter()
+                    try:
+                        response = self.session.post(
+                            self.api_url,
+                            headers=headers,
+                            json=payload,
+                            timeout=self.timeout,
+                            stream=self.stream
+                        )
+                    except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
+                        self._record_request(time.perf_counter() - start, type(e).__name__)
+                        if attempt == self.max_retries:
+                            raise
+                        delay = backoff_delay(attempt)
+                        logger.warning(f"API request failed ({type(e).__name__}), retrying in {delay:.1f}s "
+                                       f"(attempt {attempt + 1}/{self.max_retries})")
+                    else:
+                        self._record_request(time.perf_counter() - start, response.status_code)
+                        if response.status_code not in RETRYABLE_STATUS_CODES or attempt == self.max_retries:
+                            # Always hand the connection back to the pool, a streamed response keeps it checked out
+                            try:
+                                response.raise_for_status()  # Raise exception for HTTP errors
+                                result = self._read_stream(response) if self.stream else response.json()
+                            finally:
+                                response.close()
+                            self._count_tokens(payload['prompt'], result)
+                            return result
+                        delay = backoff_delay(attempt, cap=120,
+                                              retry_after=self._parse_retry_after(response.headers.get('Retry-After')))
+                        # Release the pooled connection before backing off; a streamed body is never read
+                        response.close()
+                        logger.warning(f"API returned HTTP {response.status_code}, retrying in {delay:.1f}s "
+                                       f"(attempt {attempt + 1}/{self.max_retries})")
+                
+                with self._stats_lock:
+                    self.retry_count += 1
+                time.sleep(delay)
             
         except requests.exceptions.RequestException as e:
             logger.error(f"API request error: {str(e)}")
             raise
     
+    @staticmethod
+    def _read_stream(response: requests.Response) -> Dict[str, Any]:
+        """
+        Assemble a streamed (SSE) completion into the shape of a non-streamed response.
+        
+        Args:
+            response: Streaming HTTP response
+            
+        Returns:
+            Response dictionary with the full text in choices[0].message.content
+        """
+        parts = []
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data:'):
+                continue
+            data = line[len('data:'):].strip()
+            if data == '[DONE]':
+                break
+            choice = json.loads(data).get('choices', [{}])[0]
+            # Chat endpoints stream "delta.content", completion endpoints stream "text"
+            parts.append(choice.get('delta', {}).get('content') or choice.get('text') or '')
+        return {'choices': [{'message': {'content': ''.join(parts)}}]}
+    
+    @staticmethod
+    def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+        """
+        Parse a Retry-After header given either in seconds or as an HTTP date.
+        
+        Args:
+            value: Header value, or None if absent
+            
+        Returns:
+            Seconds to wait, or None if the header is absent or invalid
+        """
+        if not isinstance(value, str):
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            pass
+        try:
+            return (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return None
+    
+    def _record_request(self, seconds: float, status: Any):
+        """Record the timing of one API request attempt."""
+        logger.debug(f"API request finished in {seconds:.2f}s with status {status}")
+        with self._stats_lock:
+            self.request_metrics.append({'seconds': seconds, 'status': status})
+    
+    def _count_cache(self, key: str):
+        """Increment a cache counter from a review thread."""
+        with self._stats_lock:
+            self.cache_stats[key] += 1
+    
+    def _count_tokens(self, prompt: str, result: Dict[str, Any]):
+        """
+        Add the tokens of a successful request to token_stats.
+        
+        Args:
+            prompt: Prompt sent to the model, including the code
+            result: Raw API response
+        """
+        usage = result.get('usage') or {}
+        prompt_tokens = usage.get('prompt_tokens') or estimate_tokens(prompt)
+        completion_tokens = usage.get('completion_tokens')
+        if completion_tokens is None:
+            content = result.get('choices', [{}])[0].get('message', {}).get('content', '')
+            completion_tokens = estimate_tokens(content) if content else 0
+        with self._stats_lock:
+            self.token_stats['prompt'] += prompt_tokens
+            self.token_stats['completion'] += completion_tokens
+    
     def _process_review_result(self, file_path: str, raw_result: Dict[str, Any], language: str) -> Dict[str, Any]:
         """
         Process and structure the AI review results.
@@ -273,3 +740,61 @@ class AIReviewer:
             return 'go'
         
         return None
+
+
+class SmallFileBatcher:
+    """Incrementally groups small files of the same language into batched review tasks."""
+
+    def __init__(self, reviewer: AIReviewer, diffs: Optional[Dict[str, str]] = None):
+        """
+        Initialize the batcher.
+        
+        Args:
+            reviewer: Reviewer whose batch_file_tokens and batch_max_tokens settings are used
+            diffs: Mapping of file path to its diff; diff-scoped files are never batched
+        """
+        self.reviewer = reviewer
+        self.diffs = diffs if diffs is not None else {}
+        self._open_batches = {}  # language -> (file paths, tokens)
+        self._lock = threading.Lock()
+
+    def add(self, file_path: str) -> List[List[str]]:
+        """
+        Add a file, possibly completing a task.
+        
+        Args:
+            file_path: Path to the code file
+            
+        Returns:
+            Tasks ready for review_task: the file itself if it is not batchable, a full batch, or nothing
+        """
+        reviewer = self.reviewer
+        language = reviewer._get_file_language(file_path)
+        try:
+            tokens = os.path.getsize(file_path) // 3 + 1
+        except OSError:
+            tokens = None
+        if (not reviewer.batch_file_tokens or not language or self.diffs.get(file_path)
+                or tokens is None or tokens > reviewer.batch_file_tokens):
+            return [[file_path]]
+
+        ready = []
+        with self._lock:
+            batch, batch_tokens = self._open_batches.get(language, ([], 0))
+            if batch and (batch_tokens + tokens > reviewer.batch_max_tokens or len(batch) >= BATCH_MAX_FILES):
+                ready.append(batch)
+                batch, batch_tokens = [], 0
+            self._open_batches[language] = (batch + [file_path], batch_tokens + tokens)
+        return ready
+
+    def flush(self) -> List[List[str]]:
+        """
+        Complete all partially filled batches.
+        
+        Returns:
+            Remaining tasks for review_task
+        """
+        with self._lock:
+            tasks = [batch for batch, _ in self._open_batches.values()]
+            self._open_batches = {}
+        return tasks
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Code Chunker
+
+This module splits large source files into token-budgeted chunks at function/class
+boundaries, so each chunk can be reviewed separately and the issues mapped back to
+file line numbers.
+"""
+
+import re
+from collections import namedtuple
+from typing import List
+
+# A chunk of source code; start_line and end_line are 1-based and inclusive
+CodeChunk = namedtuple('CodeChunk', ['start_line', 'end_line', 'text'])
+
+# Brace depth at which top-level members end: Java methods live inside a class body,
+# C/C++ and Go functions at file scope
+BOUNDARY_DEPTH = {
+    'java': 1,
+    'c_cpp': 0,
+    'go': 0,
+}
+
+# String/char literals and line comments, which may contain unbalanced braces
+LITERAL_PATTERN = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|`[^`]*`|//.*')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Roughly estimate the number of tokens in a text.
+
+    Code averages about 4 characters per token while CJK text is close to one token per
+    character, so 3 characters per token is used as a conservative middle ground.
+
+    Args:
+        text: Text to estimate
+
+    Returns:
+        Estimated token count
+    """
+    return len(text) // 3 + 1
+
+
+def _boundary_lines(lines: List[str], language: str) -> List[int]:
+    """
+    Find the lines after which a top-level member (function, method, class) ends.
+
+    Args:
+        lines: Source lines
+        language: Language identifier
+
+    Returns:
+        Sorted 0-based indexes of boundary lines
+    """
+    boundary_depth = BOUNDARY_DEPTH.get(language, 0)
+    boundaries = []
+    depth = 0
+    in_block_comment = False
+
+    for index, line in enumerate(lines):
+        # Strip block comments, literals and line comments before counting braces
+        code = ''
+        rest = line
+        while rest:
+            if in_block_comment:
+                end = rest.find('*/')
+                if end < 0:
+                    rest = ''
+                else:
+                    in_block_comment = False
+                    rest = rest[end + 2:]
+            else:
+                start = rest.find('/*')
+                if start < 0:
+                    code += rest
+                    rest = ''
+                else:
+                    code += rest[:start]
+                    in_block_comment = True
+                    rest = rest[start + 2:]
+        code = LITERAL_PATTERN.sub('', code)
+
+        previous_depth = depth
+        depth = max(0, depth + code.count('{') - code.count('}'))
+        if previous_depth > boundary_depth and depth <= boundary_depth:
+            boundaries.append(index)
+
+    return boundaries
+
+
+def split_code(code: str, language: str, max_tokens: int) -> List[CodeChunk]:
+    """
+    Split source code into chunks of at most max_tokens at member boundaries.
+
+    Consecutive members are packed into one chunk while they fit; a single member larger
+    than the budget is split by lines.
+
+    Args:
+        code: Source code
+        language: Language identifier
+        max_tokens: Token budget of one chunk
+
+    Returns:
+        List of chunks covering the whole file in order
+    """
+    lines = code.splitlines(keepends=True)
+    if not lines:
+        return []
+
+    # Split the file into units ending at member boundaries
+    units = []
+    start = 0
+    for boundary in _boundary_lines(lines, language) + [len(lines) - 1]:
+        if boundary >= start:
+            units.append((start, boundary))
+            start = boundary + 1
+
+    # Break oversized units into line ranges that fit the budget
+    pieces = []
+    for unit_start, unit_end in units:
+        piece_start = unit_start
+        piece_tokens = 0
+        for index in range(unit_start, unit_end + 1):
+            line_tokens = estimate_tokens(lines[index])
+            if piece_tokens and piece_tokens + line_tokens > max_tokens:
+                pieces.append((piece_start, index - 1, piece_tokens))
+                piece_start, piece_tokens = index, 0
+            piece_tokens += line_tokens
+        pieces.append((piece_start, unit_end, piece_tokens))
+
+    # Pack consecutive pieces into chunks
+    chunks = []
+    chunk_start, chunk_end, chunk_tokens = pieces[0]
+    for piece_start, piece_end, piece_tokens in pieces[1:]:
+        if chunk_tokens + piece_tokens > max_tokens:
+            chunks.append(CodeChunk(chunk_start + 1, chunk_end + 1, ''.join(lines[chunk_start:chunk_end + 1])))
+            chunk_start, chunk_tokens = piece_start, 0
+        chunk_end = piece_end
+        chunk_tokens += piece_tokens
+    chunks.append(CodeChunk(chunk_start + 1, chunk_end + 1, ''.join(lines[chunk_start:chunk_end + 1])))
+
+    return chunks
@@ -19,6 +19,11 @@ from typing import List, Dict, Any
 
 from gitlab_downloader import GitLabDownloader
 from ai_reviewer import AIReviewer
+from review_cache import ReviewCache
+from review_journal import ReviewJournal
+from review_pipeline import ReviewPipeline
+from review_metrics import RunMetrics
+from review_scheduler import ReviewTarget, branch_priority, parse_target
 from report_generator import ReportGenerator
 from email_sender import EmailSender
 
@@ -41,10 +46,20 @@ def parse_arguments():
                         help='GitLab服务器URL')
     parser.add_argument('--gitlab-token', type=str, required=True,
                         help='GitLab私人访问令牌')
-    parser.add_argument('--project-ids', type=int, nargs='+', required=True,
-                        help='要审查的GitLab项目ID列表')
+    parser.add_argument('--project-ids', type=int, nargs='+', default=None,
+                        help='要审查的GitLab项目ID列表（未指定--targets时必填）')
     parser.add_argument('--branches', type=str, nargs='+', default=['master'],
                         help='要审查的分支列表（默认为master）')
+    parser.add_argument('--targets', type=str, nargs='+', default=None, metavar='PROJECT_ID:BRANCH[:PRIORITY]',
+                        help='要审查的项目分支，可包含同一项目的多个分支；PRIORITY越小越优先')
+    parser.add_argument('--priority-branches', type=str, nargs='+', default=['release/*', 'hotfix/*'],
+                        help='按顺序匹配的高优先级分支模式（默认为 release/* hotfix/*）')
+    parser.add_argument('--parallel-projects', type=int, default=2,
+                        help='同时下载的项目数（默认为2）')
+    parser.add_argument('--project-download-workers', type=int, default=None,
+                        help='每个项目的下载线程数（默认等于--download-workers）')
+    parser.add_argument('--project-review-workers', type=int, default=None,
+                        help='每个项目同时进行的AI审查请求数上限（默认不限制）')
     parser.add_argument('--ai-api-url', type=str, required=True,
                         help='AI模型API的URL')
     parser.add_argument('--ai-api-key', type=str, required=True,
@@ -63,8 +78,93 @@ def parse_arguments():
                         help='SMTP用户名')
     parser.add_argument('--smtp-password', type=str, required=True,
                         help='SMTP密码')
+    parser.add_argument('--download-workers', type=int, default=8,
+                        help='并发下载文件的线程数（默认为8）')
+    parser.add_argument('--gitlab-rps', type=float, default=None,
+                        help='对GitLab服务器每秒请求数的上限（默认不限流）')
+    parser.add_argument('--archive', action='store_true',
+                        help='以单个tar.gz归档下载整个分支，代替逐个文件的API请求')
+    parser.add_argument('--cache-dir', type=str, default=None,
+                        help='按blob SHA缓存文件内容的目录（默认为下载目录下的.cache）')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='禁用增量下载缓存，每次重新下载所有文件')
+    diff_scope = parser.add_mutually_exclusive_group()
+    diff_scope.add_argument('--since-commit', type=str, default=None,
+                            help='只审查该提交之后到分支最新提交之间变更的文件')
+    diff_scope.add_argument('--merge-request', type=int, default=None,
+                            help='只审查该合并请求（IID）变更的文件，通常与单个项目ID一起使用')
+    parser.add_argument('--review-workers', type=int, default=4,
+                        help='同时进行的AI审查请求数（默认为4）')
+    parser.add_argument('--ai-rpm', type=int, default=None,
+                        help='AI接口每分钟请求数配额（默认不限流）')
+    parser.add_argument('--ai-tpm', type=int, default=None,
+                        help='AI接口每分钟token数配额（默认不限流）')
+    parser.add_argument('--ai-pool-size', type=int, default=16,
+                        help='到AI接口的keep-alive连接池大小（默认为16）')
+    parser.add_argument('--ai-retries', type=int, default=4,
+                        help='AI请求超时、429或5xx时的最大重试次数（默认为4）')
+    parser.add_argument('--ai-timeout', type=float, default=60,
+                        help='单次AI请求的超时秒数（默认为60）')
+    parser.add_argument('--queue-size', type=int, default=100,
+                        help='下载、审查、报告各阶段之间队列的容量（默认为100）')
+    parser.add_argument('--stream', action='store_true',
+                        help='以流式（SSE）方式接收AI审查结果')
+    parser.add_argument('--resume', action='store_true',
+                        help='从审查日志恢复被中断的运行，已审查成功的文件不再重新审查')
+    parser.add_argument('--batch-small-files', type=int, default=0, metavar='TOKENS',
+                        help='将不超过该token数的同语言小文件合并到一个请求中审查（默认为0，不合并）')
+    parser.add_argument('--batch-max-tokens', type=int, default=4000,
+                        help='合并请求中代码的token上限（默认为4000）')
+    parser.add_argument('--max-chunk-tokens', type=int, default=6000,
+                        help='超过该token数的文件按函数/类边界拆分后分块审查（默认为6000）')
+    parser.add_argument('--review-cache', type=str, default=None,
+                        help='审查结果缓存的SQLite文件（默认为输出目录下的review_cache.sqlite3）')
+    parser.add_argument('--no-review-cache', action='store_true',
+                        help='禁用审查结果缓存，所有文件都重新发送给AI模型')
+    parser.add_argument('--review-cache-ttl-days', type=float, default=30,
+                        help='审查结果缓存的有效天数（默认为30）')
+    parser.add_argument('--review-cache-max-entries', type=int, default=100000,
+                        help='审查结果缓存的最大条目数（默认为100000）')
+    parser.add_argument('--metrics-json', type=str, default=None,
+                        help='运行指标（各阶段耗时、下载量、AI延迟分位数、token数、重试和缓存命中率）的JSON文件'
+                             '（默认为输出目录下的review_metrics.json）')
+    parser.add_argument('--prometheus-textfile', type=str, default=None,
+                        help='以Prometheus文本格式写出运行指标的文件，供node_exporter的textfile收集器读取（默认不写出）')
 
-    return parser.parse_args()
+    args = parser.parse_args()
+    if not args.project_ids and not args.targets:
+        parser.error('必须指定 --project-ids 或 --targets')
+    return args
+
+def write_run_metrics(args, metrics, downloader, reviewer, error=None):
+    """
+    写出运行指标，便于定位耗时所在的阶段并跟踪性能回退
+
+    失败或中断的运行同样写出，写出时的错误只记录日志，不掩盖运行本身的异常。
+
+    Args:
+        args: 命令行参数
+        metrics: 本次运行的RunMetrics
+        downloader: 本次运行的GitLabDownloader，尚未创建时为None
+        reviewer: 本次运行的AIReviewer，尚未创建时为None
+        error: 导致运行失败的异常，运行成功时为None
+    """
+    try:
+        summary = metrics.summary(downloader, reviewer, error=error)
+        metrics.write_json(args.metrics_json or os.path.join(args.output_dir, 'review_metrics.json'), summary)
+        if args.prometheus_textfile:
+            metrics.write_prometheus(args.prometheus_textfile, summary)
+    except Exception as e:
+        logger.error(f"写出运行指标时出错: {str(e)}")
+        return
+
+    message = f"运行指标：{'失败' if error else '成功'}，耗时 {summary['duration_seconds']:.1f} 秒"
+    if 'download' in summary:
+        message += f"，下载 {summary['download']['bytes']} 字节"
+    if 'ai' in summary:
+        message += (f"，AI请求 {summary['ai']['requests']} 次（重试 {summary['ai']['retries']} 次），"
+                    f"token 输入 {summary['ai']['tokens_prompt']} / 输出 {summary['ai']['tokens_completion']}")
+    logger.info(message)
 
 def main():
     """协调代码审查过程的主函数。"""
@@ -75,48 +175,91 @@ def main():
 
     # 如果提供了多个项目，将项目ID映射到分支
     project_branch_map = {}
-    if len(args.project_ids) == len(args.branches):
+    if args.project_ids and len(args.project_ids) == len(args.branches):
         project_branch_map = dict(zip(args.project_ids, args.branches))
-    else:
+    elif args.project_ids:
         # 如果分支数量与项目数量不匹配，
         # 则为所有项目使用第一个分支
         project_branch_map = {pid: args.branches[0] for pid in args.project_ids}
 
+    # 审查目标按分支优先级排序，--targets 可以额外指定同一项目的多个分支
+    targets = [
+        ReviewTarget(project_id, branch, branch_priority(branch, args.priority_branches))
+        for project_id, branch in project_branch_map.items()
+    ]
+    targets += [parse_target(spec, args.priority_branches) for spec in args.targets or []]
+
+    metrics = RunMetrics()
+    downloader = reviewer = review_cache = None
+    run_error = None
+
     try:
-        # 步骤1：从GitLab下载文件
-        logger.info("开始从GitLab下载文件")
+        # 步骤1-3：下载、AI审查和报告生成以流水线方式并行进行，
+        # 文件下载完成后立即审查，审查完成后立即生成报告
+        logger.info("开始下载、审查并生成报告")
         downloader = GitLabDownloader(
             gitlab_url=args.gitlab_url,
             private_token=args.gitlab_token,
-            output_dir=os.path.join(args.output_dir, 'downloaded_code')
+            output_dir=os.path.join(args.output_dir, 'downloaded_code'),
+            max_workers=args.download_workers,
+            requests_per_second=args.gitlab_rps,
+            cache_dir=args.cache_dir,
+            use_cache=not args.no_cache
         )
 
-        downloaded_files = downloader.download_repositories(project_branch_map)
-        logger.info(f"从GitLab下载了 {len(downloaded_files)} 个文件")
+        review_cache = None
+        if not args.no_review_cache:
+            review_cache = ReviewCache(
+                args.review_cache or os.path.join(args.output_dir, 'review_cache.sqlite3'),
+                ttl_seconds=args.review_cache_ttl_days * 86400,
+                max_entries=args.review_cache_max_entries
+            )
 
-        # 步骤2：使用AI审查代码
-        logger.info("开始AI代码审查")
         reviewer = AIReviewer(
             api_url=args.ai_api_url,
-            api_key=args.ai_api_key
+            api_key=args.ai_api_key,
+            requests_per_minute=args.ai_rpm,
+            tokens_per_minute=args.ai_tpm,
+            cache=review_cache,
+            max_chunk_tokens=args.max_chunk_tokens,
+            pool_size=args.ai_pool_size,
+            max_retries=args.ai_retries,
+            timeout=args.ai_timeout,
+            stream=args.stream,
+            batch_file_tokens=args.batch_small_files,
+            batch_max_tokens=args.batch_max_tokens,
+            max_in_flight=args.review_workers
         )
 
-        review_results = {}
-        for file_path in downloaded_files:
-            try:
-                logger.info(f"审查文件: {file_path}")
-                review_result = reviewer.review_file(file_path)
-                review_results[file_path] = review_result
-            except Exception as e:
-                logger.error(f"审查文件 {file_path} 时出错: {str(e)}")
-
-        # 步骤3：生成Markdown报告
-        logger.info("生成Markdown报告")
         report_generator = ReportGenerator(
             output_dir=os.path.join(args.output_dir, 'reports')
         )
 
-        report_files = report_generator.generate_reports(review_results)
+        # 每个审查结果完成后立即写入审查日志；单个文件的错误已由review_file记录在结果中
+        with ReviewJournal(os.path.join(args.output_dir, 'review_journal.jsonl'), resume=args.resume) as journal:
+            pipeline = ReviewPipeline(
+                downloader,
+                reviewer,
+                report_generator,
+                review_workers=args.review_workers,
+                queue_size=args.queue_size,
+                journal=journal,
+                parallel_projects=args.parallel_projects,
+                project_download_workers=args.project_download_workers,
+                project_review_workers=args.project_review_workers,
+                metrics=metrics
+            )
+            downloaded_files, file_reports = pipeline.run(
+                targets,
+                use_archive=args.archive,
+                since_commit=args.since_commit,
+                merge_request_iid=args.merge_request
+            )
+        logger.info(f"从GitLab下载了 {len(downloaded_files)} 个文件")
+
+        # 文件下载完成的顺序不固定，按路径排序后合并报告
+        logger.info("合并Markdown报告")
+        report_files = [report for file_path in sorted(file_reports) for report in file_reports[file_path]]
         consolidated_report = report_generator.consolidate_reports(report_files)
 
         # 步骤4：发送合并后的报告邮件
@@ -138,8 +281,19 @@ def main():
         logger.info("代码审查过程成功完成")
 
     except Exception as e:
+        run_error = e
         logger.error(f"代码审查过程中出错: {str(e)}")
         raise
+    except BaseException as e:
+        # 例如 Ctrl+C 中断，同样记录在运行指标中
+        run_error = e
+        raise
+    finally:
+        if review_cache:
+            logger.info(f"审查缓存命中 {reviewer.cache_stats['hits']} 个文件，"
+                        f"未命中 {reviewer.cache_stats['misses']} 个文件")
+            review_cache.close()
+        write_run_metrics(args, metrics, downloader, reviewer, run_error)
 
 if __name__ == "__main__":
     main()
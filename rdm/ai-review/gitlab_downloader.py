@@ -8,14 +8,52 @@ GitLab下载器
 它支持从多个项目和分支下载文件。
 """
 
+import io
 import os
+import json
+import time
+import shutil
+import tarfile
 import logging
+import tempfile
+import threading
+from urllib.parse import quote
 import gitlab
-from typing import Dict, List, Set, Tuple
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Set, Tuple
 from pathlib import Path
 
+from rate_limiter import RateLimiter, RETRYABLE_STATUS_CODES, backoff_delay
+
 logger = logging.getLogger(__name__)
 
+# 流式下载代码库归档时每次读取的字节数
+ARCHIVE_CHUNK_SIZE = 1024 * 1024
+
+
+class _ChunkStream(io.RawIOBase):
+    """将字节块迭代器包装为只读文件对象，供tarfile流式解压。"""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        while not self._buffer:
+            try:
+                self._buffer = next(self._chunks)
+            except StopIteration:
+                return 0
+        size = min(len(b), len(self._buffer))
+        b[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
 class GitLabDownloader:
     """用于从GitLab代码库下载文件的类。"""
 
@@ -27,7 +65,9 @@ class GitLabDownloader:
         # 根据需要添加更多语言
     }
 
-    def __init__(self, gitlab_url: str, private_token: str, output_dir: str):
+    def __init__(self, gitlab_url: str, private_token: str, output_dir: str,
+                 max_workers: int = 8, requests_per_second: Optional[float] = None,
+                 max_retries: int = 5, cache_dir: Optional[str] = None, use_cache: bool = True):
         """
         初始化GitLab下载器。
 
@@ -35,10 +75,34 @@ class GitLabDownloader:
             gitlab_url: GitLab服务器的URL
             private_token: GitLab API的私人访问令牌
             output_dir: 保存下载文件的目录
+            max_workers: 同时向GitLab服务器发出的请求数上限，也是单个项目默认的下载线程数
+            requests_per_second: 对GitLab服务器每秒请求数的上限，为None时不限流
+            max_retries: 遇到429/5xx或网络错误时的最大重试次数
+            cache_dir: 按blob SHA存储文件内容的缓存目录，默认为output_dir下的.cache
+            use_cache: 是否启用增量下载缓存
         """
         self.gitlab_url = gitlab_url
         self.private_token = private_token
         self.output_dir = output_dir
+        self.max_workers = max(1, max_workers)
+        self.max_retries = max_retries
+        # 下载器只访问一台GitLab服务器，因此每个实例一个限流器即为按主机限流
+        self.rate_limiter = RateLimiter(requests_per_second)
+        # 内容寻址缓存：blobs/<sha前两位>/<sha> 保存文件内容，manifests/ 保存每个项目分支的 路径->sha 清单
+        self.cache_dir = (cache_dir or os.path.join(output_dir, '.cache')) if use_cache else None
+        self.cache_stats = {'hits': 0, 'misses': 0}
+        # 每个文件的下载指标：本地路径 -> {'seconds': 耗时, 'bytes': 大小, 'cached': 是否来自缓存}
+        self.file_metrics = {}
+        self.retry_count = 0
+        self._stats_lock = threading.Lock()
+        # 差异审查模式下，本地文件路径 -> 该文件的变更diff
+        self.file_diffs = {}
+        # 差异审查模式下GitLab没有返回diff（被折叠或过大）、只能审查完整文件的本地文件路径
+        self.empty_diff_files = []
+        # 为True时每个分支下载到项目目录下的独立子目录，用于同一项目的多个分支同时审查
+        self.branch_subdirs = False
+        # 所有项目共享的请求名额，限制对GitLab服务器的总并发数
+        self._request_slots = threading.BoundedSemaphore(self.max_workers)
         self.gl = None
 
         # Create output directory if it doesn't exist
@@ -55,40 +119,67 @@ class GitLabDownloader:
                 private_token=self.private_token,
                 ssl_verify=False  # Note: In production, consider proper SSL verification
             )
+            # 所有下载线程共享同一个keep-alive会话，连接池大小与并发数一致
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers)
+            self.gl.session.mount('http://', adapter)
+            self.gl.session.mount('https://', adapter)
             self.gl.auth()
             logger.info(f"Successfully authenticated with GitLab server at {self.gitlab_url}")
         except Exception as e:
             logger.error(f"Failed to initialize GitLab client: {str(e)}")
             raise
 
-    def download_repositories(self, project_branch_map: Dict[int, str]) -> List[str]:
+    def download_repositories(self, project_branch_map: Dict[int, str], use_archive: bool = False,
+                              since_commit: Optional[str] = None,
+                              merge_request_iid: Optional[int] = None,
+                              on_file: Optional[Callable[[str], None]] = None,
+                              max_workers: Optional[int] = None) -> List[str]:
         """
         Download files from multiple GitLab repositories.
 
         Args:
             project_branch_map: Dictionary mapping project IDs to branch names
+            use_archive: Fetch each branch as a single tar.gz archive instead of per-file API calls
+            since_commit: Only download files changed between this commit and the branch head
+            merge_request_iid: Only download files changed by this merge request
+            on_file: Callback invoked with each local path as soon as the file is saved,
+                possibly from several download threads at once
+            max_workers: Download threads per project, defaults to the downloader's max_workers
 
         Returns:
             List of paths to downloaded files
         """
         downloaded_files = []
+        if since_commit or merge_request_iid:
+            download = lambda project_id, branch: self.download_changed_files(
+                project_id, branch, since_commit=since_commit, merge_request_iid=merge_request_iid,
+                on_file=on_file, max_workers=max_workers)
+        elif use_archive:
+            download = lambda project_id, branch: self.download_project_archive(project_id, branch, on_file=on_file)
+        else:
+            download = lambda project_id, branch: self.download_project_files(
+                project_id, branch, on_file=on_file, max_workers=max_workers)
 
         for project_id, branch in project_branch_map.items():
             try:
-                project_files = self.download_project_files(project_id, branch)
+                project_files = download(project_id, branch)
                 downloaded_files.extend(project_files)
             except Exception as e:
                 logger.error(f"Error downloading files from project {project_id}, branch {branch}: {str(e)}")
 
         return downloaded_files
 
-    def download_project_files(self, project_id: int, branch: str) -> List[str]:
+    def download_project_files(self, project_id: int, branch: str,
+                               on_file: Optional[Callable[[str], None]] = None,
+                               max_workers: Optional[int] = None) -> List[str]:
         """
         Download files from a specific GitLab project and branch.
 
         Args:
             project_id: GitLab project ID
             branch: Branch name
+            on_file: Callback invoked with each local path as soon as the file is saved
+            max_workers: Download threads for this project, defaults to the downloader's max_workers
 
         Returns:
             List of paths to downloaded files
@@ -101,7 +192,7 @@ class GitLabDownloader:
             logger.info(f"Accessing project: {project.name} (ID: {project_id})")
 
             # Create project directory
-            project_dir = os.path.join(self.output_dir, f"{project_id}_{project.name}")
+            project_dir = self._project_dir(project_id, project.name, branch)
             os.makedirs(project_dir, exist_ok=True)
 
             # Get repository tree (recursive)
@@ -114,40 +205,388 @@ class GitLabDownloader:
                 if item['type'] == 'blob' and any(item['path'].endswith(ext) for ext in supported_extensions)
             ]
 
-            # Download each file
-            for item in file_items:
-                try:
-                    file_path = item['path']
+            previous_manifest = self._load_manifest(project_id, branch)
+            hits_before = self.cache_stats['hits']
+
+            # Download files concurrently, keeping the tree order in the result
+            with ThreadPoolExecutor(max_workers=max_workers or self.max_workers) as executor:
+                local_paths = list(executor.map(
+                    lambda item: self._notify(on_file, self._download_file(
+                        project, project_dir, item['path'], branch, item.get('id'))),
+                    file_items
+                ))
+                downloaded_files = [path for path in local_paths if path]
+
+            if self.cache_dir:
+                manifest = {
+                    item['path']: item['id']
+                    for item, path in zip(file_items, local_paths) if path and item.get('id')
+                }
+                # Remove files that were downloaded by an earlier run but no longer exist on the branch
+                for file_path in set(previous_manifest) - set(manifest):
+                    stale_path = os.path.join(project_dir, file_path)
+                    if os.path.exists(stale_path):
+                        os.unlink(stale_path)
+                self._save_manifest(project_id, branch, manifest)
+
+            logger.info(f"Downloaded {len(downloaded_files)} files from project {project.name} "
+                        f"({self.cache_stats['hits'] - hits_before} unchanged, served from cache)")
+
+        except Exception as e:
+            logger.error(f"Error accessing project {project_id}: {str(e)}")
+            raise
+
+        return downloaded_files
+
+    def download_changed_files(self, project_id: int, branch: str, since_commit: Optional[str] = None,
+                               merge_request_iid: Optional[int] = None,
+                               on_file: Optional[Callable[[str], None]] = None,
+                               max_workers: Optional[int] = None) -> List[str]:
+        """
+        Download only the files changed since a commit or by a merge request.
+
+        The diff of each downloaded file is kept in ``file_diffs`` so the reviewer can focus on the changed hunks.
+
+        Args:
+            project_id: GitLab project ID
+            branch: Branch name, compared against since_commit
+            since_commit: Commit SHA to compare the branch head against
+            merge_request_iid: Merge request IID, takes precedence over since_commit
+            on_file: Callback invoked with each local path as soon as the file and its diff are available
+            max_workers: Download threads for this project, defaults to the downloader's max_workers
+
+        Returns:
+            List of paths to downloaded files
+        """
+        try:
+            project = self.gl.projects.get(project_id)
+            logger.info(f"Accessing project: {project.name} (ID: {project_id})")
+
+            project_dir = self._project_dir(project_id, project.name, branch)
+            os.makedirs(project_dir, exist_ok=True)
+
+            if merge_request_iid:
+                changes = self._with_retry(
+                    lambda: project.mergerequests.get(merge_request_iid).changes(),
+                    f"changes of merge request !{merge_request_iid}"
+                )
+                diffs = changes['changes']
+                # Read files at the MR head commit, falling back to its source branch
+                ref = changes.get('sha') or changes['source_branch']
+            else:
+                compare = self._with_retry(
+                    lambda: project.repository_compare(since_commit, branch),
+                    f"compare {since_commit}...{branch}"
+                )
+                diffs = compare['diffs']
+                ref = branch
+
+            changed = [
+                diff for diff in diffs
+                if not diff.get('deleted_file') and self._get_file_language(diff['new_path'])
+            ]
+            logger.info(f"{len(changed)} of {len(diffs)} changed files in project {project.name} are reviewable")
+
+            def fetch(diff):
+                local_path = self._download_file(project, project_dir, diff['new_path'], ref)
+                if local_path:
+                    self.file_diffs[local_path] = diff.get('diff', '')
+                    if not self.file_diffs[local_path]:
+                        # GitLab returns an empty diff for collapsed or too large changes
+                        reason = 'too large' if diff.get('too_large') else 'collapsed' if diff.get('collapsed') else 'empty'
+                        logger.warning(f"Diff of {diff['new_path']} in project {project.name} is {reason}, "
+                                       f"the whole file will be reviewed instead")
+                        with self._stats_lock:
+                            self.empty_diff_files.append(local_path)
+                return self._notify(on_file, local_path)
+
+            with ThreadPoolExecutor(max_workers=max_workers or self.max_workers) as executor:
+                downloaded_files = [path for path in executor.map(fetch, changed) if path]
+
+            logger.info(f"Downloaded {len(downloaded_files)} changed files from project {project.name}")
+
+        except Exception as e:
+            logger.error(f"Error downloading changed files of project {project_id}: {str(e)}")
+            raise
 
-                    # Determine language based on file extension
-                    file_language = self._get_file_language(file_path)
-                    if not file_language:
-                        continue  # Skip files with unsupported extensions
+        return downloaded_files
 
-                    # Get file content
-                    file_content = project.files.get(file_path, ref=branch).decode()
+    def download_project_archive(self, project_id: int, branch: str,
+                                 on_file: Optional[Callable[[str], None]] = None) -> List[str]:
+        """
+        Download a branch as one tar.gz archive, stream-extracting only supported files.
 
-                    # Save file to disk
-                    local_path = os.path.join(project_dir, file_path)
-                    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        Args:
+            project_id: GitLab project ID
+            branch: Branch name
+            on_file: Callback invoked with each local path as soon as the file is extracted
+
+        Returns:
+            List of paths to downloaded files
+        """
+        try:
+            project = self.gl.projects.get(project_id)
+            logger.info(f"Accessing project: {project.name} (ID: {project_id})")
 
-                    with open(local_path, 'w', encoding='utf-8') as f:
-                        f.write(file_content)
+            project_dir = self._project_dir(project_id, project.name, branch)
+            os.makedirs(project_dir, exist_ok=True)
 
-                    logger.debug(f"Downloaded file: {local_path}")
-                    downloaded_files.append(local_path)
+            # A broken stream restarts the whole archive; extraction simply overwrites the files
+            # and files already passed to on_file are not reported again
+            notified = set()
 
-                except Exception as e:
-                    logger.error(f"Error downloading file {item['path']}: {str(e)}")
+            def on_extracted(local_path):
+                if on_file and local_path not in notified:
+                    notified.add(local_path)
+                    on_file(local_path)
 
-            logger.info(f"Downloaded {len(downloaded_files)} files from project {project.name}")
+            downloaded_files = self._with_retry(
+                lambda: self._extract_archive(project, project_dir, branch, on_extracted),
+                f"archive of project {project_id}, branch {branch}"
+            )
+            logger.info(f"Extracted {len(downloaded_files)} files from archive of project {project.name}")
 
         except Exception as e:
-            logger.error(f"Error accessing project {project_id}: {str(e)}")
+            logger.error(f"Error downloading archive of project {project_id}: {str(e)}")
             raise
 
         return downloaded_files
 
+    def _extract_archive(self, project, project_dir: str, branch: str,
+                         on_file: Optional[Callable[[str], None]] = None) -> List[str]:
+        """
+        Stream the branch archive and extract files with supported extensions into the project directory.
+
+        Args:
+            project: GitLab project object
+            project_dir: Local directory of the project
+            branch: Branch name
+            on_file: Callback invoked with each local path as soon as the file is extracted
+
+        Returns:
+            List of paths to extracted files
+        """
+        chunks = project.repository_archive(sha=branch, format='tar.gz', iterator=True,
+                                            chunk_size=ARCHIVE_CHUNK_SIZE)
+        extracted_files = []
+
+        with tarfile.open(fileobj=io.BufferedReader(_ChunkStream(chunks)), mode='r|gz') as archive:
+            for member in archive:
+                # Archive entries are prefixed with a "<project>-<sha>/" directory
+                parts = member.name.split('/', 1)
+                if not member.isfile() or len(parts) < 2 or not self._get_file_language(parts[1]):
+                    continue
+                file_path = os.path.normpath(parts[1])
+                if os.path.isabs(file_path) or file_path == '..' or file_path.startswith('..' + os.sep):
+                    logger.warning(f"Skipping unsafe archive entry: {member.name}")
+                    continue
+
+                local_path = os.path.join(project_dir, file_path)
+                os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                start = time.perf_counter()
+                # The file may be a hard link into the blob cache from an earlier run;
+                # unlink it so writing the new content leaves the cached blob intact
+                if os.path.lexists(local_path):
+                    os.unlink(local_path)
+                with archive.extractfile(member) as source, open(local_path, 'wb') as target:
+                    shutil.copyfileobj(source, target)
+                self._record_file(local_path, time.perf_counter() - start, member.size, False)
+
+                logger.debug(f"Extracted file: {local_path}")
+                extracted_files.append(local_path)
+                self._notify(on_file, local_path)
+
+        return extracted_files
+
+    def _download_file(self, project, project_dir: str, file_path: str, branch: str,
+                       blob_id: Optional[str] = None) -> Optional[str]:
+        """
+        Download a single file and save it under the project directory.
+
+        Files whose blob SHA is already in the cache are hard-linked instead of downloaded.
+
+        Args:
+            project: GitLab project object
+            project_dir: Local directory of the project
+            file_path: Path of the file in the repository
+            branch: Branch name
+            blob_id: Blob SHA from the repository tree, used as the cache key
+
+        Returns:
+            Local path of the downloaded file, or None on failure
+        """
+        try:
+            # Determine language based on file extension
+            if not self._get_file_language(file_path):
+                return None  # Skip files with unsupported extensions
+
+            local_path = os.path.join(project_dir, file_path)
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+            blob_path = self._blob_path(blob_id)
+            start = time.perf_counter()
+
+            if blob_path and os.path.exists(blob_path):
+                self._link_blob(blob_path, local_path)
+                self._count_cache('hits')
+                self._record_file(local_path, time.perf_counter() - start, os.path.getsize(local_path), True)
+                logger.debug(f"Linked unchanged file from cache: {local_path}")
+                return local_path
+
+            # Get file content
+            file_content = self._with_retry(
+                lambda: project.files.get(file_path, ref=branch).decode(),
+                f"file {file_path}"
+            )
+
+            # ProjectFile.decode() returns bytes, so write the content unchanged
+            if isinstance(file_content, str):
+                file_content = file_content.encode('utf-8')
+
+            # Save file to disk, through the cache when the blob SHA is known
+            if blob_path:
+                self._count_cache('misses')
+                self._write_atomic(blob_path, file_content)
+                self._link_blob(blob_path, local_path)
+            else:
+                # Replace rather than overwrite: the file may be a hard link into the blob cache
+                self._write_atomic(local_path, file_content)
+            self._record_file(local_path, time.perf_counter() - start, len(file_content), False)
+
+            logger.debug(f"Downloaded file: {local_path}")
+            return local_path
+
+        except Exception as e:
+            logger.error(f"Error downloading file {file_path}: {str(e)}")
+            return None
+
+    def _project_dir(self, project_id: int, project_name: str, branch: str) -> str:
+        """Return the local directory of a project branch."""
+        project_dir = os.path.join(self.output_dir, f"{project_id}_{project_name}")
+        if self.branch_subdirs:
+            project_dir = os.path.join(project_dir, quote(branch, safe=''))
+        return project_dir
+
+    @staticmethod
+    def _notify(on_file: Optional[Callable[[str], None]], local_path: Optional[str]) -> Optional[str]:
+        """Pass a downloaded file to the on_file callback and return its path unchanged."""
+        if on_file and local_path:
+            on_file(local_path)
+        return local_path
+
+    def _blob_path(self, blob_id: Optional[str]) -> Optional[str]:
+        """Return the cache path of a blob, or None when caching is disabled or the SHA is unknown."""
+        if not self.cache_dir or not blob_id:
+            return None
+        return os.path.join(self.cache_dir, 'blobs', blob_id[:2], blob_id)
+
+    def _manifest_path(self, project_id: int, branch: str) -> str:
+        """Return the manifest path of a project branch."""
+        return os.path.join(self.cache_dir, 'manifests', f"{project_id}_{quote(branch, safe='')}.json")
+
+    def _load_manifest(self, project_id: int, branch: str) -> Dict[str, str]:
+        """
+        Load the path -> blob SHA manifest written by the previous run.
+
+        Args:
+            project_id: GitLab project ID
+            branch: Branch name
+
+        Returns:
+            Dictionary mapping file paths to blob SHAs, empty if there is no manifest
+        """
+        if not self.cache_dir:
+            return {}
+        try:
+            with open(self._manifest_path(project_id, branch), 'r', encoding='utf-8') as f:
+                return json.load(f)['files']
+        except FileNotFoundError:
+            return {}
+        except (ValueError, KeyError) as e:
+            logger.warning(f"Ignoring unreadable manifest of project {project_id}, branch {branch}: {str(e)}")
+            return {}
+
+    def _save_manifest(self, project_id: int, branch: str, files: Dict[str, str]):
+        """
+        Save the path -> blob SHA manifest of a project branch.
+
+        Args:
+            project_id: GitLab project ID
+            branch: Branch name
+            files: Dictionary mapping file paths to blob SHAs
+        """
+        manifest = {'project_id': project_id, 'branch': branch, 'files': files}
+        self._write_atomic(self._manifest_path(project_id, branch),
+                           json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'))
+
+    def _count_cache(self, key: str):
+        """Increment a cache counter from a download thread."""
+        with self._stats_lock:
+            self.cache_stats[key] += 1
+
+    def _record_file(self, local_path: str, seconds: float, size: int, cached: bool):
+        """Record the download metrics of one file from a download thread."""
+        with self._stats_lock:
+            self.file_metrics[local_path] = {'seconds': seconds, 'bytes': size, 'cached': cached}
+
+    @staticmethod
+    def _write_atomic(path: str, content: bytes):
+        """Write content to a temporary file and rename it into place."""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(temp_path, path)
+        except Exception:
+            os.unlink(temp_path)
+            raise
+
+    @staticmethod
+    def _link_blob(blob_path: str, local_path: str):
+        """Hard-link a cached blob to its local path, copying when hard links are not supported."""
+        if os.path.exists(local_path):
+            if os.path.samefile(blob_path, local_path):
+                return
+            os.unlink(local_path)
+        try:
+            os.link(blob_path, local_path)
+        except OSError:
+            shutil.copyfile(blob_path, local_path)
+
+    def _with_retry(self, request, description: str):
+        """
+        Run a GitLab request within the global concurrency limit and the rate limiter,
+        retrying on 429/5xx and network errors.
+
+        Args:
+            request: Callable performing the request
+            description: Description of the request used in log messages
+
+        Returns:
+            Result of the request
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._request_slots:
+                    self.rate_limiter.acquire()
+                    return request()
+            except gitlab.exceptions.GitlabError as e:
+                if e.response_code not in RETRYABLE_STATUS_CODES or attempt == self.max_retries:
+                    raise
+                reason = f"HTTP {e.response_code}"
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as e:
+                if attempt == self.max_retries:
+                    raise
+                reason = type(e).__name__
+
+            with self._stats_lock:
+                self.retry_count += 1
+            delay = backoff_delay(attempt)
+            logger.warning(f"Retrying {description} in {delay:.1f}s after {reason} "
+                           f"(attempt {attempt + 1}/{self.max_retries})")
+            time.sleep(delay)
+
     def _get_file_language(self, file_path: str) -> str:
         """
         Determine the programming language of a file based on its extension.
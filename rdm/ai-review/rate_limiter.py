@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+限流与重试工具
+
+此模块提供线程安全的令牌桶限流器和带抖动的指数退避计算，
+供GitLab下载器和AI审查器共享使用。
+"""
+
+import time
+import random
+import threading
+from typing import Optional
+
+# 需要重试的HTTP状态码
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class RateLimiter:
+    """线程安全的令牌桶限流器。"""
+
+    def __init__(self, rate: Optional[float], capacity: Optional[float] = None):
+        """
+        初始化限流器。
+
+        参数:
+            rate: 每秒补充的令牌数，为None或0时不限流
+            capacity: 桶容量（允许的突发量），默认等于每秒补充的令牌数且至少为1
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate or 0, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1) -> float:
+        """
+        获取指定数量的令牌，令牌不足时阻塞等待。
+
+        Args:
+            tokens: 需要的令牌数，超过桶容量时按桶容量计算
+
+        Returns:
+            等待的秒数
+        """
+        if not self.rate:
+            return 0.0
+
+        tokens = min(tokens, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+                delay = (tokens - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0,
+                  retry_after: Optional[float] = None) -> float:
+    """
+    计算第attempt次重试前的等待时间（full jitter指数退避）。
+
+    Args:
+        attempt: 重试次数，从0开始
+        base: 退避基数（秒）
+        cap: 单次等待的上限（秒）
+        retry_after: 服务端通过Retry-After要求的等待时间，优先使用
+
+    Returns:
+        等待的秒数
+    """
+    if retry_after is not None:
+        return min(max(retry_after, 0.0), cap)
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
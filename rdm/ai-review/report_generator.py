@@ -11,7 +11,7 @@ It creates individual reports for each file and a consolidated report.
 import os
 import logging
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -34,12 +34,16 @@ class ReportGenerator:
         for language in ['java', 'c_cpp', 'go']:
             os.makedirs(os.path.join(self.output_dir, language), exist_ok=True)
     
-    def generate_reports(self, review_results: Dict[str, Dict[str, Any]]) -> List[str]:
+    def generate_reports(self, review_results: Dict[str, Dict[str, Any]],
+                         source_root: Optional[str] = None) -> List[str]:
         """
         Generate individual Markdown reports for each file review.
         
         Args:
             review_results: Dictionary mapping file paths to review results
+            source_root: Directory the reviewed files were downloaded to; when given, reports mirror
+                the file paths below it (project, branch and relative path), so files with the same
+                name no longer overwrite each other's reports
             
         Returns:
             List of paths to generated report files
@@ -55,13 +59,15 @@ class ReportGenerator:
                 
                 # Generate report file name
                 language = result.get('language', 'unknown')
-                file_name = os.path.basename(file_path)
-                report_name = f"{file_name}_review.md"
-                report_dir = os.path.join(self.output_dir, language)
-                report_path = os.path.join(report_dir, report_name)
+                if source_root:
+                    report_name = os.path.relpath(file_path, source_root).replace(os.sep, '/')
+                else:
+                    report_name = os.path.basename(file_path)
+                report_path = os.path.join(self.output_dir, language, f"{report_name}_review.md")
+                os.makedirs(os.path.dirname(report_path), exist_ok=True)
                 
                 # Generate report content
-                report_content = self._generate_file_report(file_path, result)
+                report_content = self._generate_file_report(file_path, result, report_name)
                 
                 # Write report to file
                 with open(report_path, 'w', encoding='utf-8') as f:
@@ -102,9 +108,10 @@ class ReportGenerator:
             # Generate table of contents
             toc = ""
             for i, report_path in enumerate(report_files, 1):
-                file_name = os.path.basename(report_path).replace('_review.md', '')
-                language_dir = os.path.basename(os.path.dirname(report_path))
-                toc += f"{i}. [{language_dir}/{file_name}](#{language_dir}-{file_name.replace('.', '-')})\n"
+                # "<language>/<report name>", where the report name may contain subdirectories
+                report_name = os.path.relpath(report_path, self.output_dir).replace(os.sep, '/')
+                report_name = report_name[:-len('_review.md')]
+                toc += f"{i}. [{report_name}](#{self._anchor(report_name)})\n"
             
             # Combine all reports
             reports_content = ""
@@ -130,13 +137,20 @@ class ReportGenerator:
             logger.error(f"Error consolidating reports: {str(e)}")
             raise
     
-    def _generate_file_report(self, file_path: str, result: Dict[str, Any]) -> str:
+    @staticmethod
+    def _anchor(report_name: str) -> str:
+        """Return the HTML anchor of a "<language>/<report name>" report."""
+        return report_name.replace('/', '-').replace('.', '-')
+    
+    def _generate_file_report(self, file_path: str, result: Dict[str, Any],
+                              report_name: Optional[str] = None) -> str:
         """
         Generate a Markdown report for a single file review.
         
         Args:
             file_path: Path to the reviewed file
             result: Review results for the file
+            report_name: Name of the report below the language directory, defaults to the file name
             
         Returns:
             Markdown report content
@@ -151,8 +165,7 @@ class ReportGenerator:
         
         # File information
         file_name = os.path.basename(file_path)
-        language_dir = os.path.basename(os.path.dirname(file_path))
-        anchor = f"{language}-{file_name.replace('.', '-')}"
+        anchor = self._anchor(f"{language}/{report_name or file_name}")
         
         report = f"""<h2 id="{anchor}">{file_name} ({language_display})</h2>
 
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Review Cache
+
+This module persists AI review results on disk (SQLite) so unchanged files are not
+sent to the AI model again. Entries are keyed by the SHA-256 of the file content,
+the prompt and the model parameters, and are evicted by age and total count.
+"""
+
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Run eviction after this many writes
+EVICT_EVERY = 100
+
+
+def make_cache_key(code: str, prompt: str, model_params: Dict[str, Any]) -> str:
+    """
+    Build the cache key of a review request.
+
+    Args:
+        code: Code content to review
+        prompt: Full instruction prompt sent with the code
+        model_params: Model name/endpoint and generation parameters
+
+    Returns:
+        Hex SHA-256 digest identifying the request
+    """
+    digest = hashlib.sha256()
+    for part in (code, prompt, json.dumps(model_params, sort_keys=True)):
+        data = part.encode('utf-8')
+        # Length-prefix each part so different splits never collide
+        digest.update(len(data).to_bytes(8, 'big'))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+class ReviewCache:
+    """Thread-safe on-disk cache of review results."""
+
+    def __init__(self, db_path: str, ttl_seconds: Optional[float] = None, max_entries: Optional[int] = None):
+        """
+        Open (or create) the review cache.
+
+        Args:
+            db_path: Path of the SQLite database file
+            ttl_seconds: Entries older than this are treated as missing and evicted, None to keep forever
+            max_entries: Keep at most this many entries, evicting the least recently used
+        """
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS reviews (
+                key TEXT PRIMARY KEY,
+                result TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_reviews_accessed_at ON reviews (accessed_at);
+        """)
+        self.evict()
+
+    def close(self):
+        """Close the database connection."""
+        with self._lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached review result.
+
+        Args:
+            key: Cache key from make_cache_key
+
+        Returns:
+            Cached review result, or None if missing or expired
+        """
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT result, created_at FROM reviews WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                return None
+            with self.conn:
+                self.conn.execute("UPDATE reviews SET accessed_at = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def put(self, key: str, result: Dict[str, Any]):
+        """
+        Store a review result.
+
+        Args:
+            key: Cache key from make_cache_key
+            result: Review result to store
+        """
+        now = time.time()
+        with self._lock:
+            with self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO reviews (key, result, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(result, ensure_ascii=False), now, now)
+                )
+            self._writes += 1
+            evict = self._writes % EVICT_EVERY == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        Remove expired entries and trim the cache to max_entries.
+
+        Returns:
+            Number of removed entries
+        """
+        removed = 0
+        with self._lock, self.conn:
+            if self.ttl_seconds is not None:
+                removed += self.conn.execute(
+                    "DELETE FROM reviews WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+                ).rowcount
+            if self.max_entries is not None:
+                removed += self.conn.execute("""
+                    DELETE FROM reviews WHERE key IN (
+                        SELECT key FROM reviews ORDER BY accessed_at DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.max_entries,)).rowcount
+        if removed:
+            logger.info(f"Evicted {removed} entries from review cache {self.db_path}")
+        return removed
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Review Journal
+
+This module keeps an append-only JSONL journal of review results. Each result is
+written and flushed to disk as soon as its file is reviewed, so a killed run can be
+resumed without sending the already reviewed files to the AI model again.
+"""
+
+import os
+import json
+import logging
+import threading
+from typing import Dict, Any
+
+logger = logging.getLogger(__name__)
+
+
+class ReviewJournal:
+    """Append-only JSONL journal of review results."""
+
+    def __init__(self, path: str, resume: bool = True):
+        """
+        Open the review journal.
+
+        Args:
+            path: Path of the JSONL journal file
+            resume: Keep the results of a previous run; when False the journal is truncated
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._file = open(path, 'a' if resume else 'w', encoding='utf-8')
+        # Terminate a line truncated by a crash so the next result starts on its own line
+        if resume and self._file.tell() > 0:
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    self._file.write('\n')
+
+    def close(self):
+        """Close the journal file."""
+        with self._lock:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Load the results recorded so far.
+
+        A truncated last line, left by a crash in the middle of a write, is ignored.
+
+        Returns:
+            Dictionary mapping file paths to their latest recorded review result
+        """
+        results = {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Ignoring malformed line {line_number} in review journal {self.path}")
+                    continue
+                results[result['file_path']] = result
+        return results
+
+    def append(self, result: Dict[str, Any]):
+        """
+        Append a review result and flush it to disk.
+
+        Args:
+            result: Review result, must contain 'file_path'
+        """
+        line = json.dumps(result, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
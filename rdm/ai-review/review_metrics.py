@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Review Metrics
+
+This module collects the timings of a review run and exports them as a JSON summary
+and as a Prometheus textfile (for the node_exporter textfile collector). Per-file
+timings are recorded by the pipeline stages; download and AI request details are
+taken from the counters kept by GitLabDownloader and AIReviewer.
+"""
+
+import os
+import json
+import time
+import tempfile
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+# Quantiles reported for latency distributions
+QUANTILES = (0.5, 0.9, 0.99)
+
+# Prefix of every exported Prometheus metric
+METRIC_PREFIX = 'code_review'
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    """
+    Compute a percentile by linear interpolation between the closest ranks.
+
+    Args:
+        values: Observed values
+        fraction: Percentile as a fraction between 0 and 1
+
+    Returns:
+        The percentile, or None when there are no values
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def _latency(values: List[float]) -> Dict[str, Any]:
+    """Summarize a list of durations in seconds."""
+    summary = {'count': len(values), 'sum': sum(values)}
+    for fraction in QUANTILES:
+        summary[f'p{int(fraction * 100)}'] = percentile(values, fraction)
+    summary['max'] = max(values) if values else None
+    return summary
+
+
+def _ratio(hits: int, misses: int) -> Optional[float]:
+    """Return hits / (hits + misses), or None when nothing was looked up."""
+    return hits / (hits + misses) if hits + misses else None
+
+
+class RunMetrics:
+    """Thread-safe collector of stage and per-file timings of one review run."""
+
+    def __init__(self):
+        """Start measuring a review run."""
+        self.started_at = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self._stages = {}  # stage -> {'first_start', 'last_end', 'busy_seconds', 'count'}
+        self._files = {}   # file path -> per-file fields
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, started: float, seconds: float, file_paths: List[str] = (), **fields):
+        """
+        Record one unit of work of a stage.
+
+        Args:
+            stage: Stage name, e.g. 'download', 'review' or 'report'
+            started: time.perf_counter() value when the work started
+            seconds: Duration of the work
+            file_paths: Files the work covered; the duration is shared equally between them
+            **fields: Extra per-file fields, e.g. the review status
+        """
+        with self._lock:
+            stats = self._stages.setdefault(stage, {'first_start': started, 'last_end': started,
+                                                    'busy_seconds': 0.0, 'count': 0})
+            stats['first_start'] = min(stats['first_start'], started)
+            stats['last_end'] = max(stats['last_end'], started + seconds)
+            stats['busy_seconds'] += seconds
+            stats['count'] += 1
+            for file_path in file_paths:
+                record = self._files.setdefault(file_path, {})
+                record[f'{stage}_seconds'] = seconds / len(file_paths)
+                record.update(fields)
+
+    def summary(self, downloader=None, reviewer=None, error: Optional[BaseException] = None) -> Dict[str, Any]:
+        """
+        Build the run summary.
+
+        Args:
+            downloader: GitLabDownloader of the run, adds download sizes, latencies, retries and cache hits
+            reviewer: AIReviewer of the run, adds AI request latencies, tokens, retries and cache hits
+            error: Exception that ended the run, marks the summary as failed
+
+        Returns:
+            JSON-serializable summary of the run
+        """
+        with self._lock:
+            stages = {
+                stage: {
+                    # Stages overlap in the pipeline, so the wall time of a stage spans
+                    # from its first to its last unit of work and busy time sums all units
+                    'wall_seconds': stats['last_end'] - stats['first_start'],
+                    'busy_seconds': stats['busy_seconds'],
+                    'count': stats['count']
+                }
+                for stage, stats in self._stages.items()
+            }
+            files = {file_path: dict(record) for file_path, record in self._files.items()}
+
+        summary = {
+            'started_at': self.started_at.isoformat(),
+            'duration_seconds': time.perf_counter() - self._start,
+            'status': 'failed' if error is not None else 'success',
+            'stages': stages,
+        }
+        if error is not None:
+            summary['error'] = f'{type(error).__name__}: {error}'
+
+        if downloader is not None:
+            file_metrics = dict(downloader.file_metrics)
+            for file_path, record in file_metrics.items():
+                files.setdefault(file_path, {}).update({
+                    'download_seconds': record['seconds'],
+                    'bytes': record['bytes'],
+                    'cached': record['cached']
+                })
+            for file_path in downloader.empty_diff_files:
+                files.setdefault(file_path, {})['empty_diff'] = True
+            total_bytes = sum(record['bytes'] for record in file_metrics.values())
+            fetched = [record['seconds'] for record in file_metrics.values() if not record['cached']]
+            summary['download'] = {
+                'files': len(file_metrics),
+                'bytes': total_bytes,
+                'latency_seconds': _latency(fetched),
+                'retries': downloader.retry_count,
+                # Diff-mode files without a diff from GitLab, reviewed in full
+                'empty_diffs': len(downloader.empty_diff_files),
+                'cache_hits': downloader.cache_stats['hits'],
+                'cache_misses': downloader.cache_stats['misses'],
+                'cache_hit_ratio': _ratio(downloader.cache_stats['hits'], downloader.cache_stats['misses'])
+            }
+
+        if reviewer is not None:
+            request_metrics = list(reviewer.request_metrics)
+            statuses = {}
+            for request in request_metrics:
+                statuses[str(request['status'])] = statuses.get(str(request['status']), 0) + 1
+            summary['ai'] = {
+                'requests': len(request_metrics),
+                'latency_seconds': _latency([request['seconds'] for request in request_metrics]),
+                'status_counts': statuses,
+                'retries': reviewer.retry_count,
+                'tokens_prompt': reviewer.token_stats['prompt'],
+                'tokens_completion': reviewer.token_stats['completion'],
+                'cache_hits': reviewer.cache_stats['hits'],
+                'cache_misses': reviewer.cache_stats['misses'],
+                'cache_hit_ratio': _ratio(reviewer.cache_stats['hits'], reviewer.cache_stats['misses'])
+            }
+
+        review_statuses = [record.get('status') for record in files.values() if 'status' in record]
+        summary['files'] = {
+            'total': len(files),
+            'reviewed': review_statuses.count('success'),
+            'failed': len(review_statuses) - review_statuses.count('success')
+        }
+        summary['per_file'] = [dict(record, file_path=file_path) for file_path, record in sorted(files.items())]
+        return summary
+
+    @staticmethod
+    def write_json(path: str, summary: Dict[str, Any]):
+        """
+        Write the summary as a JSON file.
+
+        Args:
+            path: Output path
+            summary: Summary returned by summary()
+        """
+        _write_atomic(path, json.dumps(summary, ensure_ascii=False, indent=2))
+
+    @staticmethod
+    def write_prometheus(path: str, summary: Dict[str, Any]):
+        """
+        Write the run totals in the Prometheus text exposition format.
+
+        Per-file details are left out to keep the label cardinality bounded.
+
+        Args:
+            path: Output path, typically in the node_exporter textfile directory
+            summary: Summary returned by summary()
+        """
+        lines = []
+
+        def metric(name, help_text, metric_type, samples):
+            samples = [(labels, value) for labels, value in samples if value is not None]
+            if not samples:
+                return
+            lines.append(f'# HELP {METRIC_PREFIX}_{name} {help_text}')
+            lines.append(f'# TYPE {METRIC_PREFIX}_{name} {metric_type}')
+            for labels, value in samples:
+                label_text = ','.join(f'{key}="{label}"' for key, label in labels.items())
+                lines.append(f'{METRIC_PREFIX}_{name}{{{label_text}}} {value}' if label_text
+                             else f'{METRIC_PREFIX}_{name} {value}')
+
+        def latency(name, help_text, stats):
+            samples = [({'quantile': str(fraction)}, stats[f'p{int(fraction * 100)}']) for fraction in QUANTILES]
+            metric(name, help_text, 'summary', samples)
+            lines.append(f"{METRIC_PREFIX}_{name}_sum {stats['sum']}")
+            lines.append(f"{METRIC_PREFIX}_{name}_count {stats['count']}")
+
+        metric('last_run_timestamp_seconds', 'Start time of the last review run.', 'gauge',
+               [({}, datetime.fromisoformat(summary['started_at']).timestamp())])
+        metric('duration_seconds', 'Duration of the last review run.', 'gauge', [({}, summary['duration_seconds'])])
+        metric('last_run_success', 'Whether the last review run finished without an error.', 'gauge',
+               [({}, int(summary.get('status') != 'failed'))])
+        metric('files', 'Files of the last review run by outcome.', 'gauge',
+               [({'outcome': outcome}, count) for outcome, count in summary['files'].items()])
+        metric('stage_wall_seconds', 'Time from the first to the last unit of work of a stage.', 'gauge',
+               [({'stage': stage}, stats['wall_seconds']) for stage, stats in summary['stages'].items()])
+        metric('stage_busy_seconds', 'Summed duration of all units of work of a stage.', 'gauge',
+               [({'stage': stage}, stats['busy_seconds']) for stage, stats in summary['stages'].items()])
+
+        download = summary.get('download')
+        if download:
+            metric('download_bytes', 'Bytes of downloaded files.', 'gauge', [({}, download['bytes'])])
+            metric('download_retries', 'Retried GitLab requests.', 'gauge', [({}, download['retries'])])
+            metric('download_empty_diffs', 'Changed files without a diff from GitLab, reviewed in full.', 'gauge',
+                   [({}, download['empty_diffs'])])
+            metric('download_cache_hit_ratio', 'Share of files served from the blob cache.', 'gauge',
+                   [({}, download['cache_hit_ratio'])])
+            if download['latency_seconds']['count']:
+                latency('download_latency_seconds', 'Download time of files fetched from GitLab.',
+                        download['latency_seconds'])
+
+        ai = summary.get('ai')
+        if ai:
+            metric('ai_requests', 'AI API request attempts by status.', 'gauge',
+                   [({'status': status}, count) for status, count in sorted(ai['status_counts'].items())])
+            metric('ai_retries', 'Retried AI API requests.', 'gauge', [({}, ai['retries'])])
+            metric('ai_tokens', 'Tokens sent to and generated by the AI model.', 'gauge',
+                   [({'direction': 'in'}, ai['tokens_prompt']), ({'direction': 'out'}, ai['tokens_completion'])])
+            metric('ai_cache_hit_ratio', 'Share of files served from the review cache.', 'gauge',
+                   [({}, ai['cache_hit_ratio'])])
+            if ai['latency_seconds']['count']:
+                latency('ai_latency_seconds', 'Duration of AI API request attempts.', ai['latency_seconds'])
+
+        _write_atomic(path, '\n'.join(lines) + '\n')
+
+
+def _write_atomic(path: str, content: str):
+    """Write a file through a temporary file so readers never see it half written."""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+    except Exception:
+        os.unlink(temp_path)
+        raise
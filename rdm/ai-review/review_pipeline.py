@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Review Pipeline
+
+This module runs download, review and report generation as overlapping stages
+connected by bounded queues: files are reviewed as soon as they are downloaded and
+reports are rendered as soon as reviews complete. When a queue is full the previous
+stage blocks, so memory stays bounded however large the repositories are.
+
+Several project branches are processed at once: projects download concurrently in
+priority order, and the review stage shares the AI workers fairly between projects
+through a FairTaskQueue (see review_scheduler).
+"""
+
+import queue
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple, Union
+
+from gitlab_downloader import GitLabDownloader
+from ai_reviewer import AIReviewer, SmallFileBatcher
+from report_generator import ReportGenerator
+from review_journal import ReviewJournal
+from review_metrics import RunMetrics
+from review_scheduler import FairTaskQueue, ReviewTarget, group_targets
+
+logger = logging.getLogger(__name__)
+
+
+class ReviewPipeline:
+    """Pipelined download -> review -> report run."""
+
+    def __init__(self, downloader: GitLabDownloader, reviewer: AIReviewer, report_generator: ReportGenerator,
+                 review_workers: int = 4, queue_size: int = 100, journal: Optional[ReviewJournal] = None,
+                 parallel_projects: int = 1, project_download_workers: Optional[int] = None,
+                 project_review_workers: Optional[int] = None, metrics: Optional[RunMetrics] = None):
+        """
+        Initialize the pipeline.
+
+        Args:
+            downloader: Downloader feeding the review stage
+            reviewer: Reviewer used by the review stage
+            report_generator: Generator rendering one report per reviewed file
+            review_workers: Number of review threads shared by all projects
+            queue_size: Capacity of each queue between stages (per project for the review queue)
+            journal: Journal recording each result; successful results already recorded are not reviewed again
+            parallel_projects: Number of projects downloading at the same time
+            project_download_workers: Download threads per project, defaults to the downloader's max_workers
+            project_review_workers: Maximum concurrent AI reviews per project, None for no quota
+            metrics: Collector of per-stage and per-file timings, None to skip measuring
+        """
+        self.downloader = downloader
+        self.reviewer = reviewer
+        self.report_generator = report_generator
+        self.review_workers = max(1, review_workers)
+        self.queue_size = queue_size
+        self.journal = journal
+        self.parallel_projects = max(1, parallel_projects)
+        self.project_download_workers = project_download_workers
+        self.project_review_workers = project_review_workers
+        self.metrics = metrics
+
+    def run(self, targets: Union[Dict[int, str], List[ReviewTarget]],
+            **download_options) -> Tuple[List[str], Dict[str, List[str]]]:
+        """
+        Download, review and report the given project branches.
+
+        Args:
+            targets: Review targets, or a dictionary mapping project IDs to branch names
+            **download_options: Extra arguments of GitLabDownloader.download_repositories
+
+        Returns:
+            Tuple (downloaded file paths, mapping of file path to its generated report paths)
+        """
+        if isinstance(targets, dict):
+            targets = [ReviewTarget(project_id, branch, 0) for project_id, branch in targets.items()]
+        project_groups = group_targets(targets)
+        # Branches of the same project need their own directories
+        if any(len(group) > 1 for group in project_groups):
+            self.downloader.branch_subdirs = True
+
+        task_queue = FairTaskQueue(self.queue_size, self.project_review_workers)
+        result_queue = queue.Queue(maxsize=self.queue_size)
+        recorded = self.journal.load() if self.journal else {}
+        downloaded_files = []
+        errors = []
+
+        def download_project(group):
+            # Branches of one project are fetched one after another, highest priority first
+            for target in group:
+                batcher = SmallFileBatcher(self.reviewer, self.downloader.file_diffs)
+
+                def on_file(file_path):
+                    # Called from the download threads; blocking puts throttle this project's downloads
+                    downloaded_files.append(file_path)
+                    if recorded.get(file_path, {}).get('status') == 'success':
+                        result_queue.put(({file_path: recorded[file_path]}, False))
+                        return
+                    for task in batcher.add(file_path):
+                        task_queue.put(target.project_id, task, target.priority)
+
+                start = time.perf_counter()
+                try:
+                    self.downloader.download_repositories(
+                        {target.project_id: target.branch},
+                        on_file=on_file,
+                        max_workers=self.project_download_workers,
+                        **download_options
+                    )
+                except Exception as e:
+                    logger.error(f"Download of project {target.project_id}, branch {target.branch} failed: {str(e)}")
+                    errors.append(e)
+                finally:
+                    if self.metrics:
+                        self.metrics.observe('download', start, time.perf_counter() - start)
+                    for task in batcher.flush():
+                        task_queue.put(target.project_id, task, target.priority)
+
+        def download_stage():
+            try:
+                with ThreadPoolExecutor(max_workers=self.parallel_projects) as executor:
+                    list(executor.map(download_project, project_groups))
+            finally:
+                task_queue.close()
+
+        def review_stage():
+            try:
+                while True:
+                    item = task_queue.get()
+                    if item is None:
+                        break
+                    project_id, task = item
+                    start = time.perf_counter()
+                    try:
+                        results = self.reviewer.review_task(task, self.downloader.file_diffs)
+                    except Exception as e:
+                        logger.error(f"Error reviewing {task}: {str(e)}")
+                        results = {
+                            file_path: {
+                                'file_path': file_path,
+                                'status': 'error',
+                                'message': str(e),
+                                'issues': [],
+                                'suggestions': [],
+                                'improved_code': ''
+                            }
+                            for file_path in task
+                        }
+                    finally:
+                        task_queue.task_done(project_id)
+                    if self.metrics:
+                        self.metrics.observe('review', start, time.perf_counter() - start, task, batch_size=len(task))
+                    result_queue.put((results, True))
+            finally:
+                result_queue.put(None)
+
+        threads = [threading.Thread(target=download_stage, name='download', daemon=True)]
+        threads += [
+            threading.Thread(target=review_stage, name=f'review-{i}', daemon=True)
+            for i in range(self.review_workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        # Report stage runs in the calling thread until every review thread has finished
+        file_reports = {}
+        finished_workers = 0
+        while finished_workers < self.review_workers:
+            item = result_queue.get()
+            if item is None:
+                finished_workers += 1
+                continue
+            results, fresh = item
+            for file_path, result in results.items():
+                if fresh and self.journal:
+                    self.journal.append(result)
+                start = time.perf_counter()
+                # Reports mirror the download layout, so same-named files of different
+                # directories, branches or projects get separate reports
+                file_reports[file_path] = self.report_generator.generate_reports(
+                    {file_path: result}, source_root=self.downloader.output_dir)
+                if self.metrics:
+                    self.metrics.observe('report', start, time.perf_counter() - start, [file_path],
+                                         status=result.get('status'))
+
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+
+        logger.info(f"Pipeline reviewed {len(file_reports)} of {len(downloaded_files)} downloaded files")
+        return downloaded_files, file_reports
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Review Scheduler
+
+This module describes the project/branch pairs of a review run and schedules their
+review tasks: targets are ordered by priority (e.g. release branches first), each
+project has a quota of concurrent AI reviews, and projects of the same priority are
+served round-robin so one huge repository cannot starve the others.
+"""
+
+import fnmatch
+import threading
+from collections import namedtuple, deque
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# A project branch to review; lower priority values are reviewed first
+ReviewTarget = namedtuple('ReviewTarget', ['project_id', 'branch', 'priority'])
+
+
+def branch_priority(branch: str, priority_patterns: Sequence[str]) -> int:
+    """
+    Rank a branch by the first matching pattern.
+
+    Args:
+        branch: Branch name
+        priority_patterns: fnmatch patterns ordered from highest to lowest priority
+
+    Returns:
+        Index of the first matching pattern, or len(priority_patterns) if none matches
+    """
+    for index, pattern in enumerate(priority_patterns):
+        if fnmatch.fnmatchcase(branch, pattern):
+            return index
+    return len(priority_patterns)
+
+
+def parse_target(spec: str, priority_patterns: Sequence[str] = ()) -> ReviewTarget:
+    """
+    Parse a "PROJECT_ID:BRANCH[:PRIORITY]" target specification.
+
+    Git ref names cannot contain ':', so the separator is unambiguous.
+
+    Args:
+        spec: Target specification
+        priority_patterns: Patterns ranking the branch when no explicit priority is given
+
+    Returns:
+        Parsed review target
+    """
+    parts = spec.split(':')
+    if len(parts) not in (2, 3) or not parts[0].isdigit() or not parts[1]:
+        raise ValueError(f"Invalid review target '{spec}', expected PROJECT_ID:BRANCH[:PRIORITY]")
+    priority = int(parts[2]) if len(parts) == 3 else branch_priority(parts[1], priority_patterns)
+    return ReviewTarget(int(parts[0]), parts[1], priority)
+
+
+class FairTaskQueue:
+    """
+    Bounded task queue with per-project capacity, per-project concurrency quota and fair sharing.
+
+    get() returns a task of the highest-priority project that is below its quota; among
+    projects of equal priority the least recently served one wins. put() only blocks the
+    project whose own queue is full, so a slow or huge project never blocks the others.
+    """
+
+    def __init__(self, capacity: int = 100, project_quota: Optional[int] = None):
+        """
+        Initialize the queue.
+
+        Args:
+            capacity: Maximum queued tasks per project
+            project_quota: Maximum tasks of one project being processed at once, None for unlimited
+        """
+        self.capacity = max(1, capacity)
+        self.project_quota = project_quota
+        self._queues = {}       # project_id -> deque of (priority, task)
+        self._in_flight = {}    # project_id -> tasks handed out and not yet done
+        self._last_served = {}  # project_id -> sequence number of the last get
+        self._sequence = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def put(self, project_id: int, task: Any, priority: int = 0):
+        """
+        Queue a task, blocking while the project's queue is full.
+
+        Args:
+            project_id: Project the task belongs to
+            task: Task to queue
+            priority: Priority of the task, lower values are served first
+        """
+        with self._condition:
+            project_queue = self._queues.setdefault(project_id, deque())
+            while len(project_queue) >= self.capacity:
+                self._condition.wait()
+            project_queue.append((priority, task))
+            self._condition.notify_all()
+
+    def get(self) -> Optional[Tuple[int, Any]]:
+        """
+        Take the next task, blocking until one is eligible.
+
+        Returns:
+            Tuple (project_id, task), or None once the queue is closed and drained
+        """
+        with self._condition:
+            while True:
+                eligible = [
+                    (project_queue[0][0], self._last_served.get(project_id, -1), project_id)
+                    for project_id, project_queue in self._queues.items()
+                    if project_queue and (self.project_quota is None
+                                          or self._in_flight.get(project_id, 0) < self.project_quota)
+                ]
+                if eligible:
+                    _, _, project_id = min(eligible)
+                    _, task = self._queues[project_id].popleft()
+                    self._in_flight[project_id] = self._in_flight.get(project_id, 0) + 1
+                    self._last_served[project_id] = self._sequence
+                    self._sequence += 1
+                    self._condition.notify_all()
+                    return project_id, task
+                if self._closed and not any(self._queues.values()):
+                    return None
+                self._condition.wait()
+
+    def task_done(self, project_id: int):
+        """
+        Mark a task returned by get() as processed, freeing its project's quota.
+
+        Args:
+            project_id: Project the task belongs to
+        """
+        with self._condition:
+            self._in_flight[project_id] -= 1
+            self._condition.notify_all()
+
+    def close(self):
+        """Signal that no more tasks will be queued."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+
+def group_targets(targets: List[ReviewTarget]) -> List[List[ReviewTarget]]:
+    """
+    Group targets by project, ordering both the groups and the targets in each group by priority.
+
+    Args:
+        targets: Review targets
+
+    Returns:
+        One list of targets per project, highest-priority project first
+    """
+    groups: Dict[int, List[ReviewTarget]] = {}
+    for target in sorted(targets, key=lambda target: target.priority):
+        groups.setdefault(target.project_id, []).append(target)
+    return list(groups.values())
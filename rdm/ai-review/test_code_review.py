@@ -6,14 +6,26 @@ Test script for the code review system.
 This script tests each component individually to ensure they work correctly.
 """
 
+import io
 import os
+import json
+import tarfile
+import threading
+import time
 import unittest
 import tempfile
 import shutil
+import requests
 from unittest.mock import patch, MagicMock
 
 from gitlab_downloader import GitLabDownloader
 from ai_reviewer import AIReviewer
+from review_cache import ReviewCache
+from review_journal import ReviewJournal
+from code_chunker import split_code
+from review_pipeline import ReviewPipeline
+from review_metrics import RunMetrics
+from review_scheduler import FairTaskQueue, ReviewTarget, parse_target
 from report_generator import ReportGenerator
 from email_sender import EmailSender
 
@@ -45,6 +57,241 @@ class TestGitLabDownloader(unittest.TestCase):
         self.assertEqual(downloader.private_token, 'token123')
         self.assertEqual(downloader.output_dir, '/tmp/output')
 
+    @patch('rate_limiter.random.uniform', return_value=0)
+    @patch('gitlab.Gitlab')
+    def test_download_project_files_concurrently(self, mock_gitlab, mock_uniform):
+        """Test concurrent download keeps tree order and retries transient errors."""
+        # Setup
+        import gitlab
+        temp_dir = tempfile.mkdtemp()
+        project = MagicMock()
+        project.name = 'demo'
+        project.repository_tree.return_value = [
+            {'type': 'blob', 'path': f'src/File{i}.java'} for i in range(20)
+        ] + [{'type': 'blob', 'path': 'README.md'}, {'type': 'tree', 'path': 'src'}]
+        attempts = {}
+
+        def get_file(path, ref):
+            attempts[path] = attempts.get(path, 0) + 1
+            if path == 'src/File3.java' and attempts[path] == 1:
+                raise gitlab.exceptions.GitlabGetError('unavailable', 503)
+            file_obj = MagicMock()
+            file_obj.decode.return_value = f'class {path}'.encode('utf-8')
+            return file_obj
+
+        project.files.get.side_effect = get_file
+        mock_gitlab.return_value.projects.get.return_value = project
+
+        downloader = GitLabDownloader('https://example.com', 'token123', temp_dir, max_workers=4)
+
+        # Execute
+        files = downloader.download_project_files(1, 'master')
+
+        # Assert
+        self.assertEqual(files, [
+            os.path.join(temp_dir, '1_demo', f'src/File{i}.java') for i in range(20)
+        ])
+        self.assertEqual(attempts['src/File3.java'], 2)
+        with open(files[3], 'r', encoding='utf-8') as f:
+            self.assertEqual(f.read(), 'class src/File3.java')
+
+        # Clean up
+        shutil.rmtree(temp_dir)
+
+    @patch('gitlab.Gitlab')
+    def test_incremental_download_uses_blob_cache(self, mock_gitlab):
+        """Test that unchanged blobs are linked from the cache and removed files are cleaned up."""
+        # Setup
+        temp_dir = tempfile.mkdtemp()
+        project = MagicMock()
+        project.name = 'demo'
+
+        def get_file(path, ref):
+            file_obj = MagicMock()
+            file_obj.decode.return_value = f'content of {path}'.encode('utf-8')
+            return file_obj
+
+        project.files.get.side_effect = get_file
+        mock_gitlab.return_value.projects.get.return_value = project
+        downloader = GitLabDownloader('https://example.com', 'token123', temp_dir)
+        project_dir = os.path.join(temp_dir, '1_demo')
+
+        # Execute: first run downloads everything
+        project.repository_tree.return_value = [
+            {'type': 'blob', 'path': 'A.java', 'id': 'aaaa'},
+            {'type': 'blob', 'path': 'B.java', 'id': 'bbbb'},
+            {'type': 'blob', 'path': 'C.go', 'id': 'cccc'},
+        ]
+        downloader.download_project_files(1, 'feature/x')
+        self.assertEqual(project.files.get.call_count, 3)
+
+        # Execute: second run with B changed and C deleted
+        project.files.get.reset_mock()
+        project.repository_tree.return_value = [
+            {'type': 'blob', 'path': 'A.java', 'id': 'aaaa'},
+            {'type': 'blob', 'path': 'B.java', 'id': 'bbb2'},
+        ]
+        files = downloader.download_project_files(1, 'feature/x')
+
+        # Assert
+        project.files.get.assert_called_once_with('B.java', ref='feature/x')
+        self.assertEqual(files, [os.path.join(project_dir, 'A.java'), os.path.join(project_dir, 'B.java')])
+        self.assertFalse(os.path.exists(os.path.join(project_dir, 'C.go')))
+        self.assertTrue(os.path.samefile(files[0], os.path.join(temp_dir, '.cache', 'blobs', 'aa', 'aaaa')))
+        self.assertEqual(downloader.cache_stats, {'hits': 1, 'misses': 4})
+
+        # Clean up
+        shutil.rmtree(temp_dir)
+
+    @patch('gitlab.Gitlab')
+    def test_diff_and_archive_runs_keep_cached_blobs_intact(self, mock_gitlab):
+        """Test that diff-mode and archive runs never write through hard links into the blob cache."""
+        # Setup: a full run links A.java to its cached blob
+        temp_dir = tempfile.mkdtemp()
+        project = MagicMock()
+        project.name = 'demo'
+        project.repository_tree.return_value = [{'type': 'blob', 'path': 'A.java', 'id': 'aaaa'}]
+        project.files.get.return_value.decode.return_value = b'old content'
+        mock_gitlab.return_value.projects.get.return_value = project
+        downloader = GitLabDownloader('https://example.com', 'token123', temp_dir)
+        downloader.download_project_files(1, 'master')
+        blob_path = os.path.join(temp_dir, '.cache', 'blobs', 'aa', 'aaaa')
+        local_path = os.path.join(temp_dir, '1_demo', 'A.java')
+        self.assertTrue(os.path.samefile(blob_path, local_path))
+
+        # Execute: diff-mode run after A.java changed
+        project.repository_compare.return_value = {'diffs': [
+            {'new_path': 'A.java', 'diff': '-old\n+new', 'deleted_file': False}
+        ]}
+        project.files.get.return_value.decode.return_value = b'new content'
+        downloader.download_repositories({1: 'master'}, since_commit='abc123')
+
+        # Assert
+        with open(local_path, 'rb') as f:
+            self.assertEqual(f.read(), b'new content')
+        with open(blob_path, 'rb') as f:
+            self.assertEqual(f.read(), b'old content')
+
+        # Execute: full run relinks the blob, then an archive run extracts over it
+        downloader.download_project_files(1, 'master')
+        self.assertTrue(os.path.samefile(blob_path, local_path))
+        archive_bytes = io.BytesIO()
+        with tarfile.open(fileobj=archive_bytes, mode='w:gz') as archive:
+            member = tarfile.TarInfo('demo-sha/A.java')
+            member.size = len(b'archived content')
+            archive.addfile(member, io.BytesIO(b'archived content'))
+        project.repository_archive.return_value = iter([archive_bytes.getvalue()])
+        downloader.download_project_archive(1, 'master')
+
+        # Assert
+        with open(local_path, 'rb') as f:
+            self.assertEqual(f.read(), b'archived content')
+        with open(blob_path, 'rb') as f:
+            self.assertEqual(f.read(), b'old content')
+
+        # Clean up
+        shutil.rmtree(temp_dir)
+
+    @patch('gitlab.Gitlab')
+    def test_download_changed_files(self, mock_gitlab):
+        """Test that only files changed since a commit are downloaded, with their diffs."""
+        # Setup
+        temp_dir = tempfile.mkdtemp()
+        project = MagicMock()
+        project.name = 'demo'
+        project.repository_compare.return_value = {'diffs': [
+            {'new_path': 'src/A.java', 'diff': '@@ -1 +1 @@\n-a\n+b', 'deleted_file': False},
+            {'new_path': 'src/Old.java', 'diff': '', 'deleted_file': True},
+            {'new_path': 'docs/README.md', 'diff': '+docs', 'deleted_file': False},
+        ]}
+        project.files.get.return_value.decode.return_value = b'class A {}'
+        mock_gitlab.return_value.projects.get.return_value = project
+        downloader = GitLabDownloader('https://example.com', 'token123', temp_dir)
+
+        # Execute
+        files = downloader.download_repositories({1: 'master'}, since_commit='abc123')
+
+        # Assert
+        project.repository_compare.assert_called_once_with('abc123', 'master')
+        project.files.get.assert_called_once_with('src/A.java', ref='master')
+        self.assertEqual(files, [os.path.join(temp_dir, '1_demo', 'src/A.java')])
+        self.assertEqual(downloader.file_diffs[files[0]], '@@ -1 +1 @@\n-a\n+b')
+
+        # Clean up
+        shutil.rmtree(temp_dir)
+
+    @patch('gitlab.Gitlab')
+    def test_changed_file_without_diff_is_reported(self, mock_gitlab):
+        """Test that a collapsed diff is logged and counted instead of silently reviewed in full."""
+        # Setup
+        temp_dir = tempfile.mkdtemp()
+        project = MagicMock()
+        project.name = 'demo'
+        project.repository_compare.return_value = {'diffs': [
+            {'new_path': 'src/A.java', 'diff': '@@ -1 +1 @@\n-a\n+b', 'deleted_file': False},
+            {'new_path': 'src/Big.java', 'diff': '', 'deleted_file': False, 'too_large': True},
+        ]}
+        project.files.get.return_value.decode.return_value = b'class A {}'
+        mock_gitlab.return_value.projects.get.return_value = project
+        downloader = GitLabDownloader('https://example.com', 'token123', temp_dir)
+
+        # Execute
+        with self.assertLogs('gitlab_downloader', level='WARNING') as logs:
+            downloader.download_repositories({1: 'master'}, since_commit='abc123')
+        summary = RunMetrics().summary(downloader)
+        prom_path = os.path.join(temp_dir, 'metrics.prom')
+        RunMetrics().write_prometheus(prom_path, summary)
+
+        # Assert
+        big = os.path.join(temp_dir, '1_demo', 'src/Big.java')
+        self.assertEqual(downloader.empty_diff_files, [big])
+        self.assertIn('src/Big.java', logs.output[0])
+        self.assertIn('too large', logs.output[0])
+        self.assertEqual(summary['download']['empty_diffs'], 1)
+        self.assertEqual([record['file_path'] for record in summary['per_file'] if record.get('empty_diff')], [big])
+        with open(prom_path, 'r', encoding='utf-8') as f:
+            self.assertIn('code_review_download_empty_diffs 1', f.read())
+
+        # Clean up
+        shutil.rmtree(temp_dir)
+
+    @patch('gitlab.Gitlab')
+    def test_download_project_archive(self, mock_gitlab):
+        """Test stream-extracting supported files from a branch archive."""
+        # Setup
+        temp_dir = tempfile.mkdtemp()
+        buffer = io.BytesIO()
+        with tarfile.open(fileobj=buffer, mode='w:gz') as archive:
+            for name, content in [('demo-abc/src/Main.java', b'class Main {}'),
+                                  ('demo-abc/docs/README.md', b'# docs'),
+                                  ('demo-abc/../evil.go', b'package evil'),
+                                  ('demo-abc/..config/Conf.java', b'class Conf {}')]:
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                archive.addfile(info, io.BytesIO(content))
+        data = buffer.getvalue()
+
+        project = MagicMock()
+        project.name = 'demo'
+        project.repository_archive.return_value = iter(data[i:i + 100] for i in range(0, len(data), 100))
+        mock_gitlab.return_value.projects.get.return_value = project
+
+        downloader = GitLabDownloader('https://example.com', 'token123', temp_dir)
+
+        # Execute
+        files = downloader.download_repositories({1: 'master'}, use_archive=True)
+
+        # Assert
+        self.assertEqual(files, [os.path.join(temp_dir, '1_demo', 'src', 'Main.java'),
+                                 os.path.join(temp_dir, '1_demo', '..config', 'Conf.java')])
+        self.assertFalse(os.path.exists(os.path.join(temp_dir, 'evil.go')))
+        with open(files[0], 'rb') as f:
+            self.assertEqual(f.read(), b'class Main {}')
+        project.files.get.assert_not_called()
+
+        # Clean up
+        shutil.rmtree(temp_dir)
+
 class TestAIReviewer(unittest.TestCase):
     """Test the AI reviewer module."""
     
@@ -67,7 +314,7 @@ class TestAIReviewer(unittest.TestCase):
         """Clean up test environment."""
         shutil.rmtree(self.temp_dir)
     
-    @patch('requests.post')
+    @patch('requests.Session.post')
     def test_review_file(self, mock_post):
         """Test reviewing a file."""
         # Setup
@@ -95,6 +342,262 @@ class TestAIReviewer(unittest.TestCase):
         self.assertEqual(result['language'], 'java')
         mock_post.assert_called_once()
 
+    @patch('time.sleep')
+    @patch('requests.Session.post')
+    def test_retry_honors_retry_after(self, mock_post, mock_sleep):
+        """Test that 429 responses are retried after the Retry-After delay."""
+        # Setup
+        throttled = MagicMock(status_code=429, headers={'Retry-After': '7'})
+        success = MagicMock(status_code=200)
+        success.json.return_value = {'choices': [{'message': {'content': '{"issues": [], "suggestions": []}'}}]}
+        mock_post.side_effect = [throttled, success]
+        reviewer = AIReviewer('https://api.example.com', 'key123')
+
+        # Execute
+        result = reviewer.review_file(self.java_file)
+
+        # Assert
+        self.assertEqual(result['status'], 'success')
+        mock_sleep.assert_called_once_with(7.0)
+        throttled.close.assert_called_once()
+        success.close.assert_called_once()
+        self.assertEqual(reviewer.retry_count, 1)
+        self.assertEqual([m['status'] for m in reviewer.request_metrics], [429, 200])
+
+    @patch('requests.Session.post')
+    def test_failed_request_releases_connection(self, mock_post):
+        """Test that a non-retryable HTTP error still closes the streamed response."""
+        # Setup
+        mock_post.return_value.status_code = 400
+        mock_post.return_value.raise_for_status.side_effect = requests.exceptions.HTTPError('400 Bad Request')
+        reviewer = AIReviewer('https://api.example.com', 'key123', stream=True)
+
+        # Execute
+        result = reviewer.review_file(self.java_file)
+
+        # Assert
+        self.assertEqual(result['status'], 'error')
+        mock_post.return_value.close.assert_called_once()
+
+    @patch('requests.Session.post')
+    def test_streamed_review_with_journal_resume(self, mock_post):
+        """Test streamed responses and resuming reviews recorded in the journal."""
+        # Setup
+        chunks = ['{"issues": ', '["Streamed issue"], ', '"suggestions": []}']
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.iter_lines.return_value = [
+            'data: ' + json.dumps({'choices': [{'delta': {'content': chunk}}]}) for chunk in chunks
+        ] + ['', 'data: [DONE]']
+        other_file = os.path.join(self.temp_dir, 'Other.java')
+        shutil.copyfile(self.java_file, other_file)
+        journal_path = os.path.join(self.temp_dir, 'journal.jsonl')
+        with open(journal_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'file_path': self.java_file, 'status': 'success', 'language': 'java',
+                                'issues': ['From journal'], 'suggestions': [], 'improved_code': ''}) + '\n')
+            f.write('{"file_path": "truncated')
+        reviewer = AIReviewer('https://api.example.com', 'key123', stream=True)
+        completed = []
+
+        # Execute
+        with ReviewJournal(journal_path) as journal:
+            results = reviewer.review_files([self.java_file, other_file], journal=journal,
+                                            on_result=lambda path, result: completed.append(path))
+
+        # Assert
+        mock_post.assert_called_once()
+        self.assertTrue(mock_post.call_args.kwargs['stream'])
+        mock_post.return_value.close.assert_called_once()
+        self.assertEqual(results[self.java_file]['issues'], ['From journal'])
+        self.assertEqual(results[other_file]['issues'], ['Streamed issue'])
+        self.assertEqual(completed, [self.java_file, other_file])
+        with ReviewJournal(journal_path) as journal:
+            self.assertEqual(journal.load()[other_file]['issues'], ['Streamed issue'])
+
+    @patch('requests.Session.post')
+    def test_batched_review_of_small_files(self, mock_post):
+        """Test that small files are packed into one request and split back per file."""
+        # Setup
+        file_paths = []
+        for name in ['A.go', 'B.go', 'C.go', 'Big.java']:
+            file_path = os.path.join(self.temp_dir, name)
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write('package main\n' if name.endswith('.go') else 'class Big {}\n' * 200)
+            file_paths.append(file_path)
+
+        def post(url, headers, json, timeout, **kwargs):
+            response = MagicMock(status_code=200)
+            if '3个Go文件' in json['prompt']:
+                # File 3 is missing from the answer and must be reviewed on its own
+                content = '{"files": [{"file_id": 1, "issues": ["a"]}, {"file_id": 2, "issues": ["b"]}]}'
+            else:
+                content = '{"issues": ["single"], "suggestions": []}'
+            response.json.return_value = {'choices': [{'message': {'content': content}}]}
+            return response
+
+        mock_post.side_effect = post
+        reviewer = AIReviewer('https://api.example.com', 'key123', batch_file_tokens=100)
+
+        # Execute
+        results = reviewer.review_files(file_paths)
+
+        # Assert
+        self.assertEqual(mock_post.call_count, 3)
+        self.assertEqual(list(results), file_paths)
+        self.assertEqual([r['issues'] for r in results.values()], [['a'], ['b'], ['single'], ['single']])
+        self.assertEqual(results[file_paths[1]]['file_path'], file_paths[1])
+
+    @patch('requests.Session.post')
+    def test_review_files_concurrently(self, mock_post):
+        """Test concurrent review keeps input order and respects the token quota."""
+        # Setup
+        file_paths = []
+        for i in range(6):
+            file_path = os.path.join(self.temp_dir, f'File{i}.java')
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(f'class File{i} {{}}')
+            file_paths.append(file_path)
+
+        def post(url, headers, json, timeout, **kwargs):
+            response = MagicMock()
+            issue = json['prompt'].split('class ')[1].split(' ')[0]
+            response.json.return_value = {
+                'choices': [{'message': {'content': '{"issues": ["%s"], "suggestions": []}' % issue}}]
+            }
+            return response
+
+        mock_post.side_effect = post
+        reviewer = AIReviewer('https://api.example.com', 'key123', requests_per_minute=600,
+                              tokens_per_minute=600000)
+
+        # Execute
+        with patch.object(reviewer.token_limiter, 'acquire', wraps=reviewer.token_limiter.acquire) as acquire:
+            results = reviewer.review_files(file_paths, max_workers=3)
+
+        # Assert
+        self.assertEqual(list(results), file_paths)
+        self.assertEqual([r['issues'] for r in results.values()], [[f'File{i}'] for i in range(6)])
+        self.assertEqual(mock_post.call_count, 6)
+        self.assertTrue(all(call.args[0] > 2000 for call in acquire.call_args_list))
+
+    @patch('requests.Session.post')
+    def test_review_cache(self, mock_post):
+        """Test that unchanged files are served from the review cache."""
+        # Setup
+        mock_post.return_value.json.return_value = {
+            'choices': [{'message': {'content': '{"issues": ["Issue"], "suggestions": []}'}}]
+        }
+        cache_path = os.path.join(self.temp_dir, 'cache.sqlite3')
+        copy_path = os.path.join(self.temp_dir, 'Copy.java')
+        shutil.copyfile(self.java_file, copy_path)
+
+        # Execute
+        with ReviewCache(cache_path) as cache:
+            reviewer = AIReviewer('https://api.example.com', 'key123', cache=cache)
+            first = reviewer.review_file(self.java_file)
+            second = reviewer.review_file(copy_path)
+            changed = reviewer.review_file(self.java_file, diff='+ new line')
+
+        # Assert
+        self.assertEqual(mock_post.call_count, 2)
+        self.assertEqual(second['issues'], first['issues'])
+        self.assertEqual(second['file_path'], copy_path)
+        self.assertEqual(changed['status'], 'success')
+        self.assertEqual(reviewer.cache_stats, {'hits': 1, 'misses': 2})
+
+        # Assert: expired entries are evicted when the cache is reopened
+        with ReviewCache(cache_path, ttl_seconds=-1) as cache:
+            self.assertEqual(cache.conn.execute("SELECT COUNT(*) FROM reviews").fetchone()[0], 0)
+
+    @patch('requests.Session.post')
+    def test_review_large_file_in_chunks(self, mock_post):
+        """Test that large files are reviewed in chunks with issue lines mapped back to the file."""
+        # Setup
+        methods = ''.join(
+            f'    void method{i}() {{\n' + '        int value = 0;\n' * 20 + '    }\n' for i in range(6)
+        )
+        large_file = os.path.join(self.temp_dir, 'Large.java')
+        with open(large_file, 'w', encoding='utf-8') as f:
+            f.write('public class Large {\n' + methods + '}\n')
+        mock_post.return_value.json.return_value = {
+            'choices': [{'message': {'content': '{"issues": ["L2: unused value"], "suggestions": ["s"]}'}}]
+        }
+        reviewer = AIReviewer('https://api.example.com', 'key123', max_chunk_tokens=200)
+
+        # Execute
+        result = reviewer.review_file(large_file)
+
+        # Assert
+        chunks = split_code(open(large_file, encoding='utf-8').read(), 'java', 200)
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(mock_post.call_count, len(chunks))
+        self.assertEqual(result['issues'], [f'L{chunk.start_line + 1}: unused value' for chunk in chunks])
+
+    @patch('requests.Session.post')
+    def test_chunk_reviews_respect_max_in_flight(self, mock_post):
+        """Test that chunks of concurrently reviewed files share the overall request cap."""
+        # Setup
+        methods = ''.join(
+            f'    void method{i}() {{\n' + '        int value = 0;\n' * 20 + '    }\n' for i in range(6)
+        )
+        file_paths = []
+        for i in range(3):
+            file_path = os.path.join(self.temp_dir, f'Large{i}.java')
+            with open(file_path, 'w', encoding='utf-8') as f:
+                f.write(f'public class Large{i} {{\n' + methods + '}\n')
+            file_paths.append(file_path)
+        in_flight = []
+        peak = []
+        lock = threading.Lock()
+
+        def post(url, headers, json, timeout, **kwargs):
+            with lock:
+                in_flight.append(1)
+                peak.append(len(in_flight))
+            time.sleep(0.01)
+            with lock:
+                in_flight.pop()
+            response = MagicMock()
+            response.status_code = 200
+            response.json.return_value = {'choices': [{'message': {'content': '{"issues": [], "suggestions": []}'}}]}
+            return response
+
+        mock_post.side_effect = post
+        reviewer = AIReviewer('https://api.example.com', 'key123', max_chunk_tokens=200,
+                              chunk_workers=4, max_in_flight=2)
+
+        # Execute
+        results = reviewer.review_files(file_paths, max_workers=3)
+
+        # Assert
+        self.assertTrue(all(result['status'] == 'success' for result in results.values()))
+        self.assertGreater(mock_post.call_count, 3)
+        self.assertLessEqual(max(peak), 2)
+
+class TestCodeChunker(unittest.TestCase):
+    """Test the code chunker module."""
+
+    def test_split_at_function_boundaries(self):
+        """Test that chunks end at function boundaries and cover the whole file."""
+        # Setup
+        code = (
+            '#include <stdio.h>\n'
+            'int first() {\n'
+            '    printf("{ not a brace");\n'
+            '    return 1;\n'
+            '}\n'
+            '/* } */\n'
+            'int second() {\n'
+            '    return 2;\n'
+            '}\n'
+        )
+
+        # Execute
+        chunks = split_code(code, 'c_cpp', max_tokens=30)
+
+        # Assert
+        self.assertEqual([(c.start_line, c.end_line) for c in chunks], [(1, 5), (6, 9)])
+        self.assertEqual(''.join(c.text for c in chunks), code)
+
 class TestReportGenerator(unittest.TestCase):
     """Test the report generator module."""
     
@@ -136,6 +639,195 @@ class TestReportGenerator(unittest.TestCase):
             self.assertIn('Suggestion 1', content)
             self.assertIn('public class Better {}', content)
 
+class TestReviewScheduler(unittest.TestCase):
+    """Test the review scheduler module."""
+
+    def test_parse_target_with_branch_priority(self):
+        """Test parsing targets with pattern-based and explicit priorities."""
+        patterns = ['release/*', 'hotfix/*']
+        self.assertEqual(parse_target('270:release/1.2', patterns), ReviewTarget(270, 'release/1.2', 0))
+        self.assertEqual(parse_target('270:master', patterns), ReviewTarget(270, 'master', 2))
+        self.assertEqual(parse_target('12:dev:1', patterns), ReviewTarget(12, 'dev', 1))
+        with self.assertRaises(ValueError):
+            parse_target('master', patterns)
+
+    def test_fair_task_queue_priority_quota_and_round_robin(self):
+        """Test that the queue serves priority first, respects quotas and alternates projects."""
+        # Setup
+        task_queue = FairTaskQueue(capacity=10, project_quota=2)
+        for i in range(4):
+            task_queue.put(1, f'mono-{i}', priority=1)
+        for i in range(2):
+            task_queue.put(2, f'small-{i}', priority=1)
+        task_queue.put(3, 'release', priority=0)
+        task_queue.close()
+
+        # Execute
+        served = [task_queue.get() for _ in range(5)]
+
+        # Assert: release first, then projects alternate until project 1 reaches its quota
+        self.assertEqual([task for _, task in served], ['release', 'mono-0', 'small-0', 'mono-1', 'small-1'])
+        task_queue.task_done(1)
+        self.assertEqual(task_queue.get(), (1, 'mono-2'))
+        for project_id in (1, 1, 2, 2, 3):
+            task_queue.task_done(project_id)
+        self.assertEqual(task_queue.get(), (1, 'mono-3'))
+        self.assertIsNone(task_queue.get())
+
+class TestReviewPipeline(unittest.TestCase):
+    """Test the pipelined download -> review -> report run."""
+
+    @patch('requests.Session.post')
+    @patch('gitlab.Gitlab')
+    def test_run_pipeline_with_small_queues(self, mock_gitlab, mock_post):
+        """Test that every downloaded file is reviewed, journaled and reported through bounded queues."""
+        # Setup
+        temp_dir = tempfile.mkdtemp()
+        project = MagicMock()
+        project.name = 'demo'
+        project.repository_tree.return_value = [
+            {'type': 'blob', 'path': f'src/File{i}.java', 'id': f'sha{i}'} for i in range(10)
+        ]
+        project.files.get.return_value.decode.return_value = b'class File {}'
+        mock_gitlab.return_value.projects.get.return_value = project
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {
+            'choices': [{'message': {'content': '{"issues": ["Issue"], "suggestions": []}'}}]
+        }
+
+        downloader = GitLabDownloader('https://example.com', 'token123', os.path.join(temp_dir, 'code'))
+        reviewer = AIReviewer('https://api.example.com', 'key123')
+        report_generator = ReportGenerator(os.path.join(temp_dir, 'reports'))
+
+        # Execute
+        with ReviewJournal(os.path.join(temp_dir, 'journal.jsonl'), resume=False) as journal:
+            pipeline = ReviewPipeline(downloader, reviewer, report_generator,
+                                      review_workers=3, queue_size=1, journal=journal)
+            downloaded_files, file_reports = pipeline.run({1: 'master'})
+            recorded = journal.load()
+
+        # Assert
+        self.assertEqual(len(downloaded_files), 10)
+        self.assertEqual(set(file_reports), set(downloaded_files))
+        self.assertTrue(all(len(reports) == 1 for reports in file_reports.values()))
+        self.assertEqual(set(recorded), set(downloaded_files))
+        self.assertEqual(mock_post.call_count, 10)
+
+        # Clean up
+        shutil.rmtree(temp_dir)
+
+    @patch('requests.Session.post')
+    @patch('gitlab.Gitlab')
+    def test_same_file_on_two_branches_gets_separate_reports(self, mock_gitlab, mock_post):
+        """Test that a file present on two branches of one project is reported once per branch."""
+        # Setup
+        temp_dir = tempfile.mkdtemp()
+        project = MagicMock()
+        project.name = 'demo'
+        project.repository_tree.return_value = [{'type': 'blob', 'path': 'src/Main.java', 'id': None}]
+
+        def get_file(path, ref):
+            file_obj = MagicMock()
+            file_obj.decode.return_value = f'class Main {{}} // {ref}'.encode('utf-8')
+            return file_obj
+
+        def post(url, headers, json, timeout, **kwargs):
+            response = MagicMock()
+            response.status_code = 200
+            branch = json['prompt'].split('// ')[1].split('\n')[0]
+            response.json.return_value = {
+                'choices': [{'message': {'content': '{"issues": ["Issue on %s"], "suggestions": []}' % branch}}]
+            }
+            return response
+
+        project.files.get.side_effect = get_file
+        mock_gitlab.return_value.projects.get.return_value = project
+        mock_post.side_effect = post
+        downloader = GitLabDownloader('https://example.com', 'token123', os.path.join(temp_dir, 'code'))
+        reviewer = AIReviewer('https://api.example.com', 'key123')
+        report_generator = ReportGenerator(os.path.join(temp_dir, 'reports'))
+        targets = [ReviewTarget(1, 'master', 1), ReviewTarget(1, 'release/1.0', 0)]
+
+        # Execute
+        _, file_reports = ReviewPipeline(downloader, reviewer, report_generator).run(targets)
+        report_files = [report for file_path in sorted(file_reports) for report in file_reports[file_path]]
+        with open(report_generator.consolidate_reports(report_files), 'r', encoding='utf-8') as f:
+            consolidated = f.read()
+
+        # Assert
+        self.assertEqual(len(set(report_files)), 2)
+        self.assertEqual(consolidated.count('Issue on master'), 1)
+        self.assertEqual(consolidated.count('Issue on release/1.0'), 1)
+        self.assertIn('(#java-1_demo-master-src-Main-java)', consolidated)
+        self.assertIn('<h2 id="java-1_demo-master-src-Main-java">', consolidated)
+
+        # Clean up
+        shutil.rmtree(temp_dir)
+
+    @patch('requests.Session.post')
+    @patch('gitlab.Gitlab')
+    def test_run_pipeline_records_metrics(self, mock_gitlab, mock_post):
+        """Test that a pipeline run exports stage, download, AI and per-file metrics."""
+        # Setup
+        temp_dir = tempfile.mkdtemp()
+        project = MagicMock()
+        project.name = 'demo'
+        project.repository_tree.return_value = [
+            {'type': 'blob', 'path': f'src/File{i}.java', 'id': f'sha{i}'} for i in range(4)
+        ]
+        project.files.get.return_value.decode.return_value = b'class File {}'
+        mock_gitlab.return_value.projects.get.return_value = project
+        mock_post.return_value.status_code = 200
+        mock_post.return_value.json.return_value = {
+            'choices': [{'message': {'content': '{"issues": [], "suggestions": []}'}}],
+            'usage': {'prompt_tokens': 100, 'completion_tokens': 20}
+        }
+
+        downloader = GitLabDownloader('https://example.com', 'token123', os.path.join(temp_dir, 'code'))
+        reviewer = AIReviewer('https://api.example.com', 'key123')
+        report_generator = ReportGenerator(os.path.join(temp_dir, 'reports'))
+        metrics = RunMetrics()
+
+        # Execute
+        ReviewPipeline(downloader, reviewer, report_generator, review_workers=2, metrics=metrics).run({1: 'master'})
+        summary = metrics.summary(downloader, reviewer)
+        json_path = os.path.join(temp_dir, 'metrics.json')
+        prom_path = os.path.join(temp_dir, 'metrics.prom')
+        metrics.write_json(json_path, summary)
+        metrics.write_prometheus(prom_path, summary)
+
+        # Assert
+        self.assertEqual(set(summary['stages']), {'download', 'review', 'report'})
+        self.assertEqual(summary['files'], {'total': 4, 'reviewed': 4, 'failed': 0})
+        self.assertEqual(summary['download']['bytes'], 4 * len(b'class File {}'))
+        self.assertEqual(summary['download']['cache_misses'], 4)
+        self.assertEqual(summary['ai']['requests'], 4)
+        self.assertEqual(summary['ai']['tokens_prompt'], 400)
+        self.assertEqual(summary['ai']['tokens_completion'], 80)
+        self.assertEqual(summary['ai']['latency_seconds']['count'], 4)
+        self.assertTrue(all('download_seconds' in record and 'review_seconds' in record
+                            for record in summary['per_file']))
+        with open(json_path, 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['ai']['tokens_completion'], 80)
+        with open(prom_path, 'r', encoding='utf-8') as f:
+            exposition = f.read()
+        self.assertIn('code_review_ai_tokens{direction="in"} 400', exposition)
+        self.assertIn('code_review_ai_latency_seconds_count 4', exposition)
+        self.assertIn('# TYPE code_review_stage_wall_seconds gauge', exposition)
+        self.assertIn('code_review_last_run_success 1', exposition)
+        self.assertEqual(summary['status'], 'success')
+
+        # A failed run is still summarized and marked as failed
+        failed = metrics.summary(downloader, reviewer, error=KeyboardInterrupt())
+        metrics.write_prometheus(prom_path, failed)
+        self.assertEqual(failed['status'], 'failed')
+        self.assertEqual(failed['error'], 'KeyboardInterrupt: ')
+        with open(prom_path, 'r', encoding='utf-8') as f:
+            self.assertIn('code_review_last_run_success 0', f.read())
+
+        # Clean up
+        shutil.rmtree(temp_dir)
+
 class TestEmailSender(unittest.TestCase):
     """Test the email sender module."""
     
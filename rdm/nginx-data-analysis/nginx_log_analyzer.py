@@ -1,203 +1,2278 @@
-#!/usr/bin/env python
-# -*- coding: utf-8 -*-
-
-"""
-nginx日志分析工具
-
-该脚本用于分析nginx访问日志，统计不同员工在指定时间段内的访问次数。
-"""
-
-import re
-import os
-import datetime  # 新增datetime模块
-from datetime import datetime  # 修正导入方式
-import pandas as pd
-
-# 固定配置
-LOG_DIR = os.path.join(os.path.dirname(__file__), 'logs')  # 日志目录
-# 生成当天日期字符串
-current_date = datetime.now().strftime("%Y%m%d")  # 修正调用方式
-OUTPUT_FILE = os.path.join(os.path.dirname(__file__), f'员工访问统计{current_date}.xlsx')
-EMPLOYEE_FILE = os.path.join(os.path.dirname(__file__), 'IP信息.xlsx')  # 员工信息文件
-START_TIME = '2025-11-01 00:00:00'  # 开始时间
-END_TIME = '2025-12-01 00:00:00'  # 结束时间
-
-def parse_nginx_log(log_file):
-    """
-    解析nginx日志文件，提取IP地址和时间
-
-    Args:
-        log_file: nginx日志文件路径
-
-    Returns:
-        访问记录列表，每条记录包含IP地址和时间
-    """
-    access_records = []
-
-    # nginx日志格式的正则表达式
-    # 示例: 192.168.8.106 - - [07/May/2025:05:20:17 +0000] "GET /activate?email=...
-    pattern = r'(\d+\.\d+\.\d+\.\d+) - - \[(\d+/\w+/\d+:\d+:\d+:\d+ [+\-]\d+)\] "POST .*"'
-
-    with open(log_file, 'r', encoding='utf-8') as f:
-        for line in f:
-            match = re.search(pattern, line)
-            if match:
-                ip = match.group(1)
-                time_str = match.group(2)
-
-                # 将nginx日志时间格式转换为datetime对象
-                # 格式: 07/May/2025:05:20:17 +0000
-                try:
-                    # 解析原始时间
-                    time_obj = datetime.strptime(time_str, '%d/%b/%Y:%H:%M:%S %z')
-
-                    # 将时间调整为北京时间（+8小时）
-                    from datetime import timedelta
-                    time_obj = time_obj + timedelta(hours=8)
-
-                    access_records.append({'ip': ip, 'time': time_obj})
-                except ValueError as e:
-                    print(f"时间解析错误: {e}, 原始时间字符串: {time_str}")
-                    continue
-
-    return access_records
-
-
-def filter_by_time_range(records, start_time, end_time):
-    """
-    按时间范围过滤访问记录
-
-    Args:
-        records: 访问记录列表
-        start_time: 开始时间
-        end_time: 结束时间
-
-    Returns:
-        过滤后的访问记录列表
-    """
-    filtered_records = []
-
-    for record in records:
-        if start_time <= record['time'] <= end_time:
-            filtered_records.append(record)
-
-    return filtered_records
-
-
-def count_access_by_employee(records, employee_info):
-    """
-    统计每个员工的访问次数
-
-    Args:
-        records: 访问记录列表
-        employee_info: 员工信息DataFrame
-
-    Returns:
-        员工访问统计DataFrame
-    """
-    # 创建IP地址到员工信息的映射
-    ip_to_employee = {}
-    for _, row in employee_info.iterrows():
-        ip_to_employee[row['IP']] = {'工号': row['工号'], '姓名': row['姓名']}
-
-    # 统计每个IP的访问次数
-    ip_counts = {}
-    for record in records:
-        ip = record['ip']
-        if ip in ip_counts:
-            ip_counts[ip] += 1
-        else:
-            ip_counts[ip] = 1
-
-    # 创建员工访问统计结果
-    result = []
-    for _, row in employee_info.iterrows():
-        employee_id = row['工号']
-        name = row['姓名']
-        ip = row['IP']
-
-        # 如果员工IP在访问记录中，获取访问次数，否则为0
-        count = ip_counts.get(ip, 0)
-
-        result.append({
-            '工号': employee_id,
-            '姓名': name,
-            'IP': ip,
-            '访问次数': count
-        })
-
-    return pd.DataFrame(result)
-
-
-def main():
-    # 将输入的时间字符串转换为datetime对象
-    try:
-        start_time = datetime.strptime(START_TIME, '%Y-%m-%d %H:%M:%S').replace(tzinfo=datetime.now().astimezone().tzinfo)
-        end_time = datetime.strptime(END_TIME, '%Y-%m-%d %H:%M:%S').replace(tzinfo=datetime.now().astimezone().tzinfo)
-    except ValueError:
-        print("错误: 时间格式不正确，请使用 YYYY-MM-DD HH:MM:SS 格式")
-        return
-
-    # 检查日志目录是否存在
-    if not os.path.exists(LOG_DIR) or not os.path.isdir(LOG_DIR):
-        print(f"错误: 找不到日志目录 {LOG_DIR} 或者它不是一个目录")
-        return
-
-    # 检查员工信息文件是否存在
-    if not os.path.exists(EMPLOYEE_FILE):
-        print(f"错误: 找不到员工信息文件 {EMPLOYEE_FILE}")
-        return
-
-    # 读取员工信息
-    try:
-        employee_info = pd.read_excel(EMPLOYEE_FILE)
-    except Exception as e:
-        print(f"读取员工信息文件时出错: {e}")
-        return
-
-    # 获取目录中的所有文件
-    log_files = []
-    for file in os.listdir(LOG_DIR):
-        file_path = os.path.join(LOG_DIR, file)
-        if os.path.isfile(file_path):
-            log_files.append(file_path)
-
-    if not log_files:
-        print(f"警告: 目录 {LOG_DIR} 中没有找到任何文件")
-        return
-
-    # 解析所有nginx日志
-    print("正在解析nginx日志...")
-    all_access_records = []
-
-    for log_file in log_files:
-        print(f"正在处理日志文件: {log_file}")
-        try:
-            access_records = parse_nginx_log(log_file)
-            all_access_records.extend(access_records)
-            print(f"- 从 {log_file} 解析了 {len(access_records)} 条记录")
-        except Exception as e:
-            print(f"处理文件 {log_file} 时出错: {e}")
-            continue
-
-    print(f"共解析 {len(all_access_records)} 条访问记录")
-
-    # 按时间范围过滤
-    print(f"正在过滤 {START_TIME} 到 {END_TIME} 的记录...")
-    filtered_records = filter_by_time_range(all_access_records, start_time, end_time)
-    print(f"过滤后有 {len(filtered_records)} 条记录")
-
-    # 统计每个员工的访问次数
-    print("正在统计每个员工的访问次数...")
-    result_df = count_access_by_employee(filtered_records, employee_info)
-
-    # 保存结果到Excel文件
-    try:
-        result_df.to_excel(OUTPUT_FILE, index=False)
-        print(f"结果已保存到 {OUTPUT_FILE}")
-    except Exception as e:
-        print(f"保存结果时出错: {e}")
-
-
-if __name__ == "__main__":
-    main()
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+nginx日志分析工具
+
+该脚本用于分析nginx访问日志，统计不同员工在指定时间段内的访问次数。
+"""
+
+import re
+import os
+import io
+import bz2
+import gzip
+import math
+import heapq
+import hashlib
+import sqlite3
+import time
+import ipaddress
+import argparse
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+
+try:
+    import zstandard  # 可选依赖，仅在处理 .zst 日志时需要
+except ImportError:
+    zstandard = None
+
+try:
+    import pyarrow as pa  # 可选依赖，仅在导出/查询Parquet时需要
+    import pyarrow.dataset as pa_dataset
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pa_dataset = None
+    pq = None
+
+# 固定配置
+LOG_DIR = os.path.join(os.path.dirname(__file__), 'logs')  # 日志目录
+# 生成当天日期字符串
+current_date = datetime.now().strftime("%Y%m%d")  # 修正调用方式
+OUTPUT_FILE = os.path.join(os.path.dirname(__file__), f'员工访问统计{current_date}.xlsx')
+EMPLOYEE_FILE = os.path.join(os.path.dirname(__file__), 'IP信息.xlsx')  # 员工信息文件
+START_TIME = '2025-11-01 00:00:00'  # 开始时间
+END_TIME = '2025-12-01 00:00:00'  # 结束时间
+CHUNK_SIZE_MB = 256  # 多进程模式下大文件按该大小（MB）切分
+SNAPSHOT_FILE = os.path.join(os.path.dirname(__file__), '员工实时访问统计.xlsx')  # 实时模式的快照文件
+FLUSH_INTERVAL = 60  # 实时模式下写快照的间隔（秒）
+PARQUET_BATCH_SIZE = 1000000  # 导出Parquet时每批写入的记录数
+TOP_K = 50  # 未匹配IP模式下输出访问次数最多的IP个数
+INDEX_FILE = os.path.join(os.path.dirname(__file__), 'nginx_log_index.sqlite3')  # 增量聚合索引文件
+INDEX_SCHEMA_VERSION = 2  # 聚合索引的表结构版本，版本不一致时重建索引
+
+# nginx日志格式的预编译正则表达式（锚定行首，只匹配POST请求，不再贪婪匹配行尾）
+# 示例: 192.168.8.106 - - [07/May/2025:05:20:17 +0000] "POST /activate?email=...
+LOG_PATTERN = re.compile(r'(\d+\.\d+\.\d+\.\d+) - - \[([^\]]+)\] "POST ')
+# 扩展分析模式下解析所有请求的方法、URL、状态码和响应字节数
+# 行首部分与 LOG_PATTERN 接受的行完全相同，URL、状态码和字节数不完整的行只匹配行首
+DETAIL_PATTERN = re.compile(r'(\d+\.\d+\.\d+\.\d+) - - \[([^\]]+)\] "(\S+) (?:(\S+)[^"]*" (\d{3}) (\d+|-))?')
+# 日志格式末尾追加的 $request_time（秒，毫秒精度），可能带引号
+REQUEST_TIME_PATTERN = re.compile(r' "?(\d+\.\d+)"?\s*$')
+# 路径中的ID片段：纯数字、UUID、长十六进制串，归一化为 {id}
+ID_SEGMENT_PATTERN = re.compile(
+    r'\d+|[0-9a-fA-F]{16,}|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}'
+)
+# 任意请求行中的时间字段，用于确定日志文件的时间边界
+TIME_PATTERN_BYTES = re.compile(rb'\[(\d{2}/\w{3}/\d{4}:\d{2}:\d{2}:\d{2} [+\-]\d{4})\]')
+
+# 月份缩写到数字的查找表
+MONTHS = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12,
+}
+
+# 日志时间统一调整为北京时间（+8小时）
+BEIJING_OFFSET = timedelta(hours=8)
+
+# nginx按请求结束顺序写日志，而记录的是请求开始时间，日志并非严格有序，
+# 按时间定位文件偏移时向外放宽该余量，再由 filter_by_time_range 精确过滤
+TIME_SLACK = timedelta(minutes=5)
+# 读取文件尾部以确定最后一条日志时间时的块大小
+TAIL_BLOCK_SIZE = 64 * 1024
+
+# 员工信息中一个单元格可填写多个IP或网段（如DHCP地址池 192.168.10.0/24），用这些分隔符分开
+IP_SEPARATORS = re.compile(r'[\s,，;；、]+')
+
+# 压缩格式的魔数，用于识别logrotate压缩后的日志
+COMPRESSION_MAGIC = {
+    'gzip': b'\x1f\x8b',
+    'bz2': b'BZh',
+    'zstd': b'\x28\xb5\x2f\xfd',
+}
+
+# 访问记录：紧凑的元组结构，字段为IP地址和（已调整为北京时间的）时间
+AccessRecord = namedtuple('AccessRecord', ['ip', 'time'])
+# 扩展分析模式的访问明细，request_time 在日志中没有记录时为None
+AccessDetail = namedtuple('AccessDetail', ['ip', 'time', 'method', 'path', 'status', 'bytes', 'request_time'])
+
+
+@lru_cache(maxsize=None)
+def _get_timezone(tz_str):
+    """
+    根据 +0800 形式的时区字符串返回对应的timezone对象（结果缓存）
+
+    Args:
+        tz_str: 时区偏移字符串
+
+    Returns:
+        timezone对象
+    """
+    minutes = int(tz_str[1:3]) * 60 + int(tz_str[3:5])
+    if tz_str[0] == '-':
+        minutes = -minutes
+    elif tz_str[0] != '+':
+        raise ValueError(f"无效的时区偏移: {tz_str}")
+    return timezone(timedelta(minutes=minutes))
+
+
+@lru_cache(maxsize=4096)
+def parse_log_time(time_str):
+    """
+    按固定偏移解析nginx日志时间，并调整为北京时间
+
+    日志按时间顺序写入，同一秒内的多条记录共享同一个时间字符串，
+    因此按秒缓存解析结果，可以避免对每一行都重复解析。
+
+    Args:
+        time_str: nginx日志时间字符串，格式: 07/May/2025:05:20:17 +0000
+
+    Returns:
+        调整为北京时间（+8小时）后的datetime对象
+
+    Raises:
+        ValueError: 时间字符串格式不正确
+    """
+    if len(time_str) != 26 or time_str[2] != '/' or time_str[6] != '/' or time_str[11] != ':':
+        raise ValueError(f"无效的时间格式: {time_str}")
+    month = MONTHS.get(time_str[3:6])
+    if month is None:
+        raise ValueError(f"无效的月份: {time_str[3:6]}")
+
+    time_obj = datetime(
+        int(time_str[7:11]), month, int(time_str[0:2]),
+        int(time_str[12:14]), int(time_str[15:17]), int(time_str[18:20]),
+        tzinfo=_get_timezone(time_str[21:26])
+    )
+    return time_obj + BEIJING_OFFSET
+
+
+def parse_log_lines(lines):
+    """
+    从日志行中逐条解析POST访问记录
+
+    Args:
+        lines: 可迭代的日志行（字符串）
+
+    Yields:
+        AccessRecord(ip, time) 访问记录
+    """
+    match = LOG_PATTERN.match
+    for line in lines:
+        # 先做一次廉价的子串判断，跳过非POST请求
+        if '"POST ' not in line:
+            continue
+        m = match(line)
+        if m is None:
+            continue
+        ip, time_str = m.groups()
+        try:
+            yield AccessRecord(ip, parse_log_time(time_str))
+        except ValueError as e:
+            print(f"时间解析错误: {e}, 原始时间字符串: {time_str}")
+
+
+def detect_compression(log_file):
+    """
+    根据文件头部的魔数判断日志文件的压缩格式
+
+    Args:
+        log_file: 日志文件路径
+
+    Returns:
+        'gzip'、'bz2'、'zstd' 之一，未压缩时返回None
+    """
+    with open(log_file, 'rb') as f:
+        header = f.read(4)
+    for compression, magic in COMPRESSION_MAGIC.items():
+        if header.startswith(magic):
+            return compression
+    return None
+
+
+def open_log_file(log_file):
+    """
+    以文本方式打开日志文件，压缩文件会以流的方式边读边解压，不落地到磁盘
+
+    Args:
+        log_file: 日志文件路径
+
+    Returns:
+        可逐行迭代的文本文件对象
+
+    Raises:
+        ValueError: 文件为zstd压缩但未安装zstandard
+    """
+    compression = detect_compression(log_file)
+    if compression == 'gzip':
+        return gzip.open(log_file, 'rt', encoding='utf-8', errors='replace')
+    if compression == 'bz2':
+        return bz2.open(log_file, 'rt', encoding='utf-8', errors='replace')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ValueError(f"文件 {log_file} 为zstd压缩格式，请先安装 zstandard: pip install zstandard")
+        reader = zstandard.ZstdDecompressor().stream_reader(open(log_file, 'rb'), closefd=True)
+        return io.TextIOWrapper(reader, encoding='utf-8', errors='replace')
+    return open(log_file, 'r', encoding='utf-8', errors='replace')
+
+
+def parse_nginx_log(log_file):
+    """
+    解析nginx日志文件，提取IP地址和时间
+
+    以生成器方式逐行读取，不会把整个文件的记录都加载到内存中。
+    支持gzip/bz2/zstd压缩的轮转日志（如 access.log.2.gz），按魔数自动识别。
+
+    Args:
+        log_file: nginx日志文件路径
+
+    Yields:
+        AccessRecord(ip, time) 访问记录
+    """
+    with open_log_file(log_file) as f:
+        yield from parse_log_lines(f)
+
+
+def filter_by_time_range(records, start_time, end_time):
+    """
+    按时间范围过滤访问记录
+
+    Args:
+        records: 可迭代的访问记录
+        start_time: 开始时间
+        end_time: 结束时间
+
+    Yields:
+        时间范围内的访问记录
+    """
+    for record in records:
+        if start_time <= record.time <= end_time:
+            yield record
+
+
+def count_ips(records):
+    """
+    统计每个IP的访问次数
+
+    Args:
+        records: 可迭代的访问记录
+
+    Returns:
+        IP地址到访问次数的Counter
+    """
+    return Counter(record.ip for record in records)
+
+
+def ipv4_to_int(ips):
+    """
+    将IPv4地址字符串批量转换为整数
+
+    Args:
+        ips: IPv4地址字符串的Series
+
+    Returns:
+        int64类型的Series，索引与输入相同
+    """
+    if ips.empty:
+        return pd.Series([], index=ips.index, dtype='int64')
+    parts = ips.str.split('.', expand=True).astype('int64')
+    return parts[0] * 16777216 + parts[1] * 65536 + parts[2] * 256 + parts[3]
+
+
+def expand_employee_ips(employee_info):
+    """
+    将员工信息中的IP列展开为网段
+
+    单个IP展开为前缀长度为32的网段，网段（CIDR）展开为网段地址和前缀长度。
+    同一员工重复登记的地址只保留一条。
+
+    Args:
+        employee_info: 员工信息DataFrame
+
+    Returns:
+        包含 row（员工所在行号）、network（网段地址）、prefixlen（前缀长度）三列的DataFrame
+    """
+    entries = []
+    for row, cell in enumerate(employee_info['IP']):
+        if pd.isna(cell):
+            continue
+        for entry in IP_SEPARATORS.split(str(cell).strip()):
+            if not entry:
+                continue
+            try:
+                network = ipaddress.IPv4Network(entry, strict=False)
+            except ValueError:
+                print(f"警告: 无效的IP配置 {entry}，已忽略")
+                continue
+            entries.append((row, int(network.network_address), network.prefixlen))
+
+    return pd.DataFrame(entries, columns=['row', 'network', 'prefixlen']).astype('int64').drop_duplicates()
+
+
+def _prefix_mask(prefixlen):
+    """返回前缀长度对应的IPv4网络掩码（整数）"""
+    return (0xFFFFFFFF << (32 - prefixlen)) & 0xFFFFFFFF
+
+
+def map_ips_to_employees(ips, employee_info):
+    """
+    将IP地址批量映射到员工信息所在的行号
+
+    按最长前缀匹配：从最长的前缀长度开始，把IP按该长度取网段地址后与配置merge，
+    命中的IP不再参与更短前缀的匹配，因此单个IP配置优先于网段，嵌套的网段以
+    范围最小的为准。整体复杂度为 O(n × 不同前缀长度的个数)。
+    多名员工登记了同一个地址（或同一个网段）时，每名员工都计入。
+
+    Args:
+        ips: IPv4地址字符串序列
+        employee_info: 员工信息DataFrame
+
+    Returns:
+        包含 pos（IP在ips中的下标）、row（员工所在行号）两列的DataFrame，
+        一个IP对应多名员工时有多行，未匹配到员工的IP不出现
+    """
+    ips = pd.Series(list(ips), dtype=object)
+    matches = [pd.DataFrame({'pos': [], 'row': []}, dtype='int64')]
+    valid = ips.str.fullmatch(r'\d+\.\d+\.\d+\.\d+').fillna(False).to_numpy(bool)
+    if not valid.any():
+        return matches[0]
+    remaining = pd.DataFrame({'pos': np.flatnonzero(valid), 'ip': ipv4_to_int(ips[valid]).to_numpy()})
+
+    entries = expand_employee_ips(employee_info)
+    for prefixlen, networks in sorted(entries.groupby('prefixlen'), reverse=True):
+        keyed = remaining.assign(network=remaining['ip'] & _prefix_mask(prefixlen))
+        matched = keyed.merge(networks[['network', 'row']], on='network')
+        if matched.empty:
+            continue
+        matches.append(matched[['pos', 'row']])
+        remaining = remaining[~remaining['pos'].isin(matched['pos'])]
+        if remaining.empty:
+            break
+
+    return pd.concat(matches, ignore_index=True)
+
+
+def build_employee_report(ip_counts, employee_info):
+    """
+    根据IP访问次数生成员工访问统计
+
+    一个员工可以对应多个IP或网段，访问次数为其所有地址的访问次数之和。
+
+    Args:
+        ip_counts: IP地址到访问次数的映射
+        employee_info: 员工信息DataFrame
+
+    Returns:
+        员工访问统计DataFrame
+    """
+    matches = map_ips_to_employees(ip_counts.keys(), employee_info)
+    counts = np.fromiter(ip_counts.values(), dtype='int64', count=len(ip_counts))
+    totals = pd.Series(counts[matches['pos'].to_numpy()]).groupby(matches['row'].to_numpy()).sum()
+
+    result = employee_info[['工号', '姓名', 'IP']].reset_index(drop=True)
+    # 如果员工IP不在访问记录中，访问次数为0
+    result['访问次数'] = totals.reindex(range(len(result)), fill_value=0).to_numpy()
+    return result
+
+
+def count_access_by_employee(records, employee_info):
+    """
+    统计每个员工的访问次数
+
+    Args:
+        records: 可迭代的访问记录
+        employee_info: 员工信息DataFrame
+
+    Returns:
+        员工访问统计DataFrame
+    """
+    return build_employee_report(count_ips(records), employee_info)
+
+
+def split_log_file(log_file, chunk_size, start=0, end=None):
+    """
+    将日志文件按字节偏移切分为若干段，每段的边界都对齐到换行符
+
+    Args:
+        log_file: 日志文件路径
+        chunk_size: 每段的目标大小（字节）
+        start: 切分范围的起始偏移（必须位于行首）
+        end: 切分范围的结束偏移，默认为文件末尾
+
+    Returns:
+        (起始偏移, 结束偏移) 列表，区间为左闭右开
+    """
+    if end is None:
+        end = os.path.getsize(log_file)
+    ranges = []
+
+    with open(log_file, 'rb') as f:
+        while start < end:
+            chunk_end = start + chunk_size
+            if chunk_end >= end:
+                chunk_end = end
+            else:
+                # 向后移动到下一个换行符之后，保证不会把一行切成两半
+                f.seek(chunk_end)
+                f.readline()
+                chunk_end = min(f.tell(), end)
+            ranges.append((start, chunk_end))
+            start = chunk_end
+
+    return ranges
+
+
+def _read_time_at_or_after(f, offset):
+    """
+    读取从offset处（或其后第一个行首）开始第一条可解析时间的日志行
+
+    Args:
+        f: 以二进制方式打开的日志文件
+        offset: 字节偏移
+
+    Returns:
+        (行首偏移, 时间) 元组，到达文件末尾时时间为None
+    """
+    if offset > 0:
+        # 回退一个字节再读一行，offset恰好位于行首时不会跳过该行
+        f.seek(offset - 1)
+        f.readline()
+    else:
+        f.seek(0)
+
+    while True:
+        line_start = f.tell()
+        line = f.readline()
+        if not line:
+            return line_start, None
+        m = TIME_PATTERN_BYTES.search(line)
+        if m is None:
+            continue
+        try:
+            return line_start, parse_log_time(m.group(1).decode('ascii'))
+        except ValueError:
+            continue
+
+
+def find_time_offset(f, file_size, target_time):
+    """
+    在按时间追加写入的日志文件中二分查找第一条时间不早于target_time的行
+
+    Args:
+        f: 以二进制方式打开的日志文件
+        file_size: 文件大小
+        target_time: 目标时间
+
+    Returns:
+        该行的行首偏移，不存在时返回文件大小
+    """
+    lo, hi = 0, file_size
+    while lo < hi:
+        mid = (lo + hi) // 2
+        _, line_time = _read_time_at_or_after(f, mid)
+        if line_time is None or line_time >= target_time:
+            hi = mid
+        else:
+            lo = mid + 1
+    line_start, _ = _read_time_at_or_after(f, lo)
+    return min(line_start, file_size)
+
+
+def get_log_time_bounds(log_file):
+    """
+    读取未压缩日志文件第一条和最后一条日志的时间
+
+    Args:
+        log_file: 日志文件路径
+
+    Returns:
+        (第一条时间, 最后一条时间) 元组，文件中没有可解析的时间时为 (None, None)
+    """
+    file_size = os.path.getsize(log_file)
+    with open(log_file, 'rb') as f:
+        _, first_time = _read_time_at_or_after(f, 0)
+        if first_time is None:
+            return None, None
+
+        # 从文件尾部按块向前读取，直到找到最后一条带时间的日志
+        last_time = None
+        block_end = file_size
+        while block_end > 0 and last_time is None:
+            block_start = max(block_end - TAIL_BLOCK_SIZE, 0)
+            f.seek(block_start)
+            block = f.read(block_end - block_start)
+            for m in reversed(list(TIME_PATTERN_BYTES.finditer(block))):
+                try:
+                    last_time = parse_log_time(m.group(1).decode('ascii'))
+                    break
+                except ValueError:
+                    continue
+            block_end = block_start
+
+    return first_time, last_time
+
+
+def locate_time_range(log_file, start_time, end_time):
+    """
+    确定未压缩日志文件中与时间范围相交的字节区间
+
+    整个文件都在时间范围之外时直接跳过；否则用二分查找定位区间边界，
+    只需读取相关的那一段日志。
+
+    Args:
+        log_file: 日志文件路径
+        start_time: 开始时间
+        end_time: 结束时间
+
+    Returns:
+        (起始偏移, 结束偏移) 元组，文件与时间范围不相交时返回None
+    """
+    first_time, last_time = get_log_time_bounds(log_file)
+    if first_time is None:
+        return None
+    if first_time > end_time + TIME_SLACK or last_time < start_time - TIME_SLACK:
+        return None
+
+    file_size = os.path.getsize(log_file)
+    with open(log_file, 'rb') as f:
+        start = 0 if first_time >= start_time else find_time_offset(f, file_size, start_time - TIME_SLACK)
+        end = file_size if last_time <= end_time else find_time_offset(f, file_size, end_time + TIME_SLACK)
+
+    if start >= end:
+        return None
+    return start, end
+
+
+def read_log_range(log_file, start, end):
+    """
+    逐行读取日志文件中 [start, end) 字节范围内的内容
+
+    Args:
+        log_file: 日志文件路径
+        start: 起始字节偏移（必须位于行首）
+        end: 结束字节偏移（必须位于行首或文件末尾）
+
+    Yields:
+        解码后的日志行，无法解码的字节会被替换
+    """
+    with open(log_file, 'rb') as f:
+        f.seek(start)
+        position = start
+        for raw_line in f:
+            if position >= end:
+                break
+            position += len(raw_line)
+            yield raw_line.decode('utf-8', errors='replace')
+
+
+def iter_log_range_lines(log_file, start=None, end=None):
+    """
+    逐行读取日志文件的某个字节区间，start为None时读取整个文件（支持压缩文件）
+
+    Args:
+        log_file: 日志文件路径
+        start: 起始字节偏移
+        end: 结束字节偏移
+
+    Yields:
+        日志行
+    """
+    if start is None:
+        with open_log_file(log_file) as f:
+            yield from f
+    else:
+        yield from read_log_range(log_file, start, end)
+
+
+def count_log_range(log_file, start, end, start_time, end_time):
+    """
+    统计日志文件某一字节范围内、指定时间段内每个IP的POST访问次数
+
+    作为进程池的工作函数，只返回体积很小的Counter，而不是访问记录本身。
+
+    Args:
+        log_file: 日志文件路径
+        start: 起始字节偏移，为None时处理整个文件
+        end: 结束字节偏移
+        start_time: 开始时间
+        end_time: 结束时间
+
+    Returns:
+        IP地址到访问次数的Counter
+    """
+    if start is None:
+        return count_log_file(log_file, start_time, end_time)
+    records = parse_log_lines(read_log_range(log_file, start, end))
+    return count_ips(filter_by_time_range(records, start_time, end_time))
+
+
+def count_log_file(log_file, start_time, end_time):
+    """
+    统计整个日志文件中指定时间段内每个IP的POST访问次数
+
+    压缩文件无法按字节偏移切分，多进程模式下以整个文件作为一个任务。
+
+    Args:
+        log_file: 日志文件路径
+        start_time: 开始时间
+        end_time: 结束时间
+
+    Returns:
+        IP地址到访问次数的Counter
+    """
+    return count_ips(filter_by_time_range(parse_nginx_log(log_file), start_time, end_time))
+
+
+def plan_file_ranges(log_files, start_time, end_time, split_size=None, time_pushdown=True):
+    """
+    确定每个日志文件需要读取的字节区间
+
+    未压缩的日志按时间追加写入，time_pushdown 开启时会跳过时间范围之外的文件，
+    并用二分查找只读取文件中与时间范围相交的那一段。
+
+    Args:
+        log_files: 日志文件路径列表
+        start_time: 开始时间
+        end_time: 结束时间
+        split_size: 按该大小（字节）将区间进一步切分为多个分段，None表示不切分
+        time_pushdown: 是否按时间范围跳过文件并二分定位文件内的区间
+
+    Returns:
+        (日志文件路径, 区间列表) 的列表，压缩文件只能整体顺序读取，区间列表为None
+    """
+    file_ranges = []
+    for log_file in log_files:
+        try:
+            if detect_compression(log_file):
+                file_ranges.append((log_file, None))
+                continue
+            if time_pushdown:
+                window = locate_time_range(log_file, start_time, end_time)
+                if window is None:
+                    print(f"- 跳过 {log_file}: 日志时间不在统计范围内")
+                    continue
+            else:
+                window = (0, os.path.getsize(log_file))
+            if split_size is None:
+                file_ranges.append((log_file, [window]))
+            else:
+                file_ranges.append((log_file, split_log_file(log_file, split_size, *window)))
+        except OSError as e:
+            print(f"处理文件 {log_file} 时出错: {e}")
+    return file_ranges
+
+
+def collect_ip_counts(log_files, start_time, end_time, workers=1, chunk_size=CHUNK_SIZE_MB * 1024 * 1024,
+                      time_pushdown=True):
+    """
+    统计所有日志文件中指定时间段内每个IP的访问次数
+
+    workers 大于1时，将日志文件（以及按换行符对齐切分后的大文件分段）
+    分发给进程池并行处理，最后合并各进程返回的部分计数。
+
+    Args:
+        log_files: 日志文件路径列表
+        start_time: 开始时间
+        end_time: 结束时间
+        workers: 并行进程数，1表示在当前进程中串行处理
+        chunk_size: 大文件切分的分段大小（字节）
+        time_pushdown: 是否按时间范围跳过文件并二分定位文件内的区间
+
+    Returns:
+        IP地址到访问次数的Counter
+    """
+    file_ranges = plan_file_ranges(
+        log_files, start_time, end_time,
+        split_size=chunk_size if workers > 1 else None,
+        time_pushdown=time_pushdown
+    )
+
+    return run_range_tasks(file_ranges, count_log_range, (start_time, end_time), Counter(), workers)
+
+
+def run_range_tasks(file_ranges, task, task_args, result, workers=1):
+    """
+    对每个文件区间执行统计任务并合并结果
+
+    Args:
+        file_ranges: plan_file_ranges 返回的 (日志文件路径, 区间列表) 列表
+        task: 任务函数，调用方式为 task(log_file, start, end, *task_args)，
+              整个文件作为一个任务时 start 和 end 为None；必须是模块级函数以便在进程间传递
+        task_args: 传给任务函数的其余参数
+        result: 用于合并结果的对象，需要支持 update 方法（如Counter）
+        workers: 并行进程数，1表示在当前进程中串行处理
+
+    Returns:
+        合并后的result
+    """
+    if workers <= 1:
+        for log_file, ranges in file_ranges:
+            print(f"正在处理日志文件: {log_file}")
+            try:
+                for start, end in ranges or [(None, None)]:
+                    result.update(task(log_file, start, end, *task_args))
+            except Exception as e:
+                print(f"处理文件 {log_file} 时出错: {e}")
+        return result
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for log_file, ranges in file_ranges:
+            for start, end in ranges or [(None, None)]:
+                futures[executor.submit(task, log_file, start, end, *task_args)] = log_file
+
+        print(f"已将 {len(file_ranges)} 个日志文件拆分为 {len(futures)} 个任务，使用 {workers} 个进程处理")
+
+        for future in as_completed(futures):
+            log_file = futures[future]
+            try:
+                result.update(future.result())
+            except Exception as e:
+                print(f"处理文件 {log_file} 时出错: {e}")
+
+    return result
+
+
+@lru_cache(maxsize=65536)
+def _normalize_path(path):
+    """将路径中的ID片段替换为 {id}（结果缓存）"""
+    return '/'.join('{id}' if ID_SEGMENT_PATTERN.fullmatch(segment) else segment for segment in path.split('/'))
+
+
+def normalize_path(url):
+    """
+    归一化请求URL：去掉查询参数，并把路径中的ID片段替换为 {id}
+
+    例如 /api/users/123/orders?page=2 归一化为 /api/users/{id}/orders
+
+    Args:
+        url: 请求URL
+
+    Returns:
+        归一化后的路径
+    """
+    return _normalize_path(url.split('?', 1)[0])
+
+
+def parse_log_details(lines, include_partial=False):
+    """
+    从日志行中逐条解析访问明细（所有请求方法）
+
+    Args:
+        lines: 可迭代的日志行（字符串）
+        include_partial: 是否同时返回URL、状态码或字节数不完整的行（这些字段为None），
+            使POST访问次数与 parse_log_lines 的口径完全一致
+
+    Yields:
+        AccessDetail 访问明细
+    """
+    match = DETAIL_PATTERN.match
+    search_request_time = REQUEST_TIME_PATTERN.search
+    for line in lines:
+        m = match(line)
+        if m is None:
+            continue
+        ip, time_str, method, url, status, size = m.groups()
+        if status is None and not include_partial:
+            continue
+        try:
+            time_obj = parse_log_time(time_str)
+        except ValueError as e:
+            print(f"时间解析错误: {e}, 原始时间字符串: {time_str}")
+            continue
+        if status is None:
+            yield AccessDetail(ip, time_obj, method, None, None, None, None)
+            continue
+        rt = search_request_time(line, m.end())
+        yield AccessDetail(
+            ip, time_obj, method, normalize_path(url), int(status),
+            0 if size == '-' else int(size),
+            float(rt.group(1)) if rt else None
+        )
+
+
+class LatencyHistogram:
+    """
+    HDR风格的对数分桶延迟直方图
+
+    以微秒为单位，每个2的幂区间再均分为 2**(SUB_BUCKET_BITS-1) 个子桶，
+    分位数的相对误差约为 1/32，桶的数量有上限，内存占用与请求量无关。
+    """
+
+    SUB_BUCKET_BITS = 6
+
+    def __init__(self):
+        self.buckets = Counter()
+        self.count = 0
+        self.max_value = 0
+
+    def add(self, seconds):
+        """
+        记录一次请求耗时
+
+        Args:
+            seconds: 耗时（秒）
+        """
+        micros = int(seconds * 1000000)
+        shift = max(micros.bit_length() - self.SUB_BUCKET_BITS, 0)
+        self.buckets[(shift << self.SUB_BUCKET_BITS) | (micros >> shift)] += 1
+        self.count += 1
+        if micros > self.max_value:
+            self.max_value = micros
+
+    def update(self, other):
+        """合并另一个直方图"""
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.max_value = max(self.max_value, other.max_value)
+
+    def percentile(self, q):
+        """
+        估算分位数
+
+        Args:
+            q: 分位（0~100）
+
+        Returns:
+            耗时（秒），没有数据时返回None
+        """
+        if not self.count:
+            return None
+        target = self.count * q / 100
+        seen = 0
+        mask = (1 << self.SUB_BUCKET_BITS) - 1
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen >= target:
+                shift, sub = key >> self.SUB_BUCKET_BITS, key & mask
+                # 取桶的中点，并且不超过实际最大值
+                low, high = sub << shift, ((sub + 1) << shift) - 1
+                return min((low + high) / 2, self.max_value) / 1000000
+        return self.max_value / 1000000
+
+
+class AccessDetailAggregator:
+    """
+    扩展分析模式的单遍流式聚合器
+
+    按 IP × 接口 × 小时 计数，按接口统计状态码、响应字节数和耗时分布。
+    接口路径经过归一化，IP数量和接口数量都是有限的，内存不随日志行数增长。
+    """
+
+    def __init__(self):
+        self.hourly = Counter()  # (ip, 接口, 小时) -> 请求数
+        self.post_counts = Counter()  # ip -> POST请求数，与基础统计口径一致
+        self.requests = Counter()  # 接口 -> 请求数
+        self.statuses = Counter()  # (接口, 状态码) -> 请求数
+        self.bytes_sent = Counter()  # 接口 -> 响应字节数
+        self.latency = {}  # 接口 -> LatencyHistogram
+
+    def add(self, detail):
+        """
+        聚合一条访问明细
+
+        不完整的行（status为None）只计入POST访问次数，不计入各接口的统计。
+
+        Args:
+            detail: AccessDetail 访问明细
+        """
+        if detail.method == 'POST':
+            self.post_counts[detail.ip] += 1
+        if detail.status is None:
+            return
+        endpoint = f"{detail.method} {detail.path}"
+        self.hourly[(detail.ip, endpoint, detail.time.hour)] += 1
+        self.requests[endpoint] += 1
+        self.statuses[(endpoint, detail.status)] += 1
+        self.bytes_sent[endpoint] += detail.bytes
+        if detail.request_time is not None:
+            histogram = self.latency.get(endpoint)
+            if histogram is None:
+                histogram = self.latency[endpoint] = LatencyHistogram()
+            histogram.add(detail.request_time)
+
+    def update(self, other):
+        """合并另一个聚合器（多进程模式下合并各进程的部分结果）"""
+        self.hourly.update(other.hourly)
+        self.post_counts.update(other.post_counts)
+        self.requests.update(other.requests)
+        self.statuses.update(other.statuses)
+        self.bytes_sent.update(other.bytes_sent)
+        for endpoint, histogram in other.latency.items():
+            self.latency.setdefault(endpoint, LatencyHistogram()).update(histogram)
+
+    def employee_endpoint_hour_matrix(self, employee_info):
+        """
+        生成 员工 × 接口 × 小时 的访问矩阵
+
+        Args:
+            employee_info: 员工信息DataFrame
+
+        Returns:
+            DataFrame，每行为一个员工的一个接口，列为0~23点的请求数及合计；未匹配到员工的IP不计入
+        """
+        hours = list(range(24))
+        columns = ['工号', '姓名', '接口'] + hours + ['合计']
+        if not self.hourly:
+            return pd.DataFrame(columns=columns)
+
+        df = pd.DataFrame(
+            [(ip, endpoint, hour, count) for (ip, endpoint, hour), count in self.hourly.items()],
+            columns=['IP', '接口', '小时', '请求数']
+        )
+        ips = df['IP'].unique()
+        matches = map_ips_to_employees(ips, employee_info)
+        df = df.merge(pd.DataFrame({'IP': ips[matches['pos'].to_numpy()], 'row': matches['row']}), on='IP')
+        if df.empty:
+            return pd.DataFrame(columns=columns)
+
+        matrix = df.pivot_table(index=['row', '接口'], columns='小时', values='请求数', aggfunc='sum', fill_value=0)
+        matrix = matrix.reindex(columns=hours, fill_value=0)
+        matrix['合计'] = matrix.sum(axis=1)
+        matrix = matrix.reset_index()
+
+        employees = employee_info[['工号', '姓名']].reset_index(drop=True)
+        matrix = matrix.join(employees, on='row').sort_values(['row', '合计'], ascending=[True, False])
+        return matrix[columns].reset_index(drop=True)
+
+    def endpoint_summary(self):
+        """
+        生成按接口的统计：请求数、状态码分布、响应字节数和耗时分位数
+
+        Returns:
+            按请求数降序排列的DataFrame
+        """
+        status_classes = Counter()
+        for (endpoint, status), count in self.statuses.items():
+            status_classes[(endpoint, f"{status // 100}xx")] += count
+
+        rows = []
+        for endpoint, total in self.requests.most_common():
+            row = {'接口': endpoint, '请求数': total}
+            for status_class in ('2xx', '3xx', '4xx', '5xx'):
+                row[status_class] = status_classes.get((endpoint, status_class), 0)
+            row['响应字节数'] = self.bytes_sent[endpoint]
+            histogram = self.latency.get(endpoint)
+            for q in (50, 90, 99):
+                row[f'P{q}耗时(秒)'] = histogram.percentile(q) if histogram else None
+            row['最大耗时(秒)'] = histogram.max_value / 1000000 if histogram else None
+            rows.append(row)
+
+        return pd.DataFrame(rows, columns=[
+            '接口', '请求数', '2xx', '3xx', '4xx', '5xx', '响应字节数',
+            'P50耗时(秒)', 'P90耗时(秒)', 'P99耗时(秒)', '最大耗时(秒)'
+        ])
+
+
+def analyze_log_range(log_file, start, end, start_time, end_time):
+    """
+    对日志文件的某个字节区间做扩展分析
+
+    Args:
+        log_file: 日志文件路径
+        start: 起始字节偏移，为None时处理整个文件
+        end: 结束字节偏移
+        start_time: 开始时间
+        end_time: 结束时间
+
+    Returns:
+        AccessDetailAggregator 聚合结果
+    """
+    aggregator = AccessDetailAggregator()
+    details = parse_log_details(iter_log_range_lines(log_file, start, end), include_partial=True)
+    for detail in filter_by_time_range(details, start_time, end_time):
+        aggregator.add(detail)
+    return aggregator
+
+
+def analyze_log_details(log_files, start_time, end_time, workers=1, chunk_size=CHUNK_SIZE_MB * 1024 * 1024,
+                        time_pushdown=True):
+    """
+    单遍流式扩展分析：员工 × 接口 × 小时 访问矩阵、状态码、响应字节数和耗时分位数
+
+    Args:
+        log_files: 日志文件路径列表
+        start_time: 开始时间
+        end_time: 结束时间
+        workers: 并行进程数，1表示在当前进程中串行处理
+        chunk_size: 大文件切分的分段大小（字节）
+        time_pushdown: 是否按时间范围跳过文件并二分定位文件内的区间
+
+    Returns:
+        AccessDetailAggregator 聚合结果
+    """
+    file_ranges = plan_file_ranges(
+        log_files, start_time, end_time,
+        split_size=chunk_size if workers > 1 else None,
+        time_pushdown=time_pushdown
+    )
+    return run_range_tasks(file_ranges, analyze_log_range, (start_time, end_time), AccessDetailAggregator(), workers)
+
+
+class EmployeeIpMatcher:
+    """
+    逐条判断IP属于哪些员工，用于流式处理（批量场景请使用 map_ips_to_employees）
+
+    每种前缀长度一个 网段地址 -> 员工行号 的字典，从最长的前缀开始查找（最长前缀匹配），
+    与 map_ips_to_employees 的结果一致。结果按IP缓存。
+    """
+
+    def __init__(self, employee_info):
+        """
+        Args:
+            employee_info: 员工信息DataFrame
+        """
+        entries = expand_employee_ips(employee_info)
+        self.prefixes = []
+        for prefixlen, networks in sorted(entries.groupby('prefixlen'), reverse=True):
+            table = {}
+            for network, row in zip(networks['network'].tolist(), networks['row'].tolist()):
+                table.setdefault(network, []).append(row)
+            self.prefixes.append((_prefix_mask(prefixlen), {network: tuple(rows) for network, rows in table.items()}))
+        self.match = lru_cache(maxsize=65536)(self._match)
+
+    def _match(self, ip):
+        """
+        Args:
+            ip: IPv4地址字符串
+
+        Returns:
+            员工所在行号的元组，未匹配到员工时为空元组
+        """
+        try:
+            value = int(ipaddress.IPv4Address(ip))
+        except ValueError:
+            return ()
+        for mask, table in self.prefixes:
+            rows = table.get(value & mask)
+            if rows is not None:
+                return rows
+        return ()
+
+
+@lru_cache(maxsize=65536)
+def _hash64(item):
+    """返回字符串的64位哈希值（结果缓存）"""
+    return int.from_bytes(hashlib.blake2b(item.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    """
+    HyperLogLog 基数估计
+
+    使用 2**precision 个寄存器（默认16KB），标准误差约为 1.04/sqrt(2**precision)，
+    precision=14 时约为0.8%。
+    """
+
+    def __init__(self, precision=14):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, item):
+        """
+        记录一个元素
+
+        Args:
+            item: 字符串元素
+        """
+        h = _hash64(item)
+        rest_bits = 64 - self.precision
+        idx = h >> rest_bits
+        rank = rest_bits - (h & ((1 << rest_bits) - 1)).bit_length() + 1
+        if rank > self.registers[idx]:
+            self.registers[idx] = rank
+
+    def update(self, other):
+        """合并另一个（相同精度的）HyperLogLog"""
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        """
+        Returns:
+            不同元素个数的估计值
+        """
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # 小基数时使用线性计数修正
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+class CountMinSketch:
+    """
+    Count-Min Sketch 频次估计
+
+    估计值只会偏大，误差不超过 总数 × e / width（概率 1 - exp(-depth)）。
+    """
+
+    def __init__(self, width=4096, depth=4):
+        self.width = width
+        self.depth = depth
+        self.table = [[0] * width for _ in range(depth)]
+
+    def _indexes(self, item):
+        h = _hash64(item)
+        h1, h2 = h & 0xffffffff, h >> 32
+        return [(h1 + i * h2) % self.width for i in range(self.depth)]
+
+    def add(self, item, count=1):
+        """
+        记录元素出现count次，并返回该元素当前的频次估计
+
+        Args:
+            item: 字符串元素
+            count: 次数
+
+        Returns:
+            频次估计值
+        """
+        estimate = None
+        for row, idx in zip(self.table, self._indexes(item)):
+            row[idx] += count
+            if estimate is None or row[idx] < estimate:
+                estimate = row[idx]
+        return estimate
+
+    def estimate(self, item):
+        """返回元素的频次估计值"""
+        return min(row[idx] for row, idx in zip(self.table, self._indexes(item)))
+
+    def update(self, other):
+        """合并另一个（相同尺寸的）Count-Min Sketch"""
+        for row, other_row in zip(self.table, other.table):
+            for idx, value in enumerate(other_row):
+                if value:
+                    row[idx] += value
+
+
+class HeavyHitters:
+    """
+    基于Count-Min Sketch的Top-K高频元素
+
+    只保留K个候选元素及其频次估计；新元素的估计值超过当前最小候选时才替换，
+    内存占用与不同元素的个数无关。
+
+    候选的最小值用最小堆维护：候选的估计值变化时压入新条目，旧条目在到达堆顶时
+    丢弃（估计值只增不减，过期条目一定比当前值小），堆过大时按候选集合重建。
+    """
+
+    def __init__(self, k=TOP_K, width=4096, depth=4):
+        self.k = k
+        self.sketch = CountMinSketch(width, depth)
+        self.candidates = {}
+        self.heap = []  # (估计值, 元素)，可能包含过期条目
+
+    def add(self, item, count=1):
+        """
+        记录元素出现count次
+
+        Args:
+            item: 字符串元素
+            count: 次数
+        """
+        estimate = self.sketch.add(item, count)
+        candidates = self.candidates
+        if item not in candidates and len(candidates) >= self.k:
+            if estimate <= self._min_count():
+                return
+            del candidates[heapq.heappop(self.heap)[1]]
+        candidates[item] = estimate
+        heapq.heappush(self.heap, (estimate, item))
+        if len(self.heap) > 4 * self.k:
+            self._rebuild_heap()
+
+    def _min_count(self):
+        """丢弃堆顶的过期条目，返回候选中的最小估计值"""
+        heap, candidates = self.heap, self.candidates
+        while candidates.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+        return heap[0][0]
+
+    def _rebuild_heap(self):
+        """按当前候选集合重建堆"""
+        self.heap = [(estimate, item) for item, estimate in self.candidates.items()]
+        heapq.heapify(self.heap)
+
+    def update(self, other):
+        """合并另一个HeavyHitters，候选集合并后按合并后的估计值重新取Top-K"""
+        self.sketch.update(other.sketch)
+        merged = set(self.candidates) | set(other.candidates)
+        estimates = {item: self.sketch.estimate(item) for item in merged}
+        self.candidates = dict(sorted(estimates.items(), key=lambda kv: kv[1], reverse=True)[:self.k])
+        self._rebuild_heap()
+
+    def top(self):
+        """
+        Returns:
+            (元素, 频次估计) 列表，按频次降序
+        """
+        return sorted(self.candidates.items(), key=lambda kv: kv[1], reverse=True)
+
+
+class UnmappedIpAggregator:
+    """
+    统计未在员工信息中登记的IP：Top-K高频IP、每天的独立IP数和访问次数
+
+    使用 Count-Min Sketch 和 HyperLogLog，内存占用与日志行数和IP数量都无关。
+    """
+
+    def __init__(self, k=TOP_K):
+        self.heavy_hitters = HeavyHitters(k)
+        self.daily_distinct = {}  # 日期 -> HyperLogLog
+        self.daily_requests = Counter()  # 日期 -> 访问次数
+        self.total_distinct = HyperLogLog()
+
+    def add(self, record):
+        """
+        记录一条未匹配到员工的访问
+
+        Args:
+            record: AccessRecord 访问记录
+        """
+        day = record.time.date()
+        self.heavy_hitters.add(record.ip)
+        self.daily_requests[day] += 1
+        hll = self.daily_distinct.get(day)
+        if hll is None:
+            hll = self.daily_distinct[day] = HyperLogLog()
+        hll.add(record.ip)
+        self.total_distinct.add(record.ip)
+
+    def update(self, other):
+        """合并另一个聚合器"""
+        self.heavy_hitters.update(other.heavy_hitters)
+        self.daily_requests.update(other.daily_requests)
+        for day, hll in other.daily_distinct.items():
+            if day in self.daily_distinct:
+                self.daily_distinct[day].update(hll)
+            else:
+                self.daily_distinct[day] = hll
+        self.total_distinct.update(other.total_distinct)
+
+    def top_ips(self):
+        """
+        Returns:
+            未匹配IP的Top-K DataFrame（访问次数为估计值，可能略微偏大）
+        """
+        return pd.DataFrame(self.heavy_hitters.top(), columns=['IP', '访问次数(估计)'])
+
+    def daily_summary(self):
+        """
+        Returns:
+            按天的未匹配IP统计DataFrame
+        """
+        return pd.DataFrame(
+            [(day, self.daily_distinct[day].count(), self.daily_requests[day]) for day in sorted(self.daily_requests)],
+            columns=['日期', '独立IP数(估计)', '访问次数']
+        )
+
+
+def sketch_unmapped_range(log_file, start, end, start_time, end_time, employee_info, top_k=TOP_K):
+    """
+    统计日志文件某个字节区间内未匹配到员工的POST访问
+
+    Args:
+        log_file: 日志文件路径
+        start: 起始字节偏移，为None时处理整个文件
+        end: 结束字节偏移
+        start_time: 开始时间
+        end_time: 结束时间
+        employee_info: 员工信息DataFrame
+        top_k: 输出访问次数最多的IP个数
+
+    Returns:
+        UnmappedIpAggregator 聚合结果
+    """
+    if start is None:
+        records = parse_nginx_log(log_file)
+    else:
+        records = parse_log_lines(read_log_range(log_file, start, end))
+
+    match = EmployeeIpMatcher(employee_info).match
+    aggregator = UnmappedIpAggregator(top_k)
+    for record in filter_by_time_range(records, start_time, end_time):
+        if not match(record.ip):
+            aggregator.add(record)
+    return aggregator
+
+
+def analyze_unmapped_ips(log_files, start_time, end_time, employee_info, top_k=TOP_K, workers=1,
+                         chunk_size=CHUNK_SIZE_MB * 1024 * 1024, time_pushdown=True):
+    """
+    流式统计未在员工信息中登记的IP的高频IP和每天的独立IP数
+
+    Args:
+        log_files: 日志文件路径列表
+        start_time: 开始时间
+        end_time: 结束时间
+        employee_info: 员工信息DataFrame
+        top_k: 输出访问次数最多的IP个数
+        workers: 并行进程数，1表示在当前进程中串行处理
+        chunk_size: 大文件切分的分段大小（字节）
+        time_pushdown: 是否按时间范围跳过文件并二分定位文件内的区间
+
+    Returns:
+        UnmappedIpAggregator 聚合结果
+    """
+    file_ranges = plan_file_ranges(
+        log_files, start_time, end_time,
+        split_size=chunk_size if workers > 1 else None,
+        time_pushdown=time_pushdown
+    )
+    return run_range_tasks(
+        file_ranges, sketch_unmapped_range,
+        (start_time, end_time, employee_info, top_k),
+        UnmappedIpAggregator(top_k), workers
+    )
+
+
+class RollingWindowCounter:
+    """
+    基于环形缓冲区的滑动窗口计数器
+
+    窗口被划分为固定数量的桶，每个桶记录一个时间片内的计数；时间前进时复用过期的桶，
+    内存占用固定，统计结果的时间精度为一个桶的长度。
+    """
+
+    def __init__(self, window_seconds, bucket_seconds):
+        """
+        Args:
+            window_seconds: 窗口长度（秒）
+            bucket_seconds: 每个桶的时间长度（秒）
+        """
+        self.bucket_seconds = bucket_seconds
+        self.size = window_seconds // bucket_seconds
+        self.buckets = [Counter() for _ in range(self.size)]
+        self.bucket_ids = [None] * self.size
+
+    def add(self, key, timestamp, count=1):
+        """
+        记录一次计数
+
+        Args:
+            key: 计数的键
+            timestamp: Unix时间戳（秒）
+            count: 次数
+        """
+        bucket_id = int(timestamp) // self.bucket_seconds
+        idx = bucket_id % self.size
+        if self.bucket_ids[idx] != bucket_id:
+            if self.bucket_ids[idx] is not None and self.bucket_ids[idx] > bucket_id:
+                return  # 比窗口还早的乱序记录，直接忽略
+            self.buckets[idx] = Counter()
+            self.bucket_ids[idx] = bucket_id
+        self.buckets[idx][key] += count
+
+    def totals(self, now):
+        """
+        统计截止到now的窗口内每个键的计数
+
+        Args:
+            now: Unix时间戳（秒）
+
+        Returns:
+            键到计数的Counter
+        """
+        current = int(now) // self.bucket_seconds
+        result = Counter()
+        for bucket_id, bucket in zip(self.bucket_ids, self.buckets):
+            if bucket_id is not None and current - self.size < bucket_id <= current:
+                result.update(bucket)
+        return result
+
+
+class LogFollower:
+    """
+    持续读取正在写入的日志文件（类似 tail -F）
+
+    通过inode变化识别logrotate轮转：先读完旧文件的剩余内容再切换到新文件；
+    文件被截断时从头开始读取。未以换行结束的半行会留到下次读取。
+    """
+
+    def __init__(self, log_file, from_start=False):
+        """
+        Args:
+            log_file: 日志文件路径
+            from_start: 是否从文件开头读取，默认只读取启动之后新写入的内容
+        """
+        self.log_file = log_file
+        self.file = None
+        self.inode = None
+        self.partial = b''
+        self._open(from_start)
+
+    def _open(self, from_start):
+        try:
+            self.file = open(self.log_file, 'rb')
+        except FileNotFoundError:
+            self.file = None
+            return
+        self.inode = os.fstat(self.file.fileno()).st_ino
+        self.partial = b''
+        if not from_start:
+            self.file.seek(0, os.SEEK_END)
+
+    def read_new_lines(self):
+        """
+        读取自上次调用以来新写入的完整行
+
+        Returns:
+            解码后的日志行列表，没有新内容时为空列表
+        """
+        if self.file is None:
+            self._open(from_start=True)
+            if self.file is None:
+                return []
+
+        lines = self._drain()
+        try:
+            st = os.stat(self.log_file)
+        except FileNotFoundError:
+            return lines  # 轮转过程中新文件尚未创建
+
+        if st.st_ino != self.inode:
+            # 已轮转：旧文件读完后切换到新文件，从头读取
+            lines.extend(self._drain())
+            self.file.close()
+            self._open(from_start=True)
+            lines.extend(self._drain())
+        elif st.st_size < self.file.tell():
+            # 文件被截断（copytruncate）
+            self.file.seek(0)
+            self.partial = b''
+            lines.extend(self._drain())
+        return lines
+
+    def _drain(self):
+        """读取当前文件中所有新增的完整行"""
+        data = self.file.read()
+        if not data:
+            return []
+        data = self.partial + data
+        end = data.rfind(b'\n') + 1
+        self.partial = data[end:]
+        return data[:end].decode('utf-8', errors='replace').splitlines(keepends=True)
+
+    def close(self):
+        """关闭日志文件"""
+        if self.file is not None:
+            self.file.close()
+
+
+class LiveAccessCounter:
+    """
+    实时模式下按员工统计最近1分钟、1小时、1天的POST访问次数
+    """
+
+    # 窗口名称 -> (窗口长度, 桶长度)，单位为秒
+    WINDOWS = {
+        '最近1分钟': (60, 1),
+        '最近1小时': (3600, 60),
+        '最近1天': (86400, 900),
+    }
+
+    def __init__(self, employee_info):
+        """
+        Args:
+            employee_info: 员工信息DataFrame
+        """
+        self.employee_info = employee_info
+        self.match = EmployeeIpMatcher(employee_info).match
+        self.windows = {
+            name: RollingWindowCounter(window, bucket) for name, (window, bucket) in self.WINDOWS.items()
+        }
+        self.latest = None
+
+    def add(self, record):
+        """
+        记录一条访问，未匹配到员工的IP不计入
+
+        Args:
+            record: AccessRecord 访问记录
+        """
+        rows = self.match(record.ip)
+        if not rows:
+            return
+        timestamp = record.time.timestamp()
+        for window in self.windows.values():
+            for row in rows:
+                window.add(row, timestamp)
+        if self.latest is None or timestamp > self.latest:
+            self.latest = timestamp
+
+    def snapshot(self, now=None):
+        """
+        生成截止到当前时间的滑动窗口统计
+
+        日志停止写入后窗口内的计数会随时间归零；时钟偏差导致最新记录晚于当前时间时，
+        以最新记录的时间为准。
+
+        Args:
+            now: 统计截止时间的Unix时间戳（与记录一样按北京时间平移8小时），默认为当前时间
+
+        Returns:
+            员工实时访问统计DataFrame
+        """
+        if now is None:
+            now = time.time() + BEIJING_OFFSET.total_seconds()
+        if self.latest is not None:
+            now = max(now, self.latest)
+        result = self.employee_info[['工号', '姓名', 'IP']].reset_index(drop=True)
+        for name, window in self.windows.items():
+            totals = window.totals(now)
+            result[name] = [totals.get(row, 0) for row in range(len(result))]
+        result['统计时间'] = datetime.fromtimestamp(now, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        return result
+
+
+def write_snapshot(df, snapshot_file):
+    """
+    原子地写入快照文件，按扩展名选择CSV或Excel格式
+
+    Args:
+        df: 要写入的DataFrame
+        snapshot_file: 快照文件路径
+    """
+    root, ext = os.path.splitext(snapshot_file)
+    temp_file = f"{root}.tmp{ext}"
+    if ext.lower() == '.csv':
+        df.to_csv(temp_file, index=False, encoding='utf-8-sig')
+    else:
+        df.to_excel(temp_file, index=False)
+    os.replace(temp_file, snapshot_file)
+
+
+def follow_log(log_file, employee_info, snapshot_file, flush_interval=FLUSH_INTERVAL, poll_interval=1.0,
+               from_start=False):
+    """
+    实时跟踪正在写入的访问日志，按员工维护滑动窗口计数，并定期写出快照
+
+    按 Ctrl+C 结束，结束前会写出最后一次快照。
+
+    Args:
+        log_file: 正在写入的访问日志路径
+        employee_info: 员工信息DataFrame
+        snapshot_file: 快照文件路径（.csv 或 .xlsx）
+        flush_interval: 写快照的间隔（秒）
+        poll_interval: 没有新内容时的轮询间隔（秒）
+        from_start: 是否从文件开头读取
+    """
+    follower = LogFollower(log_file, from_start)
+    counter = LiveAccessCounter(employee_info)
+    next_flush = time.monotonic() + flush_interval
+    print(f"正在跟踪日志 {log_file}，每 {flush_interval} 秒写入快照 {snapshot_file}（按 Ctrl+C 结束）")
+
+    try:
+        while True:
+            lines = follower.read_new_lines()
+            for record in parse_log_lines(lines):
+                counter.add(record)
+
+            if time.monotonic() >= next_flush:
+                write_snapshot(counter.snapshot(), snapshot_file)
+                next_flush = time.monotonic() + flush_interval
+
+            if not lines:
+                time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("已停止跟踪日志")
+    finally:
+        follower.close()
+        write_snapshot(counter.snapshot(), snapshot_file)
+        print(f"快照已保存到 {snapshot_file}")
+
+
+# 列式存储中可用于分组的维度
+PARQUET_GROUP_KEYS = ('employee', 'ip', 'date', 'hour', 'method', 'path', 'status')
+
+
+def _require_pyarrow():
+    """未安装pyarrow时给出明确的错误提示"""
+    if pa is None:
+        raise ValueError("导出或查询Parquet需要安装 pyarrow: pip install pyarrow")
+
+
+def _write_parquet_batch(columns, output_dir, batch_no):
+    """
+    将一批访问明细按日期分区写入Parquet
+
+    Args:
+        columns: 列名到值列表的字典
+        output_dir: Parquet数据集目录
+        batch_no: 批次号，与进程号、时间一起生成不重复的文件名
+    """
+    table = pa.table({
+        'date': pa.array(columns['date'], pa.string()),
+        'ip': pa.array(columns['ip'], pa.string()).dictionary_encode(),
+        'time': pa.array(columns['time'], pa.int64()),
+        'hour': pa.array(columns['hour'], pa.int8()),
+        'method': pa.array(columns['method'], pa.string()).dictionary_encode(),
+        'path': pa.array(columns['path'], pa.string()).dictionary_encode(),
+        'status': pa.array(columns['status'], pa.int16()),
+        'bytes': pa.array(columns['bytes'], pa.int64()),
+        'request_time': pa.array(columns['request_time'], pa.float32()),
+    })
+    pa_dataset.write_dataset(
+        table, output_dir,
+        format='parquet',
+        partitioning=pa_dataset.partitioning(pa.schema([('date', pa.string())]), flavor='hive'),
+        basename_template=f"part-{os.getpid()}-{int(time.time())}-{batch_no}-{{i}}.parquet",
+        existing_data_behavior='overwrite_or_ignore'
+    )
+
+
+def _delete_parquet_range(output_dir, start_ts, end_ts):
+    """
+    从已有的Parquet数据集中删除时间在 [start_ts, end_ts] 内的记录
+
+    重新导出重叠的时间范围前调用，使同一条访问不会被导出两次。
+    只检查可能包含该时间范围的日期分区，没有命中记录的文件保持不变。
+
+    Args:
+        output_dir: Parquet数据集目录
+        start_ts: 开始时间的Unix时间戳（秒）
+        end_ts: 结束时间的Unix时间戳（秒）
+
+    Returns:
+        删除的记录条数
+    """
+    if not os.path.isdir(output_dir):
+        return 0
+    # 与 query_parquet 一样，分区日期的边界向外放宽一天
+    start_date = (datetime.fromtimestamp(start_ts, timezone.utc) - timedelta(days=1)).strftime('%Y-%m-%d')
+    end_date = (datetime.fromtimestamp(end_ts, timezone.utc) + timedelta(days=1)).strftime('%Y-%m-%d')
+    in_range = (pa_dataset.field('time') >= start_ts) & (pa_dataset.field('time') <= end_ts)
+
+    deleted = 0
+    for name in sorted(os.listdir(output_dir)):
+        partition = os.path.join(output_dir, name)
+        if not name.startswith('date=') or not start_date <= name[5:] <= end_date or not os.path.isdir(partition):
+            continue
+        for file_name in sorted(os.listdir(partition)):
+            path = os.path.join(partition, file_name)
+            fragment = pa_dataset.dataset(path, format='parquet')
+            matched = fragment.count_rows(filter=in_range)
+            if not matched:
+                continue
+            remaining = fragment.to_table(filter=~in_range)
+            if remaining.num_rows:
+                temp_path = f"{path}.tmp"
+                pq.write_table(remaining, temp_path)
+                os.replace(temp_path, path)
+            else:
+                os.unlink(path)
+            deleted += matched
+    return deleted
+
+
+def export_parquet(log_files, output_dir, start_time, end_time, batch_size=PARQUET_BATCH_SIZE, time_pushdown=True):
+    """
+    将时间范围内的访问明细写入按日期分区的Parquet数据集
+
+    IP、请求方法和路径使用字典编码，时间保存为int64的Unix时间戳（秒），
+    之后的各种分组统计可以直接对列式数据做向量化扫描，不必重新解析文本日志。
+    数据集中已有的、落在本次时间范围内的记录会先被删除，重复导出不会产生重复行。
+
+    Args:
+        log_files: 日志文件路径列表
+        output_dir: Parquet数据集目录（按 date=YYYY-MM-DD 分区）
+        start_time: 开始时间
+        end_time: 结束时间
+        batch_size: 每批写入的记录数，决定导出时的内存占用
+        time_pushdown: 是否按时间范围跳过文件并二分定位文件内的区间
+
+    Returns:
+        导出的记录条数
+    """
+    _require_pyarrow()
+    file_ranges = plan_file_ranges(log_files, start_time, end_time, time_pushdown=time_pushdown)
+
+    _delete_parquet_range(output_dir, int(start_time.timestamp()), int(end_time.timestamp()))
+
+    names = ('date', 'ip', 'time', 'hour', 'method', 'path', 'status', 'bytes', 'request_time')
+    columns = {name: [] for name in names}
+    exported = 0
+    batch_no = 0
+
+    for log_file, ranges in file_ranges:
+        print(f"正在导出日志文件: {log_file}")
+        try:
+            for start, end in ranges or [(None, None)]:
+                details = parse_log_details(iter_log_range_lines(log_file, start, end))
+                for detail in filter_by_time_range(details, start_time, end_time):
+                    columns['date'].append(detail.time.strftime('%Y-%m-%d'))
+                    columns['ip'].append(detail.ip)
+                    columns['time'].append(int(detail.time.timestamp()))
+                    # 小时与日期一样按记录时间取，与 --detailed 的员工×接口×小时矩阵一致
+                    columns['hour'].append(detail.time.hour)
+                    columns['method'].append(detail.method)
+                    columns['path'].append(detail.path)
+                    columns['status'].append(detail.status)
+                    columns['bytes'].append(detail.bytes)
+                    columns['request_time'].append(detail.request_time)
+                    if len(columns['ip']) >= batch_size:
+                        _write_parquet_batch(columns, output_dir, batch_no)
+                        exported += len(columns['ip'])
+                        batch_no += 1
+                        columns = {name: [] for name in names}
+        except Exception as e:
+            print(f"导出文件 {log_file} 时出错: {e}")
+
+    if columns['ip']:
+        _write_parquet_batch(columns, output_dir, batch_no)
+        exported += len(columns['ip'])
+
+    return exported
+
+
+def query_parquet(output_dir, start_time, end_time, group_by=('employee',), employee_info=None, methods=None):
+    """
+    在Parquet数据集上按维度分组统计访问次数
+
+    按日期分区和时间列做谓词下推，只读取分组需要的列。
+
+    Args:
+        output_dir: export_parquet 写出的Parquet数据集目录
+        start_time: 开始时间
+        end_time: 结束时间
+        group_by: 分组维度，可选 employee、ip、date、hour、method、path、status
+        employee_info: 员工信息DataFrame，按 employee 分组时必须提供
+        methods: 只统计这些请求方法（如 ['POST']），None表示统计所有方法
+
+    Returns:
+        分组统计DataFrame，按访问次数降序排列
+
+    Raises:
+        ValueError: 分组维度无效，或按员工分组时没有提供员工信息
+    """
+    _require_pyarrow()
+    group_by = list(group_by)
+    invalid = [key for key in group_by if key not in PARQUET_GROUP_KEYS]
+    if invalid:
+        raise ValueError(f"无效的分组维度: {invalid}，可选: {PARQUET_GROUP_KEYS}")
+    if 'employee' in group_by and employee_info is None:
+        raise ValueError("按员工分组时需要提供员工信息")
+
+    dataset = pa_dataset.dataset(output_dir, format='parquet', partitioning='hive')
+    start_ts, end_ts = int(start_time.timestamp()), int(end_time.timestamp())
+    # 分区日期按记录时间的日期划分，用于裁剪分区的边界向外放宽一天以免漏掉跨时区的记录
+    start_date = (datetime.fromtimestamp(start_ts, timezone.utc) - timedelta(days=1)).strftime('%Y-%m-%d')
+    end_date = (datetime.fromtimestamp(end_ts, timezone.utc) + timedelta(days=1)).strftime('%Y-%m-%d')
+    condition = (
+        (pa_dataset.field('date') >= start_date)
+        & (pa_dataset.field('date') <= end_date)
+        & (pa_dataset.field('time') >= start_ts)
+        & (pa_dataset.field('time') <= end_ts)
+    )
+    if methods:
+        condition = condition & pa_dataset.field('method').isin(list(methods))
+
+    needed = {'ip' if key == 'employee' else key for key in group_by}
+    df = dataset.to_table(columns=sorted(needed | {'time'}), filter=condition).to_pandas()
+
+    for key in ('ip', 'method', 'path', 'date'):
+        if key in df and isinstance(df[key].dtype, pd.CategoricalDtype):
+            df[key] = df[key].astype(object)
+
+    keys = list(group_by)
+    if 'employee' in group_by:
+        ips = df['ip'].unique()
+        matches = map_ips_to_employees(ips, employee_info)
+        df = df.merge(pd.DataFrame({'ip': ips[matches['pos'].to_numpy()], 'row': matches['row']}), on='ip')
+        keys[keys.index('employee')] = 'row'
+
+    if not keys:
+        return pd.DataFrame({'访问次数': [len(df)]})
+
+    result = df.groupby(keys, observed=True).size().rename('访问次数').reset_index()
+    if 'employee' in group_by:
+        employees = employee_info[['工号', '姓名']].reset_index(drop=True)
+        result = result.join(employees, on='row')
+        key_columns = [column for key in keys for column in (['工号', '姓名'] if key == 'row' else [key])]
+        result = result[key_columns + ['访问次数']]
+    return result.sort_values('访问次数', ascending=False).reset_index(drop=True)
+
+
+class LogAggregateStore:
+    """
+    nginx日志按小时聚合的本地持久化索引（SQLite）
+
+    以 路径、inode、大小、修改时间 识别每个日志文件，保存每个文件中
+    每个IP每小时的POST访问次数。再次运行时只解析新增的文件和文件新增的部分
+    （从上次读取到的字节偏移继续），任意时间范围的统计直接由小时聚合结果求和得到。
+    每小时还单独记录恰好落在整点的访问次数，使整点的结束时间与
+    filter_by_time_range 一样包含端点；不在整点的起止时间所在的不完整小时
+    从日志文件中按时间二分定位后读取，统计结果与直接扫描日志一致。
+    """
+
+    def __init__(self, db_path):
+        """
+        打开（或创建）聚合索引
+
+        Args:
+            db_path: SQLite数据库文件路径
+        """
+        self.db_path = db_path
+        self.conn = sqlite3.connect(db_path)
+        if self.conn.execute('PRAGMA user_version').fetchone()[0] != INDEX_SCHEMA_VERSION:
+            # 旧版本的索引缺少整点计数，丢弃后在下次sync时重新解析
+            self.conn.executescript(f"""
+                DROP TABLE IF EXISTS hourly_counts;
+                DROP TABLE IF EXISTS log_files;
+                PRAGMA user_version = {INDEX_SCHEMA_VERSION};
+            """)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS log_files (
+                id INTEGER PRIMARY KEY,
+                path TEXT NOT NULL,
+                inode INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                offset INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS hourly_counts (
+                file_id INTEGER NOT NULL,
+                hour INTEGER NOT NULL,
+                ip TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                on_hour INTEGER NOT NULL,
+                PRIMARY KEY (file_id, hour, ip)
+            );
+            CREATE INDEX IF NOT EXISTS idx_hourly_counts_hour ON hourly_counts (hour);
+        """)
+
+    def close(self):
+        """关闭数据库连接"""
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def sync(self, log_files):
+        """
+        让索引与当前的日志文件保持一致
+
+        - 未变化的文件直接跳过
+        - 同一inode且变大的未压缩文件从上次的偏移继续解析
+        - 被logrotate重命名的文件（inode相同、路径改变）只更新路径
+        - 被替换或截断的文件重新解析，已不存在的文件从索引中删除
+
+        Args:
+            log_files: 当前的日志文件路径列表
+
+        Returns:
+            本次新解析的访问记录条数
+        """
+        rows = self.conn.execute('SELECT id, path, inode, size, mtime_ns, offset FROM log_files').fetchall()
+        rows_by_path = {row[1]: row for row in rows}
+        rows_by_inode = {row[2]: row for row in rows}
+
+        parsed = 0
+        claimed = set()
+        for log_file in log_files:
+            try:
+                st = os.stat(log_file)
+            except OSError as e:
+                print(f"更新索引时处理文件 {log_file} 出错: {e}")
+                continue
+
+            row = rows_by_path.get(log_file)
+            if row is None or row[2] != st.st_ino or row[0] in claimed:
+                # logrotate重命名后inode不变，沿用原记录并更新路径
+                row = rows_by_inode.get(st.st_ino)
+                if row is not None and row[0] in claimed:
+                    row = None
+                if row is not None:
+                    self.conn.execute('UPDATE log_files SET path = ? WHERE id = ?', (log_file, row[0]))
+
+            try:
+                file_id, file_parsed = self._update_file(log_file, st, row)
+                self.conn.commit()
+                claimed.add(file_id)
+                parsed += file_parsed
+            except (OSError, ValueError) as e:
+                self.conn.rollback()
+                if row is not None:
+                    claimed.add(row[0])
+                print(f"更新索引时处理文件 {log_file} 出错: {e}")
+
+        # 删除已经不存在的文件的聚合结果
+        for row in rows:
+            if row[0] not in claimed:
+                self._delete_file(row[0])
+        self.conn.commit()
+
+        return parsed
+
+    def _update_file(self, log_file, st, row):
+        """
+        增量解析单个日志文件并写入聚合结果
+
+        Args:
+            log_file: 日志文件路径
+            st: 文件的os.stat结果
+            row: 索引中该文件的已有记录，没有时为None
+
+        Returns:
+            (文件记录id, 本次新解析的访问记录条数) 元组
+        """
+        if row is not None and row[3] == st.st_size and row[4] == st.st_mtime_ns:
+            return row[0], 0
+
+        compressed = st.st_size > 0 and detect_compression(log_file) is not None
+        if row is not None and not compressed and st.st_size >= row[3]:
+            file_id, start = row[0], row[5]
+        else:
+            # 新文件、被截断或替换的文件：清除旧结果后从头解析
+            if row is not None:
+                self._delete_file(row[0])
+            file_id = self.conn.execute(
+                'INSERT INTO log_files (path, inode, size, mtime_ns, offset) VALUES (?, ?, 0, 0, 0)',
+                (log_file, st.st_ino)
+            ).lastrowid
+            start = 0
+
+        if compressed:
+            records = parse_nginx_log(log_file)
+            end = st.st_size
+        else:
+            # 只处理到最后一个完整的行，正在写入的半行留到下次
+            end = _last_line_end(log_file, st.st_size)
+            records = parse_log_lines(read_log_range(log_file, start, end))
+
+        hourly = Counter()
+        on_hour = Counter()
+        for record in records:
+            timestamp = int(record.time.timestamp())
+            key = (timestamp // 3600 * 3600, record.ip)
+            hourly[key] += 1
+            if timestamp % 3600 == 0:
+                on_hour[key] += 1
+        self.conn.executemany(
+            'INSERT INTO hourly_counts (file_id, hour, ip, count, on_hour) VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT (file_id, hour, ip) DO UPDATE SET '
+            'count = count + excluded.count, on_hour = on_hour + excluded.on_hour',
+            ((file_id, hour, ip, count, on_hour[(hour, ip)]) for (hour, ip), count in hourly.items())
+        )
+        self.conn.execute(
+            'UPDATE log_files SET inode = ?, size = ?, mtime_ns = ?, offset = ? WHERE id = ?',
+            (st.st_ino, st.st_size, st.st_mtime_ns, end, file_id)
+        )
+
+        parsed = sum(hourly.values())
+        print(f"- 索引 {log_file}: 从偏移 {start} 起新增 {parsed} 条记录")
+        return file_id, parsed
+
+    def _delete_file(self, file_id):
+        """删除一个文件及其聚合结果"""
+        self.conn.execute('DELETE FROM hourly_counts WHERE file_id = ?', (file_id,))
+        self.conn.execute('DELETE FROM log_files WHERE id = ?', (file_id,))
+
+    def query_ip_counts(self, start_time, end_time):
+        """
+        统计时间范围内每个IP的访问次数
+
+        结果与 filter_by_time_range 一样包含两个端点，与直接扫描日志的统计一致，
+        时间范围不必按整点对齐（见 _range_counts）。
+
+        Args:
+            start_time: 开始时间
+            end_time: 结束时间
+
+        Returns:
+            IP地址到访问次数的Counter
+        """
+        ip_counts = Counter()
+        for _, ip, count in self._range_counts(start_time, end_time):
+            ip_counts[ip] += count
+        return ip_counts
+
+    def query_daily_counts(self, start_time, end_time):
+        """
+        按天统计时间范围内每个IP的访问次数
+
+        Args:
+            start_time: 开始时间
+            end_time: 结束时间
+
+        Returns:
+            包含 日期、IP、访问次数 三列的DataFrame，日期按记录时间（北京时间）划分
+        """
+        daily = Counter()
+        for hour, ip, count in self._range_counts(start_time, end_time):
+            daily[(datetime.fromtimestamp(hour, timezone.utc).date(), ip)] += count
+        return pd.DataFrame(
+            [(day, ip, count) for (day, ip), count in sorted(daily.items())],
+            columns=['日期', 'IP', '访问次数']
+        )
+
+    def _range_counts(self, start_time, end_time):
+        """
+        精确统计 [start_time, end_time] 内每小时每个IP的访问次数
+
+        完整的小时直接取自索引，结束时间为整点时该整点时刻的访问取自整点计数；
+        起止时间不在整点时，首尾不完整的部分按时间二分定位后从索引中的日志文件读取。
+
+        Args:
+            start_time: 开始时间
+            end_time: 结束时间
+
+        Yields:
+            (小时起点的Unix时间戳, IP地址, 访问次数) 元组
+        """
+        start_ts, end_ts = int(start_time.timestamp()), int(end_time.timestamp())
+        first_hour = -(-start_ts // 3600) * 3600  # 第一个完整小时的起点
+        last_hour = end_ts // 3600 * 3600  # 结束时间所在小时的起点
+        if first_hour > last_hour:
+            # 起止时间在同一小时内
+            yield from self._scan_range(start_time, end_time)
+            return
+
+        if start_ts < first_hour:
+            yield from self._scan_range(start_time, start_time + timedelta(seconds=first_hour - start_ts - 1))
+        yield from self.conn.execute(
+            'SELECT hour, ip, SUM(CASE WHEN hour < ? THEN count ELSE on_hour END) AS total FROM hourly_counts '
+            'WHERE hour >= ? AND hour <= ? GROUP BY hour, ip HAVING total > 0',
+            (last_hour, first_hour, last_hour)
+        )
+        if end_ts > last_hour:
+            yield from self._scan_range(end_time - timedelta(seconds=end_ts - last_hour - 1), end_time)
+
+    def _scan_range(self, start_time, end_time):
+        """
+        从索引中的日志文件统计一段不超过一小时的时间范围
+
+        Args:
+            start_time: 开始时间
+            end_time: 结束时间（与开始时间在同一小时内）
+
+        Yields:
+            (小时起点的Unix时间戳, IP地址, 访问次数) 元组
+        """
+        log_files = [path for (path,) in self.conn.execute('SELECT path FROM log_files ORDER BY path')]
+        hour = _hour_bucket(start_time)
+        for ip, count in collect_ip_counts(log_files, start_time, end_time).items():
+            yield hour, ip, count
+
+
+def _hour_bucket(time_obj):
+    """返回时间所在小时起点的Unix时间戳"""
+    return int(time_obj.timestamp()) // 3600 * 3600
+
+
+def _last_line_end(log_file, file_size):
+    """
+    返回文件中最后一个换行符之后的偏移，即最后一个完整行的结束位置
+
+    Args:
+        log_file: 日志文件路径
+        file_size: 文件大小
+
+    Returns:
+        字节偏移，文件中没有换行符时返回0
+    """
+    with open(log_file, 'rb') as f:
+        block_end = file_size
+        while block_end > 0:
+            block_start = max(block_end - TAIL_BLOCK_SIZE, 0)
+            f.seek(block_start)
+            pos = f.read(block_end - block_start).rfind(b'\n')
+            if pos != -1:
+                return block_start + pos + 1
+            block_end = block_start
+    return 0
+
+
+def parse_arguments():
+    """解析命令行参数。"""
+    parser = argparse.ArgumentParser(description='nginx日志分析工具')
+
+    parser.add_argument('--workers', type=int, default=1,
+                        help=f'并行解析日志的进程数（默认为1，即串行；本机CPU核数为{os.cpu_count()}）')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE_MB,
+                        help=f'多进程模式下大文件的切分大小，单位MB（默认为{CHUNK_SIZE_MB}）')
+    parser.add_argument('--full-scan', action='store_true',
+                        help='不按时间范围跳过文件或二分定位，完整读取所有日志（用于时间无序的日志）')
+    parser.add_argument('--index', nargs='?', const=INDEX_FILE, default=None,
+                        help=f'使用增量聚合索引，只解析新增的日志并从索引中统计（默认索引文件为{INDEX_FILE}）；'
+                             '索引按小时聚合，开始/结束时间不在整点时首尾不完整的小时从日志文件读取')
+    parser.add_argument('--detailed', action='store_true',
+                        help='扩展分析：单遍统计所有请求的员工×接口×小时矩阵、状态码、响应字节数和耗时分位数')
+    parser.add_argument('--unmapped', action='store_true',
+                        help='统计未在员工信息中登记的IP：高频IP和每天的独立IP数（近似算法，内存占用固定）')
+    parser.add_argument('--top-k', type=int, default=TOP_K,
+                        help=f'--unmapped 模式下输出访问次数最多的IP个数（默认为{TOP_K}）')
+    parser.add_argument('--follow', nargs='?', const=os.path.join(LOG_DIR, 'access.log'), default=None,
+                        help='实时模式：跟踪正在写入的访问日志，按员工统计最近1分钟/1小时/1天的访问次数')
+    parser.add_argument('--from-start', action='store_true',
+                        help='实时模式下从日志文件开头读取，而不是只读取新写入的内容')
+    parser.add_argument('--snapshot-file', type=str, default=SNAPSHOT_FILE,
+                        help='实时模式的快照文件，扩展名为 .csv 时写CSV，否则写Excel')
+    parser.add_argument('--flush-interval', type=int, default=FLUSH_INTERVAL,
+                        help=f'实时模式下写快照的间隔，单位秒（默认为{FLUSH_INTERVAL}）')
+    parser.add_argument('--export-parquet', type=str, default=None,
+                        help='将时间范围内的访问明细导出为按日期分区的Parquet数据集（需要pyarrow）')
+    parser.add_argument('--query-parquet', type=str, default=None,
+                        help='从已导出的Parquet数据集按 --group-by 分组统计，而不是解析文本日志')
+    parser.add_argument('--group-by', type=str, nargs='+', default=['employee'], choices=PARQUET_GROUP_KEYS,
+                        help='--query-parquet 的分组维度（默认为employee）')
+    parser.add_argument('--methods', type=str, nargs='+', default=None,
+                        help='--query-parquet 只统计这些请求方法，如 POST')
+
+    args = parser.parse_args()
+    if args.detailed and args.index:
+        parser.error('--detailed 与 --index 不能同时使用：索引只保存POST访问次数，无法生成扩展分析的各维度统计')
+    return args
+
+
+def main():
+    args = parse_arguments()
+
+    # 将输入的时间字符串转换为datetime对象
+    try:
+        start_time = datetime.strptime(START_TIME, '%Y-%m-%d %H:%M:%S').replace(tzinfo=datetime.now().astimezone().tzinfo)
+        end_time = datetime.strptime(END_TIME, '%Y-%m-%d %H:%M:%S').replace(tzinfo=datetime.now().astimezone().tzinfo)
+    except ValueError:
+        print("错误: 时间格式不正确，请使用 YYYY-MM-DD HH:MM:SS 格式")
+        return
+
+    # 检查日志目录是否存在
+    if not os.path.exists(LOG_DIR) or not os.path.isdir(LOG_DIR):
+        print(f"错误: 找不到日志目录 {LOG_DIR} 或者它不是一个目录")
+        return
+
+    # 检查员工信息文件是否存在
+    if not os.path.exists(EMPLOYEE_FILE):
+        print(f"错误: 找不到员工信息文件 {EMPLOYEE_FILE}")
+        return
+
+    # 读取员工信息
+    try:
+        employee_info = pd.read_excel(EMPLOYEE_FILE)
+    except Exception as e:
+        print(f"读取员工信息文件时出错: {e}")
+        return
+
+    if args.follow:
+        follow_log(
+            args.follow, employee_info, args.snapshot_file,
+            flush_interval=args.flush_interval,
+            from_start=args.from_start
+        )
+        return
+
+    if args.query_parquet:
+        try:
+            result_df = query_parquet(
+                args.query_parquet, start_time, end_time,
+                group_by=args.group_by, employee_info=employee_info, methods=args.methods
+            )
+            result_df.to_excel(OUTPUT_FILE, index=False)
+            print(f"共 {len(result_df)} 行统计结果，已保存到 {OUTPUT_FILE}")
+        except Exception as e:
+            print(f"查询Parquet数据集时出错: {e}")
+        return
+
+    # 获取目录中的所有文件
+    log_files = []
+    for file in os.listdir(LOG_DIR):
+        file_path = os.path.join(LOG_DIR, file)
+        if os.path.isfile(file_path):
+            log_files.append(file_path)
+
+    if not log_files:
+        print(f"警告: 目录 {LOG_DIR} 中没有找到任何文件")
+        return
+
+    if args.export_parquet:
+        try:
+            exported = export_parquet(
+                log_files, args.export_parquet, start_time, end_time,
+                time_pushdown=not args.full_scan
+            )
+            print(f"已导出 {exported} 条访问明细到 {args.export_parquet}")
+        except Exception as e:
+            print(f"导出Parquet时出错: {e}")
+        return
+
+    detail_aggregator = None
+    if args.detailed:
+        # 扩展分析模式：一次遍历同时得到POST访问次数和各维度统计
+        print("正在进行扩展分析...")
+        print(f"统计 {START_TIME} 到 {END_TIME} 的记录...")
+        detail_aggregator = analyze_log_details(
+            log_files, start_time, end_time,
+            workers=args.workers,
+            chunk_size=args.chunk_size * 1024 * 1024,
+            time_pushdown=not args.full_scan
+        )
+        ip_counts = detail_aggregator.post_counts
+    elif args.index:
+        # 增量更新聚合索引，再从小时聚合结果中统计时间范围内的访问次数
+        print(f"正在更新聚合索引 {args.index}...")
+        with LogAggregateStore(args.index) as store:
+            parsed = store.sync(log_files)
+            print(f"索引更新完成，新解析 {parsed} 条记录")
+            ip_counts = store.query_ip_counts(start_time, end_time)
+    else:
+        # 流式解析所有nginx日志，边解析边按时间范围过滤并累计每个IP的访问次数
+        print("正在解析nginx日志...")
+        print(f"统计 {START_TIME} 到 {END_TIME} 的记录...")
+        ip_counts = collect_ip_counts(
+            log_files, start_time, end_time,
+            workers=args.workers,
+            chunk_size=args.chunk_size * 1024 * 1024,
+            time_pushdown=not args.full_scan
+        )
+
+    print(f"时间范围内共有 {sum(ip_counts.values())} 条访问记录")
+
+    # 统计每个员工的访问次数
+    print("正在统计每个员工的访问次数...")
+    result_df = build_employee_report(ip_counts, employee_info)
+
+    extra_sheets = {}
+    if detail_aggregator is not None:
+        extra_sheets['员工接口小时分布'] = detail_aggregator.employee_endpoint_hour_matrix(employee_info)
+        extra_sheets['接口统计'] = detail_aggregator.endpoint_summary()
+
+    if args.unmapped:
+        print("正在统计未匹配到员工的IP...")
+        unmapped = analyze_unmapped_ips(
+            log_files, start_time, end_time, employee_info,
+            top_k=args.top_k,
+            workers=args.workers,
+            chunk_size=args.chunk_size * 1024 * 1024,
+            time_pushdown=not args.full_scan
+        )
+        print(f"未匹配到员工的独立IP约 {unmapped.total_distinct.count()} 个")
+        extra_sheets['未匹配IP_TopK'] = unmapped.top_ips()
+        extra_sheets['未匹配IP_每日'] = unmapped.daily_summary()
+
+    # 保存结果到Excel文件
+    try:
+        if not extra_sheets:
+            result_df.to_excel(OUTPUT_FILE, index=False)
+        else:
+            with pd.ExcelWriter(OUTPUT_FILE) as writer:
+                result_df.to_excel(writer, sheet_name='员工访问统计', index=False)
+                for sheet_name, sheet_df in extra_sheets.items():
+                    sheet_df.to_excel(writer, sheet_name=sheet_name, index=False)
+        print(f"结果已保存到 {OUTPUT_FILE}")
+    except Exception as e:
+        print(f"保存结果时出错: {e}")
+
+
+if __name__ == "__main__":
+    main()
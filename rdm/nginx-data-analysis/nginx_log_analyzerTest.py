@@ -1,8 +1,44 @@
+import bz2
+import gzip
+import shutil
 import unittest
 import tempfile
 import os
+from collections import Counter
 from datetime import datetime, timedelta
-from rdm.nginx_data_analysis.nginx_log_analyzer import parse_nginx_log
+from rdm.nginx_data_analysis.nginx_log_analyzer import (
+    AccessRecord,
+    parse_nginx_log,
+    parse_log_time,
+    filter_by_time_range,
+    count_access_by_employee,
+    split_log_file,
+    collect_ip_counts,
+    detect_compression,
+    locate_time_range,
+    LogAggregateStore,
+    build_employee_report,
+    EmployeeIpMatcher,
+    normalize_path,
+    LatencyHistogram,
+    analyze_log_details,
+    HyperLogLog,
+    HeavyHitters,
+    analyze_unmapped_ips,
+    RollingWindowCounter,
+    LogFollower,
+    LiveAccessCounter,
+    parse_log_lines,
+    read_log_range,
+    export_parquet,
+    query_parquet,
+)
+import pandas as pd
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
 
 class NginxLogAnalyzerTest(unittest.TestCase):
     def test_parse_valid_nginx_log_line(self):
@@ -24,23 +60,553 @@ class NginxLogAnalyzerTest(unittest.TestCase):
         """Test parsing a standard nginx log line with valid IP and timestamp"""
         # Create a temporary log file with the test line
         with tempfile.NamedTemporaryFile(mode='w', delete=False) as temp_file:
-            temp_file.write("192.168.1.1 - - [07/May/2025:05:20:17 +0000] \"GET /path HTTP/1.1\"\n")
+            temp_file.write("192.168.1.1 - - [07/May/2025:05:20:17 +0000] \"POST /path HTTP/1.1\"\n")
             temp_file_path = temp_file.name
         
         try:
             # Call the function with the temporary file
-            result = parse_nginx_log(temp_file_path)
+            result = list(parse_nginx_log(temp_file_path))
             
             # Verify the results
             self.assertEqual(len(result), 1)
-            self.assertEqual(result[0]['ip'], '192.168.1.1')
+            self.assertEqual(result[0].ip, '192.168.1.1')
             
             # Check the adjusted time (original +8 hours)
             expected_time = datetime.strptime('07/May/2025:13:20:17 +0000', '%d/%b/%Y:%H:%M:%S %z')
-            self.assertEqual(result[0]['time'], expected_time)
+            self.assertEqual(result[0].time, expected_time)
         finally:
             # Clean up the temporary file
             os.unlink(temp_file_path)
 
+    def test_parse_log_time_matches_strptime(self):
+        """测试手写的固定偏移时间解析与datetime.strptime结果一致（含非零时区）"""
+        for time_str in ('07/May/2025:05:20:17 +0000', '31/Dec/2024:23:59:59 +0800', '01/Feb/2025:00:00:00 -0530'):
+            expected = datetime.strptime(time_str, '%d/%b/%Y:%H:%M:%S %z') + timedelta(hours=8)
+            self.assertEqual(parse_log_time(time_str), expected)
+
+        with self.assertRaises(ValueError):
+            parse_log_time('07/Foo/2025:05:20:17 +0000')
+
+    def test_parse_skips_non_post_and_malformed_lines(self):
+        """测试非POST请求、格式错误的行以及错误时间会被跳过"""
+        lines = [
+            '10.0.0.1 - - [07/May/2025:05:20:17 +0000] "GET /a HTTP/1.1" 200 1\n',
+            'garbage line "POST /x"\n',
+            '10.0.0.2 - - [07/Bad/2025:05:20:17 +0000] "POST /b HTTP/1.1" 200 1\n',
+            '10.0.0.3 - - [07/May/2025:05:20:18 +0000] "POST /c HTTP/1.1" 200 1\n',
+        ]
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as temp_file:
+            temp_file.writelines(lines)
+            temp_file_path = temp_file.name
+
+        try:
+            result = list(parse_nginx_log(temp_file_path))
+            self.assertEqual([record.ip for record in result], ['10.0.0.3'])
+        finally:
+            os.unlink(temp_file_path)
+
+    def test_filter_and_count_by_employee(self):
+        """测试按时间范围过滤后统计员工访问次数"""
+        records = [
+            AccessRecord('10.0.0.1', parse_log_time('07/May/2025:05:20:17 +0000')),
+            AccessRecord('10.0.0.1', parse_log_time('07/May/2025:06:20:17 +0000')),
+            AccessRecord('10.0.0.2', parse_log_time('09/May/2025:05:20:17 +0000')),
+        ]
+        start = parse_log_time('07/May/2025:00:00:00 +0000')
+        end = parse_log_time('08/May/2025:00:00:00 +0000')
+
+        employee_info = pd.DataFrame([
+            {'工号': 'E1', '姓名': '张三', 'IP': '10.0.0.1'},
+            {'工号': 'E2', '姓名': '李四', 'IP': '10.0.0.2'},
+        ])
+        result = count_access_by_employee(filter_by_time_range(records, start, end), employee_info)
+        self.assertEqual(list(result['访问次数']), [2, 0])
+
+    def test_split_log_file_aligns_to_newlines(self):
+        """测试大文件切分的每一段都从行首开始，且覆盖整个文件"""
+        line = '10.0.0.1 - - [07/May/2025:05:20:17 +0000] "POST /a HTTP/1.1" 200 1\n'
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as temp_file:
+            temp_file.write(line * 100)
+            temp_file_path = temp_file.name
+
+        try:
+            ranges = split_log_file(temp_file_path, 1000)
+            self.assertGreater(len(ranges), 1)
+            self.assertEqual(ranges[0][0], 0)
+            self.assertEqual(ranges[-1][1], os.path.getsize(temp_file_path))
+            for (_, prev_end), (start, _) in zip(ranges, ranges[1:]):
+                self.assertEqual(prev_end, start)
+                self.assertEqual(start % len(line), 0)
+        finally:
+            os.unlink(temp_file_path)
+
+    def test_collect_ip_counts_parallel_matches_serial(self):
+        """测试多进程模式的统计结果与串行模式一致"""
+        temp_dir = tempfile.mkdtemp()
+        log_files = []
+        for i in range(3):
+            log_file = os.path.join(temp_dir, f'access.log.{i}')
+            with open(log_file, 'w') as f:
+                for j in range(200):
+                    f.write(f'10.0.0.{j % 7} - - [07/May/2025:05:{j % 60:02d}:17 +0000] "POST /a HTTP/1.1" 200 1\n')
+            log_files.append(log_file)
+
+        start = parse_log_time('07/May/2025:00:00:00 +0000')
+        end = parse_log_time('08/May/2025:00:00:00 +0000')
+        try:
+            serial = collect_ip_counts(log_files, start, end)
+            parallel = collect_ip_counts(log_files, start, end, workers=2, chunk_size=2048)
+            self.assertEqual(sum(serial.values()), 600)
+            self.assertEqual(serial, parallel)
+        finally:
+            for log_file in log_files:
+                os.unlink(log_file)
+            os.rmdir(temp_dir)
+
+    def test_parse_compressed_rotated_logs(self):
+        """测试按魔数识别并流式解析gzip/bz2压缩的轮转日志（文件名不带扩展名也能识别）"""
+        content = '10.0.0.9 - - [07/May/2025:05:20:17 +0000] "POST /a HTTP/1.1" 200 1\n'.encode('utf-8')
+        temp_dir = tempfile.mkdtemp()
+        gz_path = os.path.join(temp_dir, 'access.log.2')
+        bz2_path = os.path.join(temp_dir, 'access.log.3')
+        with gzip.open(gz_path, 'wb') as f:
+            f.write(content)
+        with bz2.open(bz2_path, 'wb') as f:
+            f.write(content)
+
+        try:
+            self.assertEqual(detect_compression(gz_path), 'gzip')
+            self.assertEqual(detect_compression(bz2_path), 'bz2')
+            for path in (gz_path, bz2_path):
+                result = list(parse_nginx_log(path))
+                self.assertEqual([record.ip for record in result], ['10.0.0.9'])
+
+            start = parse_log_time('07/May/2025:00:00:00 +0000')
+            end = parse_log_time('08/May/2025:00:00:00 +0000')
+            counts = collect_ip_counts([gz_path, bz2_path], start, end, workers=2)
+            self.assertEqual(counts['10.0.0.9'], 2)
+        finally:
+            os.unlink(gz_path)
+            os.unlink(bz2_path)
+            os.rmdir(temp_dir)
+
+    def test_invalid_utf8_bytes_are_tolerated(self):
+        """测试URL中的非法UTF-8字节不会中断解析，且按字节范围读取时结果一致"""
+        lines = [
+            b'10.0.0.1 - - [07/May/2025:05:20:17 +0000] "POST /a HTTP/1.1" 200 1\n',
+            b'10.0.0.2 - - [07/May/2025:05:20:18 +0000] "GET /b?q="POST " HTTP/1.1" 200 1\n',
+            b'10.0.0.3 - - [07/May/2025:05:20:19 +0000] "POST /\xff\xfe HTTP/1.1" 200 1\n',
+            b'10.0.0.4 - - [07/May/2025:05:20:20 +0000] "POST /d HTTP/1.1" 200 1',
+        ]
+        with tempfile.NamedTemporaryFile(mode='wb', delete=False) as temp_file:
+            temp_file.write(b''.join(lines))
+            temp_file_path = temp_file.name
+
+        try:
+            result = list(parse_nginx_log(temp_file_path))
+            self.assertEqual([record.ip for record in result], ['10.0.0.1', '10.0.0.3', '10.0.0.4'])
+            self.assertEqual(result[0].time, parse_log_time('07/May/2025:05:20:17 +0000'))
+
+            # 按行首偏移扫描部分范围
+            second_line = len(lines[0])
+            partial = list(parse_log_lines(read_log_range(temp_file_path, second_line,
+                                                          second_line + len(lines[1]) + len(lines[2]))))
+            self.assertEqual([record.ip for record in partial], ['10.0.0.3'])
+        finally:
+            os.unlink(temp_file_path)
+
+    def test_time_pushdown_skips_and_slices_files(self):
+        """测试按时间范围跳过文件、二分定位文件内区间，且统计结果与全量扫描一致"""
+        temp_dir = tempfile.mkdtemp()
+        base = datetime(2025, 5, 1)
+        log_files = []
+        for day in range(3):
+            log_file = os.path.join(temp_dir, f'access.log.{day}')
+            with open(log_file, 'w') as f:
+                for minute in range(0, 24 * 60, 7):
+                    t = base + timedelta(days=day, minutes=minute)
+                    f.write(f'10.0.{day}.{minute % 5} - - [{t.strftime("%d/%b/%Y:%H:%M:%S")} +0000] '
+                            f'"POST /a HTTP/1.1" 200 1\n')
+                    f.write('this line has no timestamp\n')
+            log_files.append(log_file)
+
+        start = parse_log_time('02/May/2025:06:00:00 +0000')
+        end = parse_log_time('02/May/2025:12:00:00 +0000')
+        try:
+            self.assertIsNone(locate_time_range(log_files[0], start, end))
+            self.assertIsNone(locate_time_range(log_files[2], start, end))
+            window = locate_time_range(log_files[1], start, end)
+            self.assertGreater(window[0], 0)
+            self.assertLess(window[1], os.path.getsize(log_files[1]))
+
+            pushed = collect_ip_counts(log_files, start, end)
+            full = collect_ip_counts(log_files, start, end, time_pushdown=False)
+            parallel = collect_ip_counts(log_files, start, end, workers=2, chunk_size=1024)
+            self.assertGreater(sum(full.values()), 0)
+            self.assertEqual(pushed, full)
+            self.assertEqual(parallel, full)
+        finally:
+            for log_file in log_files:
+                os.unlink(log_file)
+            os.rmdir(temp_dir)
+
+    def test_aggregate_store_incremental_sync(self):
+        """测试聚合索引只解析新增内容、识别logrotate重命名，并与直接统计结果一致"""
+        temp_dir = tempfile.mkdtemp()
+        log_file = os.path.join(temp_dir, 'access.log')
+        rotated_file = os.path.join(temp_dir, 'access.log.1')
+        db_path = os.path.join(temp_dir, 'index.sqlite3')
+
+        def write_lines(path, mode, hour, count):
+            with open(path, mode) as f:
+                for i in range(count):
+                    f.write(f'10.0.0.{i % 3} - - [07/May/2025:{hour:02d}:{i % 60:02d}:00 +0000] "POST /a HTTP/1.1" 200 1\n')
+
+        start = parse_log_time('07/May/2025:00:00:00 +0000')
+        end = parse_log_time('08/May/2025:00:00:00 +0000')
+        try:
+            write_lines(log_file, 'w', 1, 30)
+            with LogAggregateStore(db_path) as store:
+                self.assertEqual(store.sync([log_file]), 30)
+                self.assertEqual(store.sync([log_file]), 0)
+
+                # 追加写入（最后半行尚未写完）只解析新增的完整行
+                write_lines(log_file, 'a', 2, 10)
+                with open(log_file, 'a') as f:
+                    f.write('10.0.0.9 - - [07/May/2025:03:00:00 +0000] "POST')
+                self.assertEqual(store.sync([log_file]), 10)
+
+                # logrotate：重命名后创建新文件
+                os.rename(log_file, rotated_file)
+                write_lines(log_file, 'w', 4, 5)
+                self.assertEqual(store.sync([log_file, rotated_file]), 5)
+
+                expected = collect_ip_counts([log_file, rotated_file], start, end)
+                self.assertEqual(store.query_ip_counts(start, end), expected)
+
+                daily = store.query_daily_counts(start, end)
+                self.assertEqual(int(daily['访问次数'].sum()), 45)
+
+                # 整点的结束时间与 filter_by_time_range 一样包含端点
+                on_hour_end = parse_log_time('07/May/2025:02:00:00 +0000')
+                expected = collect_ip_counts([log_file, rotated_file], start, on_hour_end)
+                self.assertEqual(sum(expected.values()), 31)
+                self.assertEqual(store.query_ip_counts(start, on_hour_end), expected)
+                daily = store.query_daily_counts(start, on_hour_end)
+                self.assertEqual(int(daily['访问次数'].sum()), 31)
+
+                # 不在整点的起止时间与直接扫描日志的统计一致
+                for range_start, range_end in (('01:10:30', '04:02:00'), ('01:10:00', '01:20:00'),
+                                               ('02:00:00', '02:05:59')):
+                    range_start = parse_log_time(f'07/May/2025:{range_start} +0000')
+                    range_end = parse_log_time(f'07/May/2025:{range_end} +0000')
+                    expected = collect_ip_counts([log_file, rotated_file], range_start, range_end)
+                    self.assertEqual(store.query_ip_counts(range_start, range_end), expected)
+                    daily = store.query_daily_counts(range_start, range_end)
+                    self.assertEqual(int(daily['访问次数'].sum()), sum(expected.values()))
+
+                # 文件被删除后聚合结果随之移除
+                store.sync([log_file])
+                self.assertEqual(sum(store.query_ip_counts(start, end).values()), 5)
+        finally:
+            for path in (log_file, rotated_file, db_path):
+                if os.path.exists(path):
+                    os.unlink(path)
+            os.rmdir(temp_dir)
+
+    def test_build_employee_report_multiple_ips_and_cidr(self):
+        """测试一个员工对应多个IP、网段（DHCP地址池）以及IP前后有空格时的统计"""
+        employee_info = pd.DataFrame([
+            {'工号': 'E1', '姓名': '张三', 'IP': '10.0.0.1 '},
+            {'工号': 'E2', '姓名': '李四', 'IP': '10.0.0.2，10.0.0.3'},
+            {'工号': 'E3', '姓名': '王五', 'IP': '10.0.1.0/24'},
+            {'工号': 'E4', '姓名': '赵六', 'IP': None},
+        ])
+        ip_counts = Counter({
+            '10.0.0.1': 3, '10.0.0.2': 1, '10.0.0.3': 2,
+            '10.0.1.7': 5, '10.0.1.255': 1, '10.0.2.1': 4,
+        })
+
+        result = build_employee_report(ip_counts, employee_info)
+        self.assertEqual(list(result['工号']), ['E1', 'E2', 'E3', 'E4'])
+        self.assertEqual(list(result['访问次数']), [3, 3, 6, 0])
+
+        empty = build_employee_report(Counter(), employee_info)
+        self.assertEqual(list(empty['访问次数']), [0, 0, 0, 0])
+
+    def test_nested_networks_and_shared_ip(self):
+        """测试嵌套网段按最长前缀匹配，以及多名员工登记同一IP时每人都计入"""
+        employee_info = pd.DataFrame([
+            {'工号': 'E1', '姓名': '张三', 'IP': '10.0.0.0/16'},
+            {'工号': 'E2', '姓名': '李四', 'IP': '10.0.5.0/24'},
+            {'工号': 'E3', '姓名': '王五', 'IP': '10.0.5.7'},
+            {'工号': 'E4', '姓名': '赵六', 'IP': '10.0.5.7, 10.0.5.7'},
+        ])
+        ip_counts = Counter({'10.0.9.1': 1, '10.0.5.1': 2, '10.0.5.7': 4, '10.1.0.1': 8})
+
+        result = build_employee_report(ip_counts, employee_info)
+        self.assertEqual(list(result['访问次数']), [1, 2, 4, 4])
+
+        match = EmployeeIpMatcher(employee_info).match
+        self.assertEqual(match('10.0.9.1'), (0,))
+        self.assertEqual(match('10.0.5.1'), (1,))
+        self.assertEqual(sorted(match('10.0.5.7')), [2, 3])
+        self.assertEqual(match('10.1.0.1'), ())
+
+    def test_normalize_path_and_latency_histogram(self):
+        """测试URL归一化以及延迟直方图的分位数误差"""
+        self.assertEqual(normalize_path('/api/users/123/orders?page=2'), '/api/users/{id}/orders')
+        self.assertEqual(normalize_path('/files/3f2504e0-4f89-11d3-9a0c-0305e82c3301'), '/files/{id}')
+        self.assertEqual(normalize_path('/static/app.js'), '/static/app.js')
+
+        histogram = LatencyHistogram()
+        for i in range(1, 1001):
+            histogram.add(i / 1000)
+        self.assertIsNone(LatencyHistogram().percentile(50))
+        self.assertAlmostEqual(histogram.percentile(50), 0.5, delta=0.5 * 0.04)
+        self.assertAlmostEqual(histogram.percentile(99), 0.99, delta=0.99 * 0.04)
+        self.assertLessEqual(histogram.percentile(100), 1.0)
+
+    def test_analyze_log_details(self):
+        """测试扩展分析：员工×接口×小时矩阵、状态码分布和耗时统计，且多进程结果一致"""
+        lines = [
+            '10.0.0.1 - - [07/May/2025:01:00:00 +0000] "POST /api/orders/1 HTTP/1.1" 200 10 "-" "curl" 0.100\n',
+            '10.0.0.1 - - [07/May/2025:01:30:00 +0000] "POST /api/orders/2?x=1 HTTP/1.1" 500 20 "-" "curl" 0.300\n',
+            '10.0.0.2 - - [07/May/2025:02:00:00 +0000] "GET /api/orders HTTP/1.1" 404 - "-" "curl"\n',
+            '10.0.0.3 - - [07/May/2025:02:00:00 +0000] "GET /api/orders HTTP/1.1" 200 5 "-" "curl" 0.050\n',
+            # 缺少状态码的POST行：只计入POST访问次数，与基础统计口径一致
+            '10.0.0.4 - - [07/May/2025:02:00:00 +0000] "POST /api/truncated\n',
+        ]
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as temp_file:
+            temp_file.writelines(lines * 50)
+            temp_file_path = temp_file.name
+
+        employee_info = pd.DataFrame([
+            {'工号': 'E1', '姓名': '张三', 'IP': '10.0.0.1'},
+            {'工号': 'E2', '姓名': '李四', 'IP': '10.0.0.2'},
+        ])
+        start = parse_log_time('07/May/2025:00:00:00 +0000')
+        end = parse_log_time('08/May/2025:00:00:00 +0000')
+        try:
+            aggregator = analyze_log_details([temp_file_path], start, end)
+            self.assertEqual(aggregator.post_counts, Counter({'10.0.0.1': 100, '10.0.0.4': 50}))
+            self.assertEqual(aggregator.post_counts, collect_ip_counts([temp_file_path], start, end))
+            self.assertNotIn('POST /api/truncated', aggregator.requests)
+
+            matrix = aggregator.employee_endpoint_hour_matrix(employee_info)
+            self.assertEqual(list(matrix['工号']), ['E1', 'E2'])
+            self.assertEqual(list(matrix['接口']), ['POST /api/orders/{id}', 'GET /api/orders'])
+            self.assertEqual(matrix.loc[0, 9], 100)  # UTC 01:00 + 8小时
+            self.assertEqual(matrix.loc[1, '合计'], 50)
+
+            summary = aggregator.endpoint_summary().set_index('接口')
+            self.assertEqual(summary.loc['POST /api/orders/{id}', '5xx'], 50)
+            self.assertEqual(summary.loc['GET /api/orders', '4xx'], 50)
+            self.assertEqual(summary.loc['GET /api/orders', '响应字节数'], 250)
+            self.assertAlmostEqual(summary.loc['POST /api/orders/{id}', '最大耗时(秒)'], 0.3)
+
+            parallel = analyze_log_details([temp_file_path], start, end, workers=2, chunk_size=2048)
+            self.assertEqual(parallel.hourly, aggregator.hourly)
+            self.assertEqual(parallel.post_counts, aggregator.post_counts)
+            self.assertEqual(parallel.latency['GET /api/orders'].count, 50)
+        finally:
+            os.unlink(temp_file_path)
+
+    def test_hyperloglog_and_heavy_hitters(self):
+        """测试HyperLogLog基数估计误差，以及Top-K高频元素在合并后仍然正确"""
+        hll = HyperLogLog()
+        other = HyperLogLog()
+        for i in range(20000):
+            (hll if i % 2 else other).add(f'172.16.{i // 256}.{i % 256}')
+        hll.update(other)
+        self.assertAlmostEqual(hll.count(), 20000, delta=20000 * 0.03)
+
+        left, right = HeavyHitters(k=3), HeavyHitters(k=3)
+        for i in range(5000):
+            target = left if i % 2 else right
+            target.add(f'noise-{i}')
+            if i % 10 == 0:
+                target.add('heavy-a', 3)
+            if i % 25 == 0:
+                target.add('heavy-b', 2)
+        left.update(right)
+        top = left.top()
+        self.assertEqual([item for item, _ in top[:2]], ['heavy-a', 'heavy-b'])
+        self.assertGreaterEqual(top[0][1], 1500)
+
+        # 候选的估计值增长后，轻量元素不能再按旧的最小值替换掉重元素
+        hitters = HeavyHitters(k=2)
+        hitters.add('heavy-a')
+        hitters.add('heavy-b')
+        hitters.add('heavy-a', 10)
+        hitters.add('heavy-b', 10)
+        hitters.add('light', 2)
+        self.assertEqual(hitters.top(), [('heavy-a', 11), ('heavy-b', 11)])
+        hitters.add('light', 10)
+        top = hitters.top()
+        self.assertEqual(top[0], ('light', 12))
+        self.assertEqual(top[1][1], 11)
+
+    def test_analyze_unmapped_ips(self):
+        """测试未匹配到员工的IP统计：Top-K和每天的独立IP数"""
+        with tempfile.NamedTemporaryFile(mode='w', delete=False) as temp_file:
+            for day in (7, 8):
+                for i in range(30):
+                    temp_file.write(f'10.0.0.1 - - [{day:02d}/May/2025:01:00:00 +0000] "POST /a HTTP/1.1" 200 1\n')
+                    temp_file.write(f'10.9.9.{i % 10} - - [{day:02d}/May/2025:02:00:00 +0000] "POST /a HTTP/1.1" 200 1\n')
+                    if i < 20:
+                        temp_file.write(f'10.8.8.8 - - [{day:02d}/May/2025:03:00:00 +0000] "POST /a HTTP/1.1" 200 1\n')
+            temp_file_path = temp_file.name
+
+        employee_info = pd.DataFrame([{'工号': 'E1', '姓名': '张三', 'IP': '10.0.0.1'}])
+        start = parse_log_time('07/May/2025:00:00:00 +0000')
+        end = parse_log_time('09/May/2025:00:00:00 +0000')
+        try:
+            result = analyze_unmapped_ips([temp_file_path], start, end, employee_info, top_k=3)
+            top = result.top_ips()
+            self.assertEqual(top.loc[0, 'IP'], '10.8.8.8')
+            self.assertEqual(top.loc[0, '访问次数(估计)'], 40)
+            self.assertNotIn('10.0.0.1', list(top['IP']))
+
+            daily = result.daily_summary()
+            self.assertEqual(list(daily['独立IP数(估计)']), [11, 11])
+            self.assertEqual(list(daily['访问次数']), [50, 50])
+
+            parallel = analyze_unmapped_ips([temp_file_path], start, end, employee_info, top_k=3,
+                                            workers=2, chunk_size=2048)
+            self.assertEqual(list(parallel.daily_summary()['访问次数']), [50, 50])
+            self.assertEqual(parallel.top_ips().loc[0, 'IP'], '10.8.8.8')
+        finally:
+            os.unlink(temp_file_path)
+
+    def test_rolling_window_counter(self):
+        """测试环形缓冲区滑动窗口：过期的桶被复用，窗口外的计数不再统计"""
+        window = RollingWindowCounter(60, 10)
+        window.add('a', 1000)
+        window.add('a', 1035)
+        window.add('b', 1055)
+        self.assertEqual(window.totals(1055), Counter({'a': 2, 'b': 1}))
+        self.assertEqual(window.totals(1065), Counter({'a': 1, 'b': 1}))
+        window.add('a', 1100)  # 复用1035所在的桶
+        self.assertEqual(window.totals(1100), Counter({'a': 1, 'b': 1}))
+        self.assertEqual(window.totals(2000), Counter())
+
+    def test_log_follower_handles_partial_lines_and_rotation(self):
+        """测试实时跟踪：半行留到下次读取，logrotate轮转后读完旧文件再切换到新文件"""
+        temp_dir = tempfile.mkdtemp()
+        log_file = os.path.join(temp_dir, 'access.log')
+        rotated_file = os.path.join(temp_dir, 'access.log.1')
+        line = '10.0.0.1 - - [07/May/2025:05:20:17 +0000] "POST /a HTTP/1.1" 200 1\n'
+
+        employee_info = pd.DataFrame([{'工号': 'E1', '姓名': '张三', 'IP': '10.0.0.1'}])
+        counter = LiveAccessCounter(employee_info)
+        try:
+            with open(log_file, 'w') as f:
+                f.write(line)
+            follower = LogFollower(log_file)
+            self.assertEqual(follower.read_new_lines(), [])  # 默认只读取新写入的内容
+
+            with open(log_file, 'a') as f:
+                f.write(line + line[:20])
+            self.assertEqual(follower.read_new_lines(), [line])
+            with open(log_file, 'a') as f:
+                f.write(line[20:])
+            self.assertEqual(follower.read_new_lines(), [line])
+
+            with open(log_file, 'a') as f:
+                f.write(line)
+            os.rename(log_file, rotated_file)
+            with open(log_file, 'w') as f:
+                f.write(line.replace('05:20:17', '05:20:50'))
+            lines = follower.read_new_lines()
+            self.assertEqual(len(lines), 2)
+            follower.close()
+
+            for record in parse_log_lines(lines):
+                counter.add(record)
+            now = parse_log_time('07/May/2025:05:20:55 +0000').timestamp()
+            snapshot = counter.snapshot(now)
+            self.assertEqual(snapshot.loc[0, '最近1分钟'], 2)
+            self.assertEqual(snapshot.loc[0, '最近1天'], 2)
+            self.assertEqual(snapshot.loc[0, '统计时间'], '2025-05-07 13:20:55')
+
+            # 日志停止写入后，计数随时间从窗口中移出
+            snapshot = counter.snapshot(now + 120)
+            self.assertEqual(snapshot.loc[0, '最近1分钟'], 0)
+            self.assertEqual(snapshot.loc[0, '最近1小时'], 2)
+            self.assertEqual(counter.snapshot().loc[0, '最近1天'], 0)
+        finally:
+            for path in (log_file, rotated_file):
+                if os.path.exists(path):
+                    os.unlink(path)
+            os.rmdir(temp_dir)
+
+    @unittest.skipIf(pyarrow is None, '需要安装pyarrow')
+    def test_export_and_query_parquet(self):
+        """测试导出按日期分区的Parquet数据集，并按员工、小时、路径分组查询"""
+        temp_dir = tempfile.mkdtemp()
+        log_file = os.path.join(temp_dir, 'access.log')
+        dataset_dir = os.path.join(temp_dir, 'parquet')
+        with open(log_file, 'w') as f:
+            for day in (7, 8):
+                f.write(f'10.0.0.1 - - [{day:02d}/May/2025:01:00:00 +0000] "POST /api/orders/{day} HTTP/1.1" 200 10 "-" "c" 0.1\n')
+                f.write(f'10.0.0.1 - - [{day:02d}/May/2025:02:00:00 +0000] "GET /api/orders HTTP/1.1" 200 10 "-" "c"\n')
+                f.write(f'10.0.0.2 - - [{day:02d}/May/2025:02:30:00 +0000] "POST /api/orders/1 HTTP/1.1" 500 10\n')
+
+        employee_info = pd.DataFrame([
+            {'工号': 'E1', '姓名': '张三', 'IP': '10.0.0.1'},
+            {'工号': 'E2', '姓名': '李四', 'IP': '10.0.0.2'},
+        ])
+        start = parse_log_time('07/May/2025:00:00:00 +0000')
+        end = parse_log_time('09/May/2025:00:00:00 +0000')
+        try:
+            self.assertEqual(export_parquet([log_file], dataset_dir, start, end, batch_size=4), 6)
+            self.assertEqual(sorted(os.listdir(dataset_dir)), ['date=2025-05-07', 'date=2025-05-08'])
+
+            by_employee = query_parquet(dataset_dir, start, end, employee_info=employee_info, methods=['POST'])
+            self.assertEqual(list(by_employee['工号']), ['E1', 'E2'])
+            self.assertEqual(list(by_employee['访问次数']), [2, 2])
+
+            by_hour_path = query_parquet(dataset_dir, start, parse_log_time('08/May/2025:00:00:00 +0000'),
+                                         group_by=['hour', 'path'])
+            self.assertEqual(int(by_hour_path['访问次数'].sum()), 3)
+            self.assertEqual(set(by_hour_path['hour']), {9, 10})
+            self.assertIn('/api/orders/{id}', set(by_hour_path['path']))
+
+            with self.assertRaises(ValueError):
+                query_parquet(dataset_dir, start, end, group_by=['employee'])
+
+            # 重新导出重叠的时间范围时先删除已有记录，不会产生重复行
+            self.assertEqual(export_parquet([log_file], dataset_dir, parse_log_time('08/May/2025:00:00:00 +0000'), end), 3)
+            self.assertEqual(export_parquet([log_file], dataset_dir, start, end), 6)
+            total = query_parquet(dataset_dir, start, end, group_by=[])
+            self.assertEqual(int(total['访问次数'].sum()), 6)
+        finally:
+            shutil.rmtree(temp_dir)
+
+    @unittest.skipIf(pyarrow is None, '需要安装pyarrow')
+    def test_parquet_hour_matches_detailed_analysis(self):
+        """测试非+0000时区的日志，Parquet查询的小时与扩展分析的员工×接口×小时矩阵一致"""
+        temp_dir = tempfile.mkdtemp()
+        log_file = os.path.join(temp_dir, 'access.log')
+        dataset_dir = os.path.join(temp_dir, 'parquet')
+        with open(log_file, 'w') as f:
+            f.write('10.0.0.1 - - [07/May/2025:01:00:00 +0800] "POST /a HTTP/1.1" 200 10\n')
+            f.write('10.0.0.1 - - [07/May/2025:23:30:00 -0500] "POST /a HTTP/1.1" 200 10\n')
+
+        employee_info = pd.DataFrame([{'工号': 'E1', '姓名': '张三', 'IP': '10.0.0.1'}])
+        start = parse_log_time('06/May/2025:00:00:00 +0000')
+        end = parse_log_time('10/May/2025:00:00:00 +0000')
+        try:
+            matrix = analyze_log_details([log_file], start, end).employee_endpoint_hour_matrix(employee_info)
+            expected = {hour for hour in range(24) if matrix.loc[0, hour]}
+            self.assertEqual(len(expected), 2)
+
+            export_parquet([log_file], dataset_dir, start, end)
+            by_hour = query_parquet(dataset_dir, start, end, group_by=['hour'])
+            self.assertEqual(set(by_hour['hour']), expected)
+        finally:
+            shutil.rmtree(temp_dir)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,303 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+nginx日志分析工具的性能基准
+
+该脚本生成可复现的合成nginx日志（可配置行数、IP数量、请求方法比例、格式错误行比例、是否gzip压缩），
+并测量 parse_nginx_log、filter_by_time_range、count_access_by_employee 的
+每秒处理的输入记录数（解析为日志行数，过滤和统计为解析出的记录数）、解析的每秒MB数，
+基准子进程的峰值内存（RSS），以及被计时阶段使峰值RSS增加了多少。
+Windows上没有 resource 模块，峰值内存通过 psutil 获取（peak_wset），未安装 psutil 时不报告内存。
+
+每个基准在独立的子进程中运行，峰值RSS互不影响；过滤和统计所需的输入记录在计时和
+内存测量开始之前准备好，只测量被计时的阶段本身。
+修改解析器前先用 --save-baseline 保存基准结果并提交，修改后再用 --baseline 对比：
+
+    python nginx_log_benchmark.py --lines 1000000 --save-baseline nginx_log_benchmark_baseline.json
+    python nginx_log_benchmark.py --lines 1000000 --baseline nginx_log_benchmark_baseline.json
+"""
+
+import os
+import sys
+import gzip
+import json
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+try:
+    import resource  # 仅POSIX系统提供
+except ImportError:
+    resource = None
+
+try:
+    import psutil  # 可选依赖，在Windows上用于测量峰值内存
+except ImportError:
+    psutil = None
+
+from nginx_log_analyzer import (
+    parse_nginx_log,
+    parse_log_time,
+    filter_by_time_range,
+    count_access_by_employee,
+)
+
+# 合成日志使用的请求方法及其权重
+DEFAULT_METHOD_MIX = {'POST': 0.4, 'GET': 0.5, 'PUT': 0.05, 'DELETE': 0.05}
+# 合成日志使用的请求路径
+PATHS = ['/api/login', '/api/orders/{id}', '/api/users/{id}/profile', '/static/app.js', '/activate?email=a@b.com']
+# 合成日志的起始时间（UTC）
+START = datetime(2025, 5, 1)
+
+
+def generate_log(path, lines, ip_count=1000, method_mix=None, malformed_ratio=0.01, compress=False, seed=42):
+    """
+    生成可复现的合成nginx访问日志
+
+    Args:
+        path: 输出文件路径
+        lines: 日志行数
+        ip_count: 不同客户端IP的个数
+        method_mix: 请求方法到权重的字典，默认为 DEFAULT_METHOD_MIX
+        malformed_ratio: 格式错误行的比例
+        compress: 是否使用gzip压缩
+        seed: 随机数种子，相同的参数和种子生成完全相同的内容
+
+    Returns:
+        生成的IP地址列表
+    """
+    rng = random.Random(seed)
+    method_mix = method_mix or DEFAULT_METHOD_MIX
+    methods, weights = list(method_mix), list(method_mix.values())
+    ips = [f"192.168.{i // 250}.{i % 250 + 1}" for i in range(ip_count)]
+    # 日志时间均匀分布在30天内，并保持按时间追加的顺序
+    step = 30 * 86400 / max(lines, 1)
+
+    opener = gzip.open if compress else open
+    with opener(path, 'wt', encoding='utf-8') as f:
+        for i in range(lines):
+            if rng.random() < malformed_ratio:
+                f.write(f"malformed line {rng.getrandbits(32):08x} \"POST\n")
+                continue
+            t = START + timedelta(seconds=int(i * step))
+            method = rng.choices(methods, weights)[0]
+            url = rng.choice(PATHS).replace('{id}', str(rng.randint(1, 100000)))
+            f.write(
+                f'{rng.choice(ips)} - - [{t.strftime("%d/%b/%Y:%H:%M:%S")} +0000] "{method} {url} HTTP/1.1" '
+                f'{rng.choice((200, 200, 200, 302, 404, 500))} {rng.randint(0, 50000)} "-" "bench" '
+                f'{rng.random():.3f}\n'
+            )
+
+    return ips
+
+
+def _peak_rss_mb():
+    """返回当前进程的峰值RSS（MB），无法测量时返回None"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux上单位为KB，macOS上为字节
+        return peak / 1024 / 1024 if sys.platform == 'darwin' else peak / 1024
+    if psutil is not None:
+        info = psutil.Process().memory_info()
+        # Windows上为峰值工作集，其他平台退回到当前RSS
+        return getattr(info, 'peak_wset', info.rss) / 1024 / 1024
+    return None
+
+
+def _run_benchmark(name, log_file, employee_file, lines):
+    """
+    在子进程中运行单个基准
+
+    Args:
+        name: 基准名称
+        log_file: 日志文件路径
+        employee_file: 员工信息文件路径（pickle格式的DataFrame）
+        lines: 日志行数
+
+    Returns:
+        (耗时秒数, 输入记录数, 输出记录数, 峰值RSS MB, 计时阶段的峰值RSS增量 MB)，无法测量内存时后两项为None
+    """
+    start_time = parse_log_time('05/May/2025:00:00:00 +0000')
+    end_time = parse_log_time('20/May/2025:00:00:00 +0000')
+
+    # 先准备好被计时阶段的输入，再记录内存基线
+    if name in ('parse_nginx_log', 'parse_nginx_log[gzip]'):
+        inputs = lines
+    elif name in ('filter_by_time_range', 'count_access_by_employee'):
+        records = list(parse_nginx_log(log_file))
+        employee_info = pd.read_pickle(employee_file)
+        inputs = len(records)
+    else:
+        raise ValueError(f"未知的基准: {name}")
+    rss_before = _peak_rss_mb()
+
+    begin = time.perf_counter()
+    if name in ('parse_nginx_log', 'parse_nginx_log[gzip]'):
+        items = sum(1 for _ in parse_nginx_log(log_file))
+    elif name == 'filter_by_time_range':
+        items = sum(1 for _ in filter_by_time_range(records, start_time, end_time))
+    else:
+        items = int(count_access_by_employee(records, employee_info)['访问次数'].sum())
+    elapsed = time.perf_counter() - begin
+
+    peak_rss = _peak_rss_mb()
+    growth = peak_rss - rss_before if peak_rss is not None else None
+    return elapsed, inputs, items, peak_rss, growth
+
+
+def run_benchmarks(lines, ip_count, malformed_ratio, method_mix, seed, repeat=3):
+    """
+    生成合成日志并运行所有基准
+
+    Args:
+        lines: 日志行数
+        ip_count: 不同客户端IP的个数
+        malformed_ratio: 格式错误行的比例
+        method_mix: 请求方法到权重的字典
+        seed: 随机数种子
+        repeat: 每个基准重复次数，取最快的一次
+
+    Returns:
+        基准名称到结果字典的映射
+    """
+    temp_dir = tempfile.mkdtemp()
+    plain_file = os.path.join(temp_dir, 'access.log')
+    gzip_file = os.path.join(temp_dir, 'access.log.1.gz')
+    employee_file = os.path.join(temp_dir, 'employees.pkl')
+
+    print(f"正在生成 {lines} 行合成日志...")
+    ips = generate_log(plain_file, lines, ip_count, method_mix, malformed_ratio, seed=seed)
+    generate_log(gzip_file, lines, ip_count, method_mix, malformed_ratio, compress=True, seed=seed)
+    # 一半IP登记为员工
+    pd.DataFrame([
+        {'工号': i, '姓名': f'员工{i}', 'IP': ip} for i, ip in enumerate(ips[::2])
+    ]).to_pickle(employee_file)
+
+    benchmarks = [
+        ('parse_nginx_log', plain_file),
+        ('parse_nginx_log[gzip]', gzip_file),
+        ('filter_by_time_range', plain_file),
+        ('count_access_by_employee', plain_file),
+    ]
+    # 解析的每秒MB数统一按未压缩日志的大小计算
+    size_mb = os.path.getsize(plain_file) / 1024 / 1024
+
+    results = {}
+    try:
+        for name, log_file in benchmarks:
+            runs = []
+            for _ in range(repeat):
+                # 每次都在新的子进程中运行，保证峰值RSS只反映本次基准
+                with ProcessPoolExecutor(max_workers=1) as executor:
+                    runs.append(executor.submit(_run_benchmark, name, log_file, employee_file, lines).result())
+            elapsed, inputs, items = min(runs)[:3]
+            results[name] = {
+                'seconds': round(elapsed, 4),
+                'inputs': inputs,
+                'items': items,
+                'records_per_sec': round(inputs / elapsed),
+                'peak_rss_mb': _max_rounded(run[3] for run in runs),
+                'stage_peak_rss_growth_mb': _max_rounded(run[4] for run in runs),
+            }
+            if name.startswith('parse_nginx_log'):
+                results[name]['mb_per_sec'] = round(size_mb / elapsed, 2)
+            print(f"- {name}: {results[name]['records_per_sec']} 条/秒, "
+                  f"峰值RSS {results[name]['peak_rss_mb']} MB"
+                  f"（其中计时阶段增加 {results[name]['stage_peak_rss_growth_mb']} MB）")
+    finally:
+        for path in (plain_file, gzip_file, employee_file):
+            os.unlink(path)
+        os.rmdir(temp_dir)
+
+    return results
+
+
+def _max_rounded(values):
+    """返回各次运行中的最大值（保留1位小数），无法测量时返回None"""
+    values = [value for value in values if value is not None]
+    return round(max(values), 1) if values else None
+
+
+def compare_with_baseline(results, baseline):
+    """
+    打印当前结果与基准结果的对比
+
+    Args:
+        results: 当前的基准结果
+        baseline: 保存的基准结果
+    """
+    print("与基准结果对比（吞吐量比值大于1表示更快，峰值RSS比值小于1表示更省内存）:")
+    for name, current in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if previous is None or 'records_per_sec' not in previous:
+            print(f"- {name}: 基准中没有该项")
+            continue
+        speedup = current['records_per_sec'] / previous['records_per_sec']
+        if current.get('peak_rss_mb') and previous.get('peak_rss_mb'):
+            rss_text = f"峰值RSS x{current['peak_rss_mb'] / previous['peak_rss_mb']:.2f}"
+        else:
+            rss_text = "峰值RSS 无法比较"
+        print(f"- {name}: 吞吐量 x{speedup:.2f}, {rss_text}")
+
+
+def parse_arguments():
+    """解析命令行参数。"""
+    parser = argparse.ArgumentParser(description='nginx日志分析工具的性能基准')
+
+    parser.add_argument('--lines', type=int, default=200000,
+                        help='合成日志的行数（默认为200000）')
+    parser.add_argument('--ips', type=int, default=1000,
+                        help='不同客户端IP的个数（默认为1000）')
+    parser.add_argument('--malformed-ratio', type=float, default=0.01,
+                        help='格式错误行的比例（默认为0.01）')
+    parser.add_argument('--post-ratio', type=float, default=DEFAULT_METHOD_MIX['POST'],
+                        help=f"POST请求的比例，其余按默认比例分配给其他方法（默认为{DEFAULT_METHOD_MIX['POST']}）")
+    parser.add_argument('--seed', type=int, default=42,
+                        help='随机数种子（默认为42）')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='每个基准的重复次数，取最快的一次（默认为3）')
+    parser.add_argument('--baseline', type=str, default=None,
+                        help='与该基准结果文件对比')
+    parser.add_argument('--save-baseline', type=str, default=None,
+                        help='将本次结果保存为基准结果文件')
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_arguments()
+
+    # 按 --post-ratio 调整请求方法比例，其余方法保持原有的相对比例
+    others = {method: weight for method, weight in DEFAULT_METHOD_MIX.items() if method != 'POST'}
+    scale = (1 - args.post_ratio) / sum(others.values())
+    method_mix = {'POST': args.post_ratio, **{method: weight * scale for method, weight in others.items()}}
+
+    results = run_benchmarks(args.lines, args.ips, args.malformed_ratio, method_mix, args.seed, args.repeat)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            compare_with_baseline(results, json.load(f))
+
+    if args.save_baseline:
+        report = {
+            'created_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'python': sys.version.split()[0],
+            'params': {
+                'lines': args.lines, 'ips': args.ips, 'malformed_ratio': args.malformed_ratio,
+                'post_ratio': args.post_ratio, 'seed': args.seed,
+            },
+            'results': results,
+        }
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"基准结果已保存到 {args.save_baseline}")
+
+
+if __name__ == "__main__":
+    main()